@@ -0,0 +1,73 @@
+"""
+adaptive_search.py
+
+Score-adaptive search depth.
+A cheap basic-depth search runs first; the query is escalated to advanced depth (and more
+results) only when the returned relevance scores fall below the configured thresholds.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class AdaptiveSearchPolicy:
+    """
+    Thresholds for escalating a basic search, plus counters for how often escalation happens
+    and how much latency the basic-only searches saved compared to always searching advanced.
+    """
+
+    def __init__(self, min_top_score: float = 0.6, min_mean_score: float = 0.4, min_results: int = 3,
+                 basic_max_results: int = 5, escalated_max_results: int = 8):
+        self.min_top_score = min_top_score
+        self.min_mean_score = min_mean_score
+        self.min_results = min_results
+        self.basic_max_results = basic_max_results
+        self.escalated_max_results = escalated_max_results
+        self.basic_only = 0
+        self.escalated = 0
+        self._basic_latencies: List[float] = []
+        self._advanced_latencies: List[float] = []
+        self._escalation_overhead = 0.0
+        self._lock = threading.Lock()
+
+    def should_escalate(self, sources: List[Dict[str, Any]]) -> bool:
+        """True when the basic results are too few or too weakly scored to trust."""
+        if len(sources) < self.min_results:
+            return True
+        scores = [float(s.get("score") or 0.0) for s in sources]
+        return max(scores) < self.min_top_score or sum(scores) / len(scores) < self.min_mean_score
+
+    def record(self, basic_latency: float, advanced_latency: Optional[float] = None) -> None:
+        """Record one adaptive search; advanced_latency is None when basic results were kept."""
+        with self._lock:
+            self._basic_latencies.append(basic_latency)
+            if advanced_latency is None:
+                self.basic_only += 1
+            else:
+                self.escalated += 1
+                self._advanced_latencies.append(advanced_latency)
+                self._escalation_overhead += basic_latency
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Escalation counts and an estimate of latency saved: every basic-only search is credited
+        with the mean observed advanced latency minus its own cost, and every escalation is
+        charged its wasted basic call. The estimate is None until an advanced search was seen.
+        """
+        with self._lock:
+            total = self.basic_only + self.escalated
+            mean_basic = sum(self._basic_latencies) / len(self._basic_latencies) if self._basic_latencies else None
+            mean_advanced = (sum(self._advanced_latencies) / len(self._advanced_latencies)
+                             if self._advanced_latencies else None)
+            saved = None
+            if mean_advanced is not None and mean_basic is not None:
+                saved = self.basic_only * (mean_advanced - mean_basic) - self._escalation_overhead
+            return {
+                "searches": total,
+                "basic_only": self.basic_only,
+                "escalated": self.escalated,
+                "escalation_rate": (self.escalated / total) if total else 0.0,
+                "mean_basic_latency": mean_basic,
+                "mean_advanced_latency": mean_advanced,
+                "estimated_latency_saved": saved,
+            }
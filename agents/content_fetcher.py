@@ -0,0 +1,267 @@
+"""
+content_fetcher.py
+
+Optional raw-content stage for search results.
+Downloads each result page with bounded per-domain concurrency and a response size cap,
+extracts the main text in a worker process pool and caches the extracted text by URL,
+so the writer can see real evidence instead of 200-character snippets.
+"""
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from http_transport import HTTPTransport, get_transport
+from search_cache import SearchCache
+from source_index import canonicalize_url
+from structured_logging import get_logger, log_event
+
+logger = get_logger("fetcher")
+
+
+class _MainTextExtractor(HTMLParser):
+    """
+    Collects text blocks from content elements (paragraphs, headings, list items, cells)
+    while skipping scripts, styles and page chrome such as navigation, headers and footers.
+    """
+
+    SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe", "button"}
+    BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "li", "td", "blockquote", "pre", "article", "section", "div", "br"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[str] = []
+        self._current: List[str] = []
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = re.sub(r"\s+", " ", "".join(self._current)).strip()
+        if text:
+            self.blocks.append(text)
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def extract_main_text(html: str, min_block_chars: int = 60, max_chars: int = 20000) -> str:
+    """
+    Return the main text of an HTML page: content blocks of at least `min_block_chars`
+    characters (short blocks are usually menus, buttons and captions), joined as paragraphs.
+    Module-level so it can run in a ProcessPoolExecutor.
+    """
+    parser = _MainTextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+    blocks = [b for b in parser.blocks if len(b) >= min_block_chars]
+    if not blocks:
+        blocks = parser.blocks
+    return "\n\n".join(blocks)[:max_chars]
+
+
+class ContentFetcher:
+    """
+    Fetches and extracts page text for search results.
+    Concurrency is bounded globally (max_workers) and per domain (per_domain), bodies are
+    streamed and cut off at max_bytes, and extracted text is cached by URL.
+    """
+
+    def __init__(self, http: Optional[HTTPTransport] = None, max_workers: int = 8, per_domain: int = 2,
+                 max_bytes: int = 1_500_000, timeout: float = 15, extract_workers: int = 2,
+                 cache: Optional[SearchCache] = None, use_cache: bool = True, use_processes: bool = True):
+        self.http = http if http is not None else get_transport()
+        self.max_workers = max(1, max_workers)
+        self.per_domain = max(1, per_domain)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.extract_workers = max(1, extract_workers)
+        self.use_processes = use_processes
+        self._owns_cache = cache is None and use_cache
+        self.cache = cache if cache is not None else (
+            SearchCache(path="content_cache.sqlite3", ttl_seconds=7 * 24 * 3600) if use_cache else None
+        )
+        self._domain_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._extractor: Optional[Executor] = None
+        self.counters = {"fetched": 0, "cached": 0, "failed": 0, "truncated": 0, "bytes": 0}
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        try:
+            domain = (urlsplit(url).hostname or "").lower()
+        except ValueError:
+            domain = ""  # unparseable URLs share one slot; the download itself will fail
+        with self._lock:
+            slot = self._domain_slots.get(domain)
+            if slot is None:
+                slot = self._domain_slots[domain] = threading.BoundedSemaphore(self.per_domain)
+            return slot
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _extract_pool(self) -> Executor:
+        with self._lock:
+            if self._extractor is None:
+                if self.use_processes:
+                    self._extractor = ProcessPoolExecutor(max_workers=self.extract_workers)
+                else:
+                    self._extractor = ThreadPoolExecutor(max_workers=self.extract_workers)
+            return self._extractor
+
+    def _download(self, url: str) -> Optional[str]:
+        """Stream the page body up to max_bytes; returns None for failures and non-text content."""
+        with self._slot(url):
+            try:
+                response = self.http.get(url, timeout=self.timeout, stream=True,
+                                         headers={"User-Agent": "OpenDeepResearcher/1.0"})
+            except (requests.RequestException, ValueError):  # ValueError: URL urlsplit cannot parse
+                return None
+            try:
+                if response.status_code != 200:
+                    return None
+                content_type = response.headers.get("Content-Type", "text/html").lower()
+                if "html" not in content_type and not content_type.startswith("text/"):
+                    return None
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(chunk_size=65536):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.max_bytes:
+                        self._count("truncated")
+                        break
+                self._count("bytes", size)
+                return self._decode(b"".join(chunks)[:self.max_bytes], content_type)
+            except requests.RequestException:
+                return None
+            finally:
+                response.close()
+
+    @staticmethod
+    def _decode(body: bytes, content_type: str) -> str:
+        """
+        Decode a page body with the charset its Content-Type declares, else UTF-8, else a
+        detected encoding. (requests assumes ISO-8859-1 for text/* without a charset, which
+        garbles most UTF-8 pages.)
+        """
+        declared = re.search(r"charset=[\"']?([\w.:-]+)", content_type)
+        if declared:
+            try:
+                return body.decode(declared.group(1), errors="replace")
+            except LookupError:
+                pass
+        try:
+            return body.decode("utf-8")
+        except UnicodeDecodeError:
+            detected = requests.compat.chardet.detect(body).get("encoding") if requests.compat.chardet else None
+            try:
+                return body.decode(detected or "utf-8", errors="replace")
+            except LookupError:
+                return body.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _cache_key(url: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Cache query and params for a URL. SearchCache lowercases the query, so the canonical
+        URL also goes into the params, which keep case-sensitive paths (/Page vs /page) apart.
+        """
+        canonical = canonicalize_url(url)
+        return canonical, {"kind": "content", "url": canonical}
+
+    def fetch_text(self, url: str) -> Optional[str]:
+        """Return extracted main text for a URL, using the cache when possible."""
+        key, params = self._cache_key(url)
+        if self.cache is not None:
+            cached = self.cache.get(key, params)
+            if cached is not None:
+                self._count("cached")
+                return cached[0].get("text", "") if cached else ""
+
+        body = self._download(url)
+        if body is None:
+            self._count("failed")
+            return None
+        if urlsplit(url).path.lower().endswith((".txt", ".md")):
+            text = body
+        else:
+            text = self._extract_pool().submit(extract_main_text, body).result()
+        self._count("fetched")
+        if self.cache is not None:
+            self.cache.put(key, [{"url": url, "text": text}], params)
+        return text
+
+    def enrich(self, search_results: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Add a `raw_content` field to every source whose page could be fetched.
+        Each distinct URL is fetched once even if several subquestions returned it.
+        """
+        start = time.perf_counter()
+        urls = []
+        for sources in search_results.values():
+            for source in sources:
+                url = source.get("url", "")
+                if url.startswith(("http://", "https://")) and not source.get("raw_content") and url not in urls:
+                    urls.append(url)
+        if not urls:
+            return search_results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            texts = dict(zip(urls, pool.map(self.fetch_text, urls)))
+
+        for sources in search_results.values():
+            for source in sources:
+                text = texts.get(source.get("url", ""))
+                if text:
+                    source["raw_content"] = text
+        log_event(logger, logging.INFO, "Fetched page content", pages=len(urls),
+                  retrieved=sum(1 for t in texts.values() if t),
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
+        return search_results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def close(self) -> None:
+        """Shut down the extraction pool and close the content cache if this fetcher opened it."""
+        with self._lock:
+            if self._extractor is not None:
+                self._extractor.shutdown()
+                self._extractor = None
+            if self._owns_cache and self.cache is not None:
+                self.cache.close()
+                self.cache = None
+
+    def __enter__(self) -> "ContentFetcher":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,145 @@
+"""
+context_packer.py
+
+Token-budget packing of research sources into writer prompts.
+Instead of a fixed number of sources per subquestion cut to a fixed length, ContextPacker
+estimates the tokens of the fixed prompt text and of every source block, then fills the
+budget greedily by relevance score while taking sources round-robin across subquestions,
+so no subquestion is starved. The packed result reports how the budget was spent.
+"""
+
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+CHARS_PER_TOKEN = 4.0  # rough average for English text with Qwen/Llama-style tokenizers
+
+
+def estimate_tokens(text: str, chars_per_token: float = CHARS_PER_TOKEN) -> int:
+    """Approximate token count; no tokenizer is needed, and it errs slightly high."""
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+class PackedContext:
+    """Sources chosen by ContextPacker.pack and how the token budget was used."""
+
+    def __init__(self, items: List[Dict[str, Any]], budget_tokens: int, overhead_tokens: int,
+                 candidates: int, per_qid: Dict[str, Dict[str, int]]):
+        self.items = items  # {"qid", "entry", "content", "block", "tokens", "truncated"} in prompt order
+        self.budget_tokens = budget_tokens
+        self.overhead_tokens = overhead_tokens
+        self.candidates = candidates
+        self.per_qid = per_qid
+
+    @property
+    def source_tokens(self) -> int:
+        return sum(item["tokens"] for item in self.items)
+
+    @property
+    def used_tokens(self) -> int:
+        return self.overhead_tokens + self.source_tokens
+
+    def text(self, separator: str = "\n\n") -> str:
+        return separator.join(item["block"] for item in self.items)
+
+    def report(self) -> Dict[str, Any]:
+        budget = max(1, self.budget_tokens)
+        return {
+            "budget_tokens": self.budget_tokens,
+            "overhead_tokens": self.overhead_tokens,
+            "source_tokens": self.source_tokens,
+            "free_tokens": max(0, self.budget_tokens - self.used_tokens),
+            "utilization": round(self.used_tokens / budget, 3),
+            "sources": len(self.items),
+            "truncated": sum(1 for item in self.items if item["truncated"]),
+            "dropped": self.candidates - len(self.items),
+            "per_subquestion": self.per_qid,
+        }
+
+
+class ContextPacker:
+    """
+    Greedy, fair packing of scored sources into a token budget.
+    Each round gives every subquestion (best remaining score first) its next-best source. A
+    source is capped at an equal share of the remaining budget for that round, between
+    `min_source_tokens` and `max_source_tokens`, so many subquestions still each get evidence.
+    A source that no longer fits is shortened to the remaining room if that leaves
+    `min_source_tokens` of content, otherwise packing stops for that subquestion.
+    """
+
+    def __init__(self, budget_tokens: int, max_source_tokens: int = 300, min_source_tokens: int = 40,
+                 chars_per_token: float = CHARS_PER_TOKEN):
+        self.budget_tokens = budget_tokens
+        self.max_source_tokens = max(1, max_source_tokens)
+        self.min_source_tokens = max(1, min_source_tokens)
+        self.chars_per_token = chars_per_token
+
+    def estimate(self, text: str) -> int:
+        return estimate_tokens(text, self.chars_per_token)
+
+    def pack(self, groups: Dict[str, List[Dict[str, Any]]], overhead: str = "",
+             render: Optional[Callable[[Dict[str, Any], str], str]] = None,
+             text_of: Optional[Callable[[Dict[str, Any]], str]] = None,
+             key_of: Optional[Callable[[Dict[str, Any]], Any]] = None,
+             shorten: Optional[Callable[[Dict[str, Any], str, int], str]] = None) -> PackedContext:
+        """
+        Pack `groups` (qid -> candidate entries with a "score") under the budget left after
+        the fixed `overhead` text (system prompt plus template).
+        `render(entry, content)` builds the prompt block for an entry, `text_of(entry)` gives
+        its source text (default: "content") and `key_of(entry)` identifies sources shared by
+        several subquestions so each is packed only once. `shorten(entry, text, max_chars)`
+        cuts a source down to size (default: keep the first characters).
+        """
+        render = render or (lambda entry, content: content)
+        text_of = text_of or (lambda entry: entry.get("content") or "")
+        key_of = key_of or id
+        shorten = shorten or (lambda entry, text, max_chars: text[:max(0, max_chars - 3)] + "...")
+        overhead_tokens = self.estimate(overhead)
+        remaining = self.budget_tokens - overhead_tokens
+
+        queues = {qid: sorted(entries, key=lambda e: e.get("score") or 0.0, reverse=True)
+                  for qid, entries in groups.items() if entries}
+        candidates = len({key_of(e) for entries in queues.values() for e in entries})
+        order = list(groups)
+        per_qid = {qid: {"sources": 0, "tokens": 0} for qid in order}
+        packed: Dict[str, List[Dict[str, Any]]] = {qid: [] for qid in order}
+        seen = set()
+
+        while queues and remaining > 0:
+            share = max(self.min_source_tokens, min(self.max_source_tokens, remaining // len(queues)))
+            # Subquestions whose next source scores highest pick first in each round
+            for qid in sorted(queues, key=lambda q: queues[q][0].get("score") or 0.0, reverse=True):
+                entries = queues[qid]
+                while entries and key_of(entries[0]) in seen:
+                    entries.pop(0)
+                if not entries:
+                    del queues[qid]
+                    continue
+                entry = entries.pop(0)
+                text = text_of(entry)
+                # Title/citation framing plus the separator between blocks count against the share too
+                framing = self.estimate(render(entry, "")) + 1
+                max_chars = int(max(self.min_source_tokens, share - framing) * self.chars_per_token)
+                content = shorten(entry, text, max_chars) if len(text) > max_chars else text
+                block = render(entry, content)
+                tokens = self.estimate(block) + 1
+                truncated = content != text
+                if tokens > remaining:
+                    room = remaining - framing
+                    if room < self.min_source_tokens:
+                        del queues[qid]  # budget nearly spent; smaller sources would be too thin to help
+                        continue
+                    content = shorten(entry, text, int(room * self.chars_per_token))
+                    block = render(entry, content)
+                    tokens = self.estimate(block) + 1
+                    truncated = True
+                seen.add(key_of(entry))
+                remaining -= tokens
+                packed[qid].append({"qid": qid, "entry": entry, "content": content, "block": block,
+                                    "tokens": tokens, "truncated": truncated})
+                per_qid[qid]["sources"] += 1
+                per_qid[qid]["tokens"] += tokens
+                if not entries:
+                    del queues[qid]
+
+        items = [item for qid in order for item in packed[qid]]
+        return PackedContext(items, self.budget_tokens, overhead_tokens, candidates, per_qid)
@@ -0,0 +1,185 @@
+"""
+extractive.py
+
+Local extractive compression of source text.
+Rather than keeping the first N characters of a snippet or page, each source is split into
+sentences and the sentences are scored against the subquestion with BM25, so only the most
+relevant ones go into the writer prompt. Scoring is vectorized with NumPy over every sentence
+of a whole batch of sources at once, so hundreds of sources take milliseconds and no LLM call.
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from query_dedup import STOP_WORDS
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])|\n{2,}|\n(?=\s*[-*•]\s)")
+_WORD = re.compile(r"[a-z0-9]+")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    """Split text into sentences (and paragraph/bullet breaks); fragments shorter than `min_chars` are merged into the next one."""
+    sentences, carry = [], ""
+    for part in _SENTENCE_END.split(text):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        part = f"{carry} {part}" if carry else part
+        if len(part) < min_chars:
+            carry = part
+            continue
+        sentences.append(part)
+        carry = ""
+    if carry:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {carry}"
+        else:
+            sentences.append(carry)
+    return sentences
+
+
+def _terms(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in STOP_WORDS and len(w) > 1]
+
+
+def score_sentences(docs: Sequence[Sequence[str]], queries: Sequence[str]) -> List[np.ndarray]:
+    """
+    BM25 score of every sentence of every document against that document's query.
+    IDF and average sentence length are computed over all sentences in the batch.
+    Returns one score array per document.
+    """
+    words: List[str] = []
+    counts: List[int] = []
+    owner: List[int] = []
+    for d, sentences in enumerate(docs):
+        for sentence in sentences:
+            found = _WORD.findall(sentence.lower())
+            words.extend(found)
+            counts.append(len(found))
+        owner.extend([d] * len(sentences))
+    n_sent = len(counts)
+    scores = np.zeros(n_sent)
+    if words:
+        vocab: Dict[str, int] = {w: i for i, w in enumerate(dict.fromkeys(words))}
+        term_ids = list(map(vocab.__getitem__, words))
+        # Stop words and single letters are masked out by term id rather than per word
+        n_terms = len(vocab)
+        useful = np.ones(n_terms, dtype=bool)
+        useful[[i for w, i in vocab.items() if w in STOP_WORDS or len(w) < 2]] = False
+        term_all = np.asarray(term_ids, dtype=np.int64)
+        sent_all = np.repeat(np.arange(n_sent), counts)
+        keep = useful[term_all]
+        sent_arr, term_arr = sent_all[keep], term_all[keep]
+
+        # Query terms as (document, term id) keys
+        query_keys = [d * n_terms + vocab[t] for d, query in enumerate(queries)
+                      for t in set(_terms(query)) if t in vocab]
+
+        if len(sent_arr) and query_keys:
+            # Term frequency per (sentence, term) pair
+            pairs, tf = np.unique(sent_arr * n_terms + term_arr, return_counts=True)
+            pair_sent, pair_term = pairs // n_terms, pairs % n_terms
+            df = np.bincount(pair_term, minlength=n_terms)
+            idf = np.log(1.0 + (n_sent - df + 0.5) / (df + 0.5))
+
+            # Keep only pairs whose term is in the query of the sentence's document
+            owner_arr = np.asarray(owner, dtype=np.int64)
+            matched = np.isin(owner_arr[pair_sent] * n_terms + pair_term, np.asarray(query_keys, dtype=np.int64))
+
+            lengths = np.bincount(sent_arr, minlength=n_sent).astype(np.float64)
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+            s, t, f = pair_sent[matched], pair_term[matched], tf[matched].astype(np.float64)
+            contrib = idf[t] * f * (BM25_K1 + 1.0) / (f + norm[s])
+            scores = np.bincount(s, weights=contrib, minlength=n_sent)
+
+    bounds = np.cumsum([0] + [len(sentences) for sentences in docs])
+    return [scores[bounds[d]:bounds[d + 1]] for d in range(len(docs))]
+
+
+def rank_many(texts: Sequence[str], queries: Sequence[str]) -> List[List[str]]:
+    """
+    Sentences of each text ordered by BM25 relevance to its query, best first. Sentences
+    sharing no term with the query are dropped when at least one sentence matches; if none
+    does, the text's sentences are kept in their original order. Ties favour earlier
+    sentences, which usually carry the context.
+    """
+    docs = [split_sentences(text) for text in texts]
+    ranked = []
+    for sentences, scores in zip(docs, score_sentences(docs, queries)):
+        if not sentences:
+            ranked.append([])
+            continue
+        # Small position prior breaks ties in favour of the lead
+        order = np.argsort(-(scores + 1e-3 / (1.0 + np.arange(len(sentences)))), kind="stable")
+        if scores.max() > 0:
+            order = order[scores[order] > 0]
+        ranked.append([sentences[j] for j in order.tolist()])
+    return ranked
+
+
+def take(sentences: Sequence[str], max_chars: int) -> str:
+    """Join ranked sentences, skipping any that would exceed `max_chars` (the best one is cut if nothing fits)."""
+    picked, used = [], 0
+    for sentence in sentences:
+        if used + len(sentence) + 1 > max_chars:
+            continue
+        picked.append(sentence)
+        used += len(sentence) + 1
+    if not picked and sentences:
+        return sentences[0][:max(0, max_chars - 3)] + "..."
+    return " ".join(picked)
+
+
+def compress_many(items: Sequence[Tuple[str, str]], max_chars: Union[int, Sequence[int]]) -> List[str]:
+    """
+    Compress each (text, query) pair to at most `max_chars` characters (one limit, or one per
+    item) by keeping its most relevant sentences, best first. Texts already within the limit
+    are returned unchanged.
+    """
+    limits = [max_chars] * len(items) if isinstance(max_chars, int) else list(max_chars)
+    todo = [i for i, (text, _) in enumerate(items) if len(text) > limits[i]]
+    results = [text for text, _ in items]
+    ranked = rank_many([items[i][0] for i in todo], [items[i][1] for i in todo])
+    for i, sentences in zip(todo, ranked):
+        results[i] = take(sentences, limits[i]) if sentences else items[i][0][:limits[i]]
+    return results
+
+
+def compress(text: str, query: str, max_chars: int) -> str:
+    """Single-source convenience wrapper around compress_many."""
+    return compress_many([(text, query)], max_chars)[0]
+
+
+def _benchmark(sources: int = 300, sentences: int = 6, repeat: int = 5, seed: Optional[int] = 7) -> None:
+    """Time compress_many on synthetic sources (6 sentences is about one search snippet, 25 a short page)."""
+    import random
+    import time
+
+    rng = random.Random(seed)
+    words = ("model diagnostic hospital accuracy patient imaging clinical trial data bias deployment "
+             "regulation cost outcome sensitivity specificity workflow radiology screening evaluation").split()
+    items = []
+    for _ in range(sources):
+        body = " ".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(8, 25))).capitalize() + "."
+            for _ in range(sentences)
+        )
+        items.append((body, " ".join(rng.sample(words, 4))))
+    chars = sum(len(text) for text, _ in items)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compress_many(items, 600)
+        best = min(best, time.perf_counter() - start)
+    print(f"{sources} sources, {sources * sentences} sentences, {chars / 1e6:.1f} MB: "
+          f"{best * 1000:.1f} ms (best of {repeat})")
+
+
+if __name__ == "__main__":
+    _benchmark()
+    _benchmark(sentences=25)
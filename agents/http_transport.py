@@ -0,0 +1,149 @@
+"""
+http_transport.py
+
+Shared HTTP transport for all agents.
+Keeps one pooled keep-alive requests.Session per host so repeated calls to LM Studio
+and Tavily reuse TCP/TLS connections instead of paying a new handshake every time.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPTransport:
+    """
+    Pooled HTTP transport with one session per host, configurable pool sizes,
+    per-host default timeouts and connection reuse statistics.
+    """
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 16,
+                 timeouts: Optional[Dict[str, float]] = None, default_timeout: float = 60):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        # Default timeout per host ("host" or "host:port"); an explicit timeout argument wins
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self._sessions: Dict[str, requests.Session] = {}
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _session_for(self, url: str) -> requests.Session:
+        key = self._host_key(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[key] = session
+                self._adapters[key] = adapter
+            return session
+
+    def _timeout_for(self, url: str) -> float:
+        parts = urlsplit(url)
+        if parts.netloc in self.timeouts:
+            return self.timeouts[parts.netloc]
+        if parts.hostname in self.timeouts:
+            return self.timeouts[parts.hostname]
+        return self.default_timeout
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs: Any) -> requests.Response:
+        """
+        Send a request through the pooled session for the URL's host.
+        Accepts the same keyword arguments as requests.Session.request.
+        """
+        if timeout is None:
+            timeout = self._timeout_for(url)
+        return self._session_for(url).request(method, url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Return per-host connection statistics from the underlying urllib3 pools.
+        `reused` is the number of requests that did not need a new connection.
+        """
+        with self._lock:
+            adapters = dict(self._adapters)
+        report = {}
+        for host, adapter in adapters.items():
+            requests_sent = 0
+            connections = 0
+            pools = adapter.poolmanager.pools
+            for pool_key in list(pools.keys()):
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                requests_sent += getattr(pool, "num_requests", 0)
+                connections += getattr(pool, "num_connections", 0)
+            report[host] = {
+                "requests": requests_sent,
+                "connections_opened": connections,
+                "reused": max(0, requests_sent - connections),
+            }
+        return report
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._adapters.clear()
+
+
+def lm_studio_chat_url() -> str:
+    """
+    Chat completions URL for LM Studio; ODR_LM_STUDIO_URL overrides the default server
+    (e.g. to point the agents at stub_servers.py).
+    """
+    base = os.environ.get("ODR_LM_STUDIO_URL", "http://127.0.0.1:1234").rstrip("/")
+    if base.endswith("/chat/completions"):
+        return base
+    return base + "/v1/chat/completions"
+
+
+def tavily_search_url() -> str:
+    """Tavily search URL; ODR_TAVILY_URL overrides it (e.g. for the local stub)."""
+    return os.environ.get("ODR_TAVILY_URL", "https://api.tavily.com/search")
+
+
+_shared_transport: Optional[HTTPTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """
+    Return the process-wide transport shared by PlannerAgent, SearcherAgent and WriterAgent.
+    """
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HTTPTransport(timeouts={"api.tavily.com": 30, "127.0.0.1:1234": 600})
+        return _shared_transport
+
+
+def configure_transport(**kwargs: Any) -> HTTPTransport:
+    """
+    Replace the shared transport with one built from the given HTTPTransport arguments.
+    """
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is not None:
+            _shared_transport.close()
+        _shared_transport = HTTPTransport(**kwargs)
+        return _shared_transport
@@ -0,0 +1,155 @@
+"""
+json_repair.py
+
+Local repair for almost-JSON model output.
+Small local models often wrap JSON in markdown fences, add trailing commas, use Python
+literals or smart quotes, or stop mid-array when they hit max_tokens. Instead of discarding
+the completion, `repair_json` fixes those mistakes in a single pass and `recover_objects`
+salvages every complete object from a truncated array.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from streaming import IncrementalArrayParser
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _strip_wrapping(text: str) -> str:
+    """Drop markdown fences and any chatter before the first bracket/brace."""
+    fenced = _FENCE.search(text)
+    if fenced and fenced.group(1).strip():
+        text = fenced.group(1)
+    starts = [i for i in (text.find("["), text.find("{")) if i != -1]
+    return text[min(starts):] if starts else text
+
+
+def _normalize(text: str, close_truncated: bool = False) -> Optional[str]:
+    """
+    One pass over the text outside strings: removes trailing commas, converts single-quoted
+    strings, bare keys and Python literals. Text cut off mid-value returns None unless
+    `close_truncated` is set, in which case open strings and brackets are closed.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None  # delimiter of the string we are inside, if any
+    escape = False
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if quote is not None:
+            if escape:
+                escape = False
+                if ch == "'":
+                    out[-1] = ch  # \' is not a JSON escape
+                else:
+                    out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':  # double quote inside a single-quoted string
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+            out.append(ch)
+        elif ch in "]}":
+            # Drop a trailing comma before the closer
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k] in " \t":
+                k += 1
+            if k < n and text[k] == ":":
+                out.append(f'"{word}"')  # bare object key
+            else:
+                out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if (quote is not None or stack) and not close_truncated:
+        return None
+    if quote is not None:
+        if escape:
+            out.pop()
+        out.append('"')
+    # Close whatever truncation left open, dropping a dangling comma or key first
+    tail = "".join(out).rstrip()
+    tail = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", tail) if stack else tail
+    return tail + "".join(reversed(stack))
+
+
+def repair_json(text: str, close_truncated: bool = False) -> Optional[Any]:
+    """
+    Parse `text` as JSON, repairing common model mistakes; None if it still cannot be parsed.
+    Truncated output is rejected unless `close_truncated` is set (the last element would be
+    cut short); use recover_objects to keep only the complete elements instead.
+    """
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    # Smart quotes are only turned into ASCII quotes if the text fails to parse with them
+    # as-is, since valid string contents may use them ("What is the “impact” of AI?")
+    for source in (text, text.translate(_SMART_QUOTES)):
+        candidate = _strip_wrapping(source).strip()
+        for attempt in (candidate, _normalize(candidate, close_truncated)):
+            if attempt is None:
+                continue
+            try:
+                return json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def recover_objects(text: str) -> List[Dict[str, Any]]:
+    """
+    Return every complete object from a (possibly truncated or malformed) JSON array.
+    Objects that fail strict parsing are retried through repair_json.
+    """
+    objects = RepairingArrayParser().feed(_strip_wrapping(text))
+    if objects:
+        return objects
+    # Smart quotes used as delimiters hide the string boundaries from the parser
+    return RepairingArrayParser().feed(_strip_wrapping(text.translate(_SMART_QUOTES)))
+
+
+class RepairingArrayParser(IncrementalArrayParser):
+    """IncrementalArrayParser that runs repair_json on elements strict parsing rejects."""
+
+    @staticmethod
+    def _parse(text: str) -> Optional[Dict[str, Any]]:
+        value = repair_json(text)
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,295 @@
+"""
+local_search.py
+
+Offline search backend: indexes a directory of text, markdown and HTML documents into an
+on-disk inverted index (SQLite) and answers queries with BM25 scoring.
+Used for air-gapped deployments and to search without spending Tavily quota.
+
+Usage:
+    python local_search.py build <corpus_dir> [index_path]
+    python local_search.py query <index_path> "<question>"
+"""
+
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from search_backends import SearchBackend, SearchBackendError
+
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".markdown", ".html", ".htm"}
+
+STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'from', 'is', 'are', 'was', 'were', 'be', 'been',
+    'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'can', 'what', 'which',
+    'who', 'when', 'where', 'why', 'how', 'this', 'that', 'these', 'those',
+    'it', 'its', 'as', 'not', 'no', 'so', 'if', 'than', 'then', 'there', 'their'
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stop words and single characters removed."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOP_WORDS]
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Collects visible text and the <title> from an HTML document."""
+
+    SKIP_TAGS = {"script", "style", "noscript", "head", "nav", "footer", "svg"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> Tuple[str, str]:
+    """Return (title, visible text) for an HTML document."""
+    parser = _HTMLTextExtractor()
+    parser.feed(html)
+    parser.close()
+    text = re.sub(r"\s+", " ", " ".join(parser.parts)).strip()
+    return parser.title.strip(), text
+
+
+def read_document(path: Path) -> Tuple[str, str]:
+    """Read a corpus file and return (title, text)."""
+    raw = path.read_text(encoding="utf-8", errors="ignore")
+    if path.suffix.lower() in (".html", ".htm"):
+        title, text = html_to_text(raw)
+        return title or path.stem, text
+
+    title = ""
+    for line in raw.splitlines():
+        line = line.strip()
+        if line:
+            title = line.lstrip("#").strip()
+            break
+    return title[:200] or path.stem, re.sub(r"\s+", " ", raw).strip()
+
+
+def iter_corpus(corpus_dir: str) -> Iterator[Path]:
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            path = Path(root) / name
+            if path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                yield path
+
+
+def build_index(corpus_dir: str, index_path: str = "local_index.sqlite3") -> Dict[str, Any]:
+    """
+    Index every supported document under corpus_dir into a fresh on-disk inverted index.
+    Postings are stored per term as a packed array of (doc_id, term_frequency) pairs.
+    """
+    start = time.perf_counter()
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    conn = sqlite3.connect(index_path)
+    conn.execute("CREATE TABLE docs (id INTEGER PRIMARY KEY, url TEXT, title TEXT, length INTEGER, body BLOB)")
+    conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, df INTEGER, postings BLOB)")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    postings: Dict[str, array] = {}
+    total_length = 0
+    doc_id = 0
+    batch = []
+    for path in iter_corpus(corpus_dir):
+        title, text = read_document(path)
+        tokens = tokenize(title + " " + text)
+        if not tokens:
+            continue
+        doc_id += 1
+        total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            plist = postings.get(term)
+            if plist is None:
+                plist = postings[term] = array("I")
+            plist.append(doc_id)
+            plist.append(tf)
+        batch.append((doc_id, path.resolve().as_uri(), title, len(tokens), zlib.compress(text.encode("utf-8"))))
+        if len(batch) >= 1000:
+            conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", batch)
+
+    conn.executemany(
+        "INSERT INTO terms VALUES (?, ?, ?)",
+        ((term, len(plist) // 2, np.asarray(plist, dtype=np.uint32).tobytes()) for term, plist in postings.items()),
+    )
+    avgdl = total_length / doc_id if doc_id else 0.0
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [("doc_count", str(doc_id)), ("avgdl", str(avgdl))])
+    conn.commit()
+    conn.close()
+    return {"documents": doc_id, "terms": len(postings), "seconds": time.perf_counter() - start}
+
+
+class LocalBM25Backend(SearchBackend):
+    """
+    BM25 search over an index built by build_index().
+    Document lengths are held in memory as a NumPy array and decoded postings are kept in a
+    small LRU, so a query touches SQLite only for terms it has not seen recently and scoring
+    is a handful of vectorized array operations even for very common terms.
+    """
+
+    name = "local-bm25"
+
+    def __init__(self, index_path: str = "local_index.sqlite3", k1: float = 1.2, b: float = 0.75,
+                 postings_cache_size: int = 2048, snippet_chars: int = 400):
+        if not os.path.exists(index_path):
+            raise SearchBackendError(f"Local index not found: {index_path} (run 'python local_search.py build')")
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self.snippet_chars = snippet_chars
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self.doc_count = int(meta.get("doc_count", 0))
+        self.avgdl = float(meta.get("avgdl", 0.0)) or 1.0
+        self._lengths = np.zeros(self.doc_count + 1, dtype=np.float32)
+        for doc_id, length in self._conn.execute("SELECT id, length FROM docs"):
+            self._lengths[doc_id] = length
+        self._postings: "OrderedDict[str, Optional[Tuple[float, np.ndarray, np.ndarray]]]" = OrderedDict()
+        self._postings_cache_size = postings_cache_size
+        self.queries = 0
+
+    def _term(self, term: str) -> Optional[Tuple[float, np.ndarray, np.ndarray]]:
+        """Return (idf, doc_ids, term_frequencies) for a term, or None if it is not in the index."""
+        with self._lock:
+            if term in self._postings:
+                self._postings.move_to_end(term)
+                return self._postings[term]
+            row = self._conn.execute("SELECT df, postings FROM terms WHERE term = ?", (term,)).fetchone()
+            entry = None
+            if row is not None:
+                df, blob = row
+                pairs = np.frombuffer(blob, dtype=np.uint32).reshape(-1, 2)
+                idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+                entry = (idf, pairs[:, 0].astype(np.intp), pairs[:, 1].astype(np.float32))
+            self._postings[term] = entry
+            if len(self._postings) > self._postings_cache_size:
+                self._postings.popitem(last=False)
+            return entry
+
+    def score(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return the top_k (doc_id, bm25_score) pairs for the query."""
+        if top_k <= 0:
+            return []
+        scores = np.zeros(self.doc_count + 1, dtype=np.float32)
+        matched = False
+        norm = self.k1 * (1 - self.b)
+        slope = self.k1 * self.b / self.avgdl
+        for term, qtf in Counter(tokenize(query)).items():
+            entry = self._term(term)
+            if entry is None:
+                continue
+            idf, doc_ids, tfs = entry
+            # Each doc appears once per term, so a fancy-indexed += is safe here
+            scores[doc_ids] += (idf * qtf * (self.k1 + 1)) * tfs / (tfs + norm + slope * self._lengths[doc_ids])
+            matched = True
+        if not matched:
+            return []
+        # Argpartition over the dense score vector is cheaper than de-duplicating candidate ids
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(scores, -top_k)[-top_k:]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in best if scores[doc_id] > 0]
+
+    def _snippet(self, text: str, query_terms: List[str]) -> str:
+        """Return a window of the document around the first query term it contains."""
+        lowered = text.lower()
+        positions = [p for p in (lowered.find(t) for t in query_terms) if p >= 0]
+        start = max(0, min(positions) - self.snippet_chars // 4) if positions else 0
+        snippet = text[start:start + self.snippet_chars].strip()
+        return ("..." if start else "") + snippet
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5,
+               include_domains: Optional[List[str]] = None,
+               exclude_domains: Optional[List[str]] = None,
+               include_raw_content: bool = False) -> List[Dict[str, Any]]:
+        self.queries += 1
+        ranked = self.score(query, max_results)
+        if not ranked:
+            return []
+        terms = tokenize(query)
+        placeholders = ",".join("?" for _ in ranked)
+        with self._lock:
+            rows = {
+                row[0]: row[1:]
+                for row in self._conn.execute(
+                    f"SELECT id, url, title, body FROM docs WHERE id IN ({placeholders})",
+                    [doc_id for doc_id, _ in ranked],
+                )
+            }
+        sources = []
+        for doc_id, bm25 in ranked:
+            url, title, body = rows[doc_id]
+            text = zlib.decompress(body).decode("utf-8")
+            source = {
+                "title": title,
+                "url": url,
+                "content": self._snippet(text, terms),
+                # Squash the unbounded BM25 score into 0-1 so it is comparable to Tavily scores
+                "score": round(bm25 / (bm25 + 5.0), 4),
+            }
+            if include_raw_content:
+                source["raw_content"] = text
+            sources.append(source)
+        return sources
+
+    def stats(self) -> Dict[str, Any]:
+        return {"documents": self.doc_count, "queries": self.queries, "cached_terms": len(self._postings)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "build":
+        target = sys.argv[3] if len(sys.argv) > 3 else "local_index.sqlite3"
+        info = build_index(sys.argv[2], target)
+        print(f"[local-search] Indexed {info['documents']} documents ({info['terms']} terms) "
+              f"into {target} in {info['seconds']:.1f}s")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "query":
+        backend = LocalBM25Backend(sys.argv[2])
+        start = time.perf_counter()
+        results = backend.search(" ".join(sys.argv[3:]))
+        elapsed = (time.perf_counter() - start) * 1000
+        for i, source in enumerate(results, 1):
+            print(f"{i}. [{source['score']}] {source['title']}\n   {source['url']}\n   {source['content'][:200]}")
+        print(f"[local-search] {len(results)} results in {elapsed:.1f} ms")
+    else:
+        print(__doc__)
@@ -0,0 +1,111 @@
+"""
+plan_cache.py
+
+Two-tier cache for planner subquestions.
+A small in-memory LRU sits in front of a persistent SQLite tier (a SearchCache table), so
+re-planning a topic seen earlier in the process costs a dict lookup and a topic planned in an
+earlier session costs one indexed read instead of a full LM Studio completion.
+Entries are keyed by the normalized prompt, the model name and the planner version.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from search_cache import SearchCache
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation ("...?" vs "...")."""
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip(" ?.!")
+
+
+class PlanCache:
+    """
+    Memory LRU (memory_size entries) backed by a persistent SQLite tier with TTL and its own
+    LRU bound. Thread-safe; counters report which tier served each hit.
+    """
+
+    def __init__(self, path: Optional[str] = "plan_cache.sqlite3", memory_size: int = 128,
+                 ttl_seconds: Optional[float] = 30 * 24 * 3600, max_entries: int = 2000):
+        self.memory_size = max(0, memory_size)
+        self.store = SearchCache(path=path, ttl_seconds=ttl_seconds, max_entries=max_entries) if path else None
+        self._memory: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str, planner_version: str) -> str:
+        return SearchCache.make_key(normalize_prompt(prompt), {"model": model_name, "planner_version": planner_version})
+
+    @staticmethod
+    def _params(model_name: str, planner_version: str) -> Dict[str, Any]:
+        return {"kind": "plan", "model": model_name, "planner_version": planner_version}
+
+    def _remember(self, key: str, subquestions: List[Dict[str, Any]]) -> None:
+        if not self.memory_size:
+            return
+        with self._lock:
+            self._memory[key] = subquestions
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, prompt: str, model_name: str, planner_version: str) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the cached subquestions, or None on a miss in both tiers."""
+        key = self.make_key(prompt, model_name, planner_version)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return [dict(sq) for sq in cached]
+
+        cached = self.store.get(normalize_prompt(prompt), self._params(model_name, planner_version)) if self.store else None
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, cached)
+        return [dict(sq) for sq in cached]
+
+    def put(self, prompt: str, model_name: str, planner_version: str, subquestions: List[Dict[str, Any]]) -> None:
+        key = self.make_key(prompt, model_name, planner_version)
+        stored = [dict(sq) for sq in subquestions]
+        self._remember(key, stored)
+        if self.store is not None:
+            self.store.put(normalize_prompt(prompt), stored, self._params(model_name, planner_version))
+
+    def invalidate(self, prompt: str, model_name: str, planner_version: str) -> None:
+        """Drop the memory entry for a prompt; the next put() overwrites the persistent one."""
+        with self._lock:
+            self._memory.pop(self.make_key(prompt, model_name, planner_version), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            stats = {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+        if self.store is not None:
+            stats["disk_entries"] = self.store.stats()["entries"]
+        return stats
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,280 @@
+"""
+plan_executor.py
+
+Runs a planner JSON's `plan` as a dependency graph.
+Each step provides one key: a search step provides its subquestion id, the synthesize step
+provides "synthesis" and the validate step provides "validation". A step starts as soon as
+every key in its `depends_on` has been provided, so independent searches run in parallel
+and synthesis starts the moment the last search it needs finishes. Every step is timed.
+With `stream_report`, the report text is also yielded chunk by chunk while it is written.
+"""
+
+import contextvars
+import logging
+import queue
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from query_dedup import group_near_duplicates
+from structured_logging import get_logger, iter_in_run, log_event
+
+logger = get_logger("executor")
+
+PROVIDES = {"synthesize": "synthesis", "validate": "validation"}
+
+
+def step_provides(step: Dict[str, Any]) -> str:
+    """The key a step makes available to its dependents."""
+    if step.get("action") == "search":
+        return (step.get("depends_on") or [f"step{step.get('step')}"])[0]
+    return PROVIDES.get(step.get("action"), f"step{step.get('step')}")
+
+
+def step_requires(step: Dict[str, Any]) -> List[str]:
+    """Keys a step waits for; a search step's depends_on names its own subquestion, not a dependency."""
+    if step.get("action") == "search":
+        return []
+    return list(step.get("depends_on") or [])
+
+
+def validate_report(report: str, search_results: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Cheap post-synthesis checks: which [S<n>] citations the report body uses, whether each one
+    appears in its reference list, and which subquestions ended up without any sources.
+    """
+    body, _, references = report.partition("References:")
+    cited = sorted(set(re.findall(r"\[S\d+\]", body)), key=lambda c: int(c[2:-1]))
+    listed = set(re.findall(r"\[S\d+\]", references))
+    unsupported = [qid for qid, sources in search_results.items() if not sources]
+    return {
+        "citations_used": len(cited),
+        "unknown_citations": [c for c in cited if listed and c not in listed],
+        "subquestions_without_sources": unsupported,
+        "sources": sum(len(s) for s in search_results.values()),
+        "ok": bool(cited) and not unsupported,
+    }
+
+
+class PlanExecutor:
+    """
+    Schedules the steps of a plan on a thread pool. Built-in handlers cover the planner's
+    actions (search, synthesize, validate); pass `handlers` to override or add actions.
+    """
+
+    def __init__(self, searcher: Any, writer: Any, max_workers: int = 4,
+                 handlers: Optional[Dict[str, Callable[[Dict[str, Any], "ExecutionState"], Any]]] = None):
+        self.searcher = searcher
+        self.writer = writer
+        self.max_workers = max(1, max_workers)
+        self.handlers = {
+            "search": self._run_search,
+            "synthesize": self._run_synthesize,
+            "validate": self._run_validate,
+        }
+        self.handlers.update(handlers or {})
+
+    # --- step handlers -----------------------------------------------------
+
+    def _run_search(self, step: Dict[str, Any], state: "ExecutionState") -> List[Dict[str, Any]]:
+        qid = step_provides(step)
+        if qid in state.aliases:
+            # Near-duplicate of another subquestion: share that step's results
+            return list(state.outputs[state.aliases[qid]])
+        subq = state.subquestions.get(qid, {})
+        sources = self.searcher.search_subquestion(subq.get("text") or step.get("query_template", ""))
+        fetcher = getattr(self.searcher, "fetcher", None)
+        if fetcher is not None:
+            fetcher.enrich({qid: sources})
+        return sources
+
+    def _run_synthesize(self, step: Dict[str, Any], state: "ExecutionState") -> str:
+        args = (state.plan.get("original_prompt", ""), state.plan.get("subquestions", []), state.search_results())
+        if not hasattr(self.writer, "stream_report"):
+            return self.writer.synthesize_report(*args)
+        chunks = []
+        for chunk in self.writer.stream_report(*args):
+            chunks.append(chunk)
+            state.report_chunks.put(chunk)
+        return "".join(chunks)
+
+    def _run_validate(self, step: Dict[str, Any], state: "ExecutionState") -> Dict[str, Any]:
+        return validate_report(state.outputs.get("synthesis") or "", state.search_results())
+
+    # --- scheduling ----------------------------------------------------------
+
+    def iter_run(self, plan_result: Dict[str, Any],
+                 search_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                 stream_report: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Execute the plan and yield a timing record per step as it finishes:
+        {step, action, provides, status, start_ms, duration_ms}. Search steps whose results
+        are already in `search_results` complete immediately with status "reused".
+        With `stream_report`, report text is also yielded while the synthesize step runs, as
+        {action: "synthesize", provides: "synthesis", status: "streaming", chunk} events
+        (these are not step records and do not appear in the timings).
+        The outputs are available afterwards as self.last_state. Log records emitted while it
+        runs carry the plan's question_id as their run ID.
+        """
+        return iter_in_run(self._iter_run(plan_result, search_results, stream_report), plan_result.get("question_id"))
+
+    def _iter_run(self, plan_result: Dict[str, Any], search_results: Optional[Dict[str, List[Dict[str, Any]]]],
+                  stream_report: bool) -> Iterator[Dict[str, Any]]:
+        state = ExecutionState(plan_result)
+        self.last_state = state
+        steps = {step_provides(s): s for s in plan_result.get("plan", [])}
+        _check_graph(steps)
+        waiting = dict(steps)
+        state.aliases = self._near_duplicates(steps, state)
+
+        for key, sources in (search_results or {}).items():
+            step = waiting.get(key)
+            if step is not None and step.get("action") == "search":
+                del waiting[key]
+                state.outputs[key] = sources
+                yield state.record(step, key, "reused", 0.0, 0.0)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+
+            def launch_ready() -> List[Dict[str, Any]]:
+                skipped = []
+                for key, step in list(waiting.items()):
+                    requires = step_requires(step) + ([state.aliases[key]] if key in state.aliases else [])
+                    if any(dep in state.failed for dep in requires):
+                        del waiting[key]
+                        state.failed.add(key)
+                        skipped.append(state.record(step, key, "skipped", state.elapsed_ms(), 0.0))
+                        continue
+                    if all(dep in state.outputs for dep in requires):
+                        del waiting[key]
+                        handler = self.handlers.get(step.get("action"))
+                        # Steps run in a copy of this context so their log records keep the run ID
+                        running[pool.submit(contextvars.copy_context().run, self._timed_call, handler, step, state)] = (key, step)
+                return skipped
+
+            yield from launch_ready()
+            while running:
+                done, _ = wait(running, timeout=0.05 if stream_report else None, return_when=FIRST_COMPLETED)
+                if stream_report:
+                    yield from state.drain_report_chunks()
+                for future in done:
+                    key, step = running.pop(future)
+                    start_ms, duration_ms, output, error = future.result()
+                    if error is None:
+                        state.outputs[key] = output
+                        record = state.record(step, key, "done", start_ms, duration_ms)
+                    else:
+                        state.failed.add(key)
+                        record = state.record(step, key, "failed", start_ms, duration_ms, error)
+                        log_event(logger, logging.WARNING, "Plan step failed", step=step.get("step"),
+                                  action=step.get("action"), error=error)
+                    log_event(logger, logging.INFO, "Plan step finished", step=step.get("step"),
+                              action=step.get("action"), provides=key, status=record["status"],
+                              duration_ms=duration_ms)
+                    yield record
+                yield from launch_ready()
+            # Anything still waiting depends on a failed step
+            for key, step in waiting.items():
+                yield state.record(step, key, "skipped", state.elapsed_ms(), 0.0)
+
+        log_event(logger, logging.INFO, "Plan executed", steps=len(steps), failed=len(state.failed),
+                  duration_ms=state.elapsed_ms())
+
+    def _near_duplicates(self, steps: Dict[str, Dict[str, Any]], state: "ExecutionState") -> Dict[str, str]:
+        """Map each near-duplicate search step's key to the representative it should wait for."""
+        threshold = getattr(self.searcher, "dedupe_threshold", None)
+        items = [(key, state.subquestions.get(key, {}).get("text", "")) for key, step in steps.items()
+                 if step.get("action") == "search"]
+        if threshold is None or len(items) < 2:
+            return {}
+        priorities = {key: state.subquestions.get(key, {}).get("priority") for key, _ in items}
+        dedup = group_near_duplicates(items, threshold, priorities)
+        return {qid: rep for rep, members in dedup.groups.items() for qid in members if qid != rep}
+
+    def run(self, plan_result: Dict[str, Any],
+            search_results: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Dict[str, Any]:
+        """
+        Execute the plan to completion. Returns search_results (in subquestion order),
+        report, validation, the per-step timings and the total duration.
+        """
+        for _ in self.iter_run(plan_result, search_results):
+            pass
+        return self.last_state.result()
+
+    @staticmethod
+    def _timed_call(handler: Optional[Callable], step: Dict[str, Any], state: "ExecutionState"):
+        start_ms = state.elapsed_ms()
+        start = time.perf_counter()
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for plan action {step.get('action')!r}")
+            output, error = handler(step, state), None
+        except Exception as e:
+            output, error = None, str(e)
+        return start_ms, round((time.perf_counter() - start) * 1000, 1), output, error
+
+
+class ExecutionState:
+    """Outputs by provided key, failed keys and step timings for one execution."""
+
+    def __init__(self, plan: Dict[str, Any]):
+        self.plan = plan
+        self.subquestions = {sq.get("id"): sq for sq in plan.get("subquestions", []) if isinstance(sq, dict)}
+        self.outputs: Dict[str, Any] = {}
+        self.failed: set = set()
+        self.timings: List[Dict[str, Any]] = []
+        self.aliases: Dict[str, str] = {}
+        self.report_chunks: "queue.Queue[str]" = queue.Queue()
+        self._start = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+    def record(self, step: Dict[str, Any], key: str, status: str, start_ms: float, duration_ms: float,
+               error: Optional[str] = None) -> Dict[str, Any]:
+        entry = {"step": step.get("step"), "action": step.get("action"), "provides": key, "status": status,
+                 "start_ms": start_ms, "duration_ms": duration_ms}
+        if error:
+            entry["error"] = error
+        self.timings.append(entry)
+        return entry
+
+    def drain_report_chunks(self) -> Iterator[Dict[str, Any]]:
+        """Streaming events for the report text produced since the last drain."""
+        while True:
+            try:
+                chunk = self.report_chunks.get_nowait()
+            except queue.Empty:
+                return
+            yield {"action": "synthesize", "provides": "synthesis", "status": "streaming", "chunk": chunk}
+
+    def search_results(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {qid: self.outputs.get(qid) or [] for qid in self.subquestions}
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "search_results": self.search_results(),
+            "report": self.outputs.get("synthesis"),
+            "validation": self.outputs.get("validation"),
+            "steps": sorted(self.timings, key=lambda t: t["step"] or 0),
+            "duration_ms": self.elapsed_ms(),
+        }
+
+
+def _check_graph(steps: Dict[str, Dict[str, Any]]) -> None:
+    """Reject plans with unknown dependencies or cycles before anything runs."""
+    for key, step in steps.items():
+        missing = [dep for dep in step_requires(step) if dep not in steps]
+        if missing:
+            raise ValueError(f"Plan step {step.get('step')} depends on unknown step(s): {', '.join(missing)}")
+    remaining = {key: set(step_requires(step)) for key, step in steps.items()}
+    while remaining:
+        ready = [key for key, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Plan has a dependency cycle among: {', '.join(sorted(remaining))}")
+        for key in ready:
+            del remaining[key]
+        for deps in remaining.values():
+            deps.difference_update(ready)
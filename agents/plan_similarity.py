@@ -0,0 +1,182 @@
+"""
+plan_similarity.py
+
+Similarity index over previously planned prompts.
+Near-variant topics ("Causes of coral reef bleaching" vs "Coral reef bleaching causes 2015-2024")
+can share one set of subquestions. Prompts are reduced to PlannerAgent.extract_keywords terms
+and compared with TF-IDF cosine similarity, vectorized with NumPy over all stored prompts.
+`adapt_subquestions` rewrites the names and years of the old prompt in the reused texts.
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from plan_cache import normalize_prompt
+
+MAX_TERMS = 10  # extract_keywords returns at most 10 keywords per prompt
+
+_YEAR = re.compile(r"\b(?:1[5-9]|20)\d{2}\b")
+# Runs of capitalized words ("Brazil", "New York", "EU"), a rough stand-in for named entities
+_NAME = re.compile(r"\b[A-Z][A-Za-z]*(?:\s+[A-Z][A-Za-z]*)*\b")
+
+
+def _stem(word: str) -> str:
+    """Very light plural folding so "hospital"/"hospitals" and "study"/"studies" match."""
+    if word.endswith("ies") and len(word) > 5:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 4:
+        return word[:-1]
+    return word
+
+
+def _specifics(prompt: str) -> Tuple[List[str], List[str]]:
+    """Years and capitalized names of a prompt; a lone capitalized first word only counts if it is all caps."""
+    years = list(dict.fromkeys(_YEAR.findall(prompt)))
+    names = []
+    for match in _NAME.finditer(prompt):
+        name = match.group()
+        if match.start() == len(prompt) - len(prompt.lstrip()) and " " not in name and not name.isupper():
+            continue  # "Coffee production in ..." starts with an ordinary word
+        if name not in names:
+            names.append(name)
+    return years, names
+
+
+def adapt_subquestions(old_prompt: str, new_prompt: str,
+                       subquestions: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Rewrite subquestions planned for `old_prompt` so they fit `new_prompt`.
+    Years and names only the old prompt has are replaced, in order, by those only the new
+    prompt has ("Brazil 2010-2020" -> "Vietnam 1990-2000"); new ones left over are appended as
+    scope. Returns None when a reused text would still name something the new prompt lacks.
+    """
+    new_lower = new_prompt.lower()
+    old_lower = old_prompt.lower()
+    replacements: List[Tuple[str, str]] = []
+    scope: List[str] = []
+    for old_items, new_items, joiner in zip(_specifics(old_prompt), _specifics(new_prompt), ("-", ", ")):
+        old_only = [item for item in old_items if item.lower() not in new_lower]
+        new_only = [item for item in new_items if item.lower() not in old_lower]
+        replacements.extend(zip(old_only, new_only))
+        replacements.extend((item, "") for item in old_only[len(new_only):])
+        if new_only[len(old_only):]:
+            scope.append(joiner.join(new_only[len(old_only):]))
+
+    adapted = []
+    for sq in subquestions:
+        text = sq["text"]
+        for old, new in replacements:
+            pattern = re.compile(rf"\b{re.escape(old)}\b", re.IGNORECASE)
+            if new:
+                text = pattern.sub(new, text)
+            elif pattern.search(text):
+                return None
+        if scope:
+            text = f"{text.rstrip()} ({', '.join(scope)})"
+        adapted.append(dict(sq, text=text))
+    return adapted
+
+
+class PlanSimilarityIndex:
+    """
+    Bounded in-memory index of (prompt, subquestions) pairs.
+    Each prompt is stored as a row of up to MAX_TERMS term ids, so a lookup is a handful of
+    vectorized operations over an (entries x MAX_TERMS) array instead of a dense TF-IDF matrix.
+    """
+
+    def __init__(self, keyword_fn: Callable[[str], List[str]], max_entries: int = 5000):
+        self.keyword_fn = keyword_fn
+        self.max_entries = max(1, max_entries)
+        self._vocab: Dict[str, int] = {}
+        self._rows: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None  # stacked rows, rebuilt lazily after adds
+        self._entries: List[Dict[str, Any]] = []
+        self._by_prompt: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+
+    def _terms(self, prompt: str) -> List[str]:
+        return list(dict.fromkeys(_stem(word) for word in self.keyword_fn(prompt)))[:MAX_TERMS]
+
+    def _term_ids(self, prompt: str) -> List[int]:
+        return [self._vocab.setdefault(term, len(self._vocab)) for term in self._terms(prompt)]
+
+    def add(self, prompt: str, subquestions: List[Dict[str, Any]], **info: Any) -> None:
+        """Index a planned prompt; re-adding the same (normalized) prompt replaces its plan."""
+        key = normalize_prompt(prompt)
+        with self._lock:
+            row = np.full(MAX_TERMS, -1, dtype=np.int64)
+            ids = self._term_ids(prompt)
+            row[:len(ids)] = ids
+            entry = dict(info, prompt=prompt, subquestions=[dict(sq) for sq in subquestions])
+            if key in self._by_prompt:
+                index = self._by_prompt[key]
+                self._rows[index] = row
+                self._entries[index] = entry
+                self._matrix = None
+                return
+            if len(self._entries) >= self.max_entries:
+                # Drop the oldest entry to stay bounded
+                self._rows.pop(0)
+                self._entries.pop(0)
+                self._by_prompt = {normalize_prompt(e["prompt"]): i for i, e in enumerate(self._entries)}
+            self._rows.append(row)
+            self._entries.append(entry)
+            self._matrix = None
+            self._by_prompt[key] = len(self._entries) - 1
+
+    def _idf(self, terms: np.ndarray) -> np.ndarray:
+        present = terms[terms >= 0]
+        df = np.bincount(present, minlength=len(self._vocab)).astype(np.float64)
+        n = len(self._entries)
+        return np.log((1 + n) / (1 + df)) + 1.0
+
+    def nearest(self, prompt: str, threshold: float = 0.0, exclude_same: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Return the most similar indexed prompt as {"prompt", "similarity", "subquestions", ...}
+        when its cosine similarity is at least `threshold`, else None.
+        """
+        with self._lock:
+            self.lookups += 1
+            if not self._entries:
+                return None
+            terms_in_query = self._terms(prompt)
+            if not terms_in_query:
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack(self._rows)
+            terms = self._matrix
+            idf = self._idf(terms)
+            weights = np.where(terms >= 0, idf[np.maximum(terms, 0)], 0.0)
+            norms = np.sqrt((weights ** 2).sum(axis=1))
+            query_ids = np.array([self._vocab[t] for t in terms_in_query if t in self._vocab], dtype=np.int64)
+            # Terms no stored prompt has count with the highest IDF, so new words lower the score
+            unseen = len(terms_in_query) - len(query_ids)
+            max_idf = np.log(1 + len(self._entries)) + 1.0
+            query_norm = np.sqrt((idf[query_ids] ** 2).sum() + unseen * max_idf ** 2)
+            # Binary term frequencies: the dot product is the sum of idf^2 over shared terms
+            shared = np.isin(terms, query_ids)
+            dots = (weights ** 2 * shared).sum(axis=1)
+            sims = dots / np.maximum(norms * query_norm, 1e-12)
+            if exclude_same and normalize_prompt(prompt) in self._by_prompt:
+                sims[self._by_prompt[normalize_prompt(prompt)]] = -1.0
+            best = int(sims.argmax())
+            similarity = float(sims[best])
+            if similarity < threshold or similarity <= 0.0:
+                return None
+            self.matches += 1
+            entry = self._entries[best]
+            return dict(entry, similarity=round(similarity, 4),
+                        subquestions=[dict(sq) for sq in entry["subquestions"]])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "terms": len(self._vocab),
+                    "lookups": self.lookups, "matches": self.matches}
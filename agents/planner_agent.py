@@ -6,11 +6,63 @@ Calls the running LM Studio server to generate intelligent subquestions for each
 """
 
 import json
+import logging
 import re
+import sys
+import threading
+import time
 import uuid
 import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from http_transport import HTTPTransport, get_transport, lm_studio_chat_url
+from plan_cache import PlanCache
+from plan_similarity import PlanSimilarityIndex, adapt_subquestions
+from prompts import render
+from json_repair import RepairingArrayParser, recover_objects, repair_json
+from salvage import salvage_content
+from run_store import RunStore, get_run_store
+from streaming import iter_sse_content
+from structured_logging import configure_logging, get_logger, iter_in_run, log_event, run_context, timed
+
+logger = get_logger("planner")
+
+# Part of the plan cache key: bump it whenever the prompts or the plan format change
+PLANNER_VERSION = "v3-static-prefix"
+
+# JSON schema for constrained decoding (LM Studio / OpenAI response_format). Schemas need an
+# object at the root, so the array is wrapped in {"subquestions": [...]}.
+SUBQUESTION_TYPES = ["background", "definition", "analysis", "methodology", "causal", "impact",
+                     "comparative", "historical"]
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "subquestions": {
+            "type": "array",
+            "minItems": 6,
+            "maxItems": 8,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "text": {"type": "string", "maxLength": 160},
+                    "priority": {"type": "integer", "minimum": 1},
+                    "type": {"type": "string", "enum": SUBQUESTION_TYPES},
+                },
+                "required": ["id", "text", "priority", "type"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["subquestions"],
+    "additionalProperties": False,
+}
+# A 400 whose body matches this is the server rejecting structured output (not, say, an oversized prompt)
+_RESPONSE_FORMAT_ERROR = re.compile(r"response_format|json_schema", re.IGNORECASE)
+
+_default_agent = None
+_default_agent_lock = threading.Lock()
 
 
 class PlannerAgent:
@@ -19,127 +71,409 @@ class PlannerAgent:
     for each user query. Connects to the running LM Studio server.
     """
 
-    def __init__(self):
-        self.api_url = "http://127.0.0.1:1234/v1/chat/completions"
+    def __init__(self, http: Optional[HTTPTransport] = None, api_url: Optional[str] = None,
+                 plan_cache: Optional[PlanCache] = None, use_cache: bool = True,
+                 run_store: Optional[RunStore] = None,
+                 similarity_index: Optional[PlanSimilarityIndex] = None,
+                 reuse_threshold: Optional[float] = None):
+        self.api_url = api_url or lm_studio_chat_url()
         self.model_name = "local-model"
+        self.http = http if http is not None else get_transport()
+        # Subquestions for a prompt are reused across plans (memory LRU + SQLite)
+        self.plan_cache = plan_cache if plan_cache is not None else (PlanCache() if use_cache else None)
+        # Plans are recorded in the shared run store (written in the background)
+        self.run_store = run_store if run_store is not None else get_run_store()
+        # Past prompts for near-variant plan reuse; seeded from the run store on first use.
+        # Reuse only happens when reuse_threshold is set (or a threshold is passed to plan()).
+        self.similar_plans = similarity_index
+        self.reuse_threshold = reuse_threshold
+        self._similar_lock = threading.Lock()
+        # ID and timestamp of the most recent plan; every plan() call gets fresh ones
         self.question_id = str(uuid.uuid4())
         self.created_at = datetime.utcnow().isoformat() + "Z"
+        # Planner JSON produced by the last plan_and_search run
+        self.last_plan: Optional[Dict[str, Any]] = None
+        # None = not yet known; set to False once the server rejects response_format
+        self.structured_output: Optional[bool] = None
+        self._metrics = {
+            "completions": 0, "structured_completions": 0, "structured_unsupported": 0,
+            "parsed": 0, "repaired": 0, "partial": 0, "parse_failures": 0, "fallbacks": 0,
+            "completion_tokens": 0, "wasted_tokens": 0, "salvaged_bodies": 0,
+        }
+        self._metrics_lock = threading.Lock()
 
     def _build_system_prompt(self) -> str:
         """Kept for backward compatibility but not used in agent-based mode."""
         return "Agent-based planner: no system prompt needed."
 
-    def _call_lm_studio(self, messages: List[Dict[str, str]]) -> str:
+    def _chat_payload(self, messages: List[Dict[str, str]], stream: bool = False) -> Dict[str, Any]:
+        # messages: list of {role,content}
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            # allow caller to embed temperature/max_tokens in messages if needed
+            "temperature": 0.3,
+            "max_tokens": 1024,
+        }
+        if self.structured_output is not False:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "research_plan", "strict": True, "schema": PLAN_SCHEMA},
+            }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _count(self, **amounts: int) -> None:
+        with self._metrics_lock:
+            for name, amount in amounts.items():
+                self._metrics[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
         """
-        Call LM Studio server and return the response text.
+        Planner decoding metrics: how completions were parsed (strictly, after local repair,
+        by partial-array recovery, or not at all), how many completion tokens were thrown
+        away because the output ended in the template fallback, and how many malformed
+        response bodies had their content salvaged.
+        """
+        with self._metrics_lock:
+            stats = dict(self._metrics)
+        outcomes = stats["parsed"] + stats["repaired"] + stats["partial"] + stats["parse_failures"]
+        stats["parse_failure_rate"] = (stats["parse_failures"] / outcomes) if outcomes else 0.0
+        stats["structured_output"] = self.structured_output
+        return stats
+
+    def _post_chat(self, messages: List[Dict[str, str]], stream: bool = False) -> requests.Response:
+        """
+        POST a chat completion, asking for schema-constrained JSON while the server accepts it.
+        A 400 whose error names response_format/json_schema switches it off for this agent and
+        retries once; any other 400 is returned as-is.
         """
+        payload = self._chat_payload(messages, stream=stream)
+        response = self.http.post(self.api_url, json=payload, timeout=180, stream=stream)
+        if response.status_code == 400 and "response_format" in payload and _RESPONSE_FORMAT_ERROR.search(response.text):
+            log_event(logger, logging.WARNING, "LM Studio rejected response_format; using unconstrained output",
+                      body=response.text[:200])
+            response.close()
+            self.structured_output = False
+            self._count(structured_unsupported=1)
+            payload = self._chat_payload(messages, stream=stream)
+            response = self.http.post(self.api_url, json=payload, timeout=180, stream=stream)
+        elif response.status_code == 200 and "response_format" in payload:
+            self.structured_output = True
+        if response.status_code == 200:
+            self._count(completions=1, structured_completions=int("response_format" in payload))
+        return response
+
+    def _complete(self, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+        """Return (content, completion_tokens); the token count is estimated if usage is missing."""
+        with timed(logger, "LM Studio completion", url=self.api_url) as fields:
+            response = self._post_chat(messages)
+            fields["status"] = response.status_code
+
+        if response.status_code != 200:
+            log_event(logger, logging.ERROR, "LM Studio error", status=response.status_code, body=response.text[:200])
+            return "", 0
+
         try:
-            # messages: list of {role,content}
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                # allow caller to embed temperature/max_tokens in messages if needed
-                "temperature": 0.3,
-                "max_tokens": 1024,
-            }
-            print("[planner] Sending request to LM Studio (may take a moment)...")
-            response = requests.post(self.api_url, json=payload, timeout=180)
+            data = response.json()
+        except ValueError:
+            # Cut-off or malformed body: keep whatever subquestion text it carries for the repair step
+            content = salvage_content(response.text)
+            log_event(logger, logging.WARNING, "LM Studio returned malformed JSON; salvaged its content",
+                      chars=len(response.text), salvaged=len(content))
+            self._count(salvaged_bodies=int(bool(content)))
+            data = {"choices": [{"message": {"content": content}}]}
+        content = data["choices"][0]["message"]["content"].strip()
+        tokens = (data.get("usage") or {}).get("completion_tokens") or len(content) // 4
+        self._count(completion_tokens=tokens)
+        return content, tokens
 
-            if response.status_code != 200:
-                print(f"[planner] LM Studio error: {response.status_code}: {response.text[:200]}")
-                return ""
+    def _call_lm_studio(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Call LM Studio server and return the response text.
+        """
+        return self._safe_complete(messages)[0]
 
-            data = response.json()
-            return data["choices"][0]["message"]["content"].strip()
+    def _safe_complete(self, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+        try:
+            return self._complete(messages)
         except requests.exceptions.Timeout:
-            print("[planner] Warning: LM Studio took too long to respond. The model may be slow.")
-            print("[planner] Try again or check if the server is overloaded.")
-            return ""
+            log_event(logger, logging.WARNING, "LM Studio took too long to respond; the model may be slow or overloaded")
         except requests.exceptions.ConnectionError:
-            print("[planner] Error: Cannot connect to LM Studio on port 1234. Make sure the server is running.")
-            return ""
+            log_event(logger, logging.ERROR, "Cannot connect to LM Studio; make sure the server is running", url=self.api_url)
         except Exception as e:
-            print(f"[planner] Error calling LM Studio: {e}")
-            return ""
+            log_event(logger, logging.ERROR, "Error calling LM Studio", error=str(e))
+        return "", 0
+
+    @staticmethod
+    def _fallback_subquestions(user_prompt: str) -> List[Dict[str, Any]]:
+        """Template subquestions used when LM Studio is unavailable or its output cannot be parsed."""
+        return [
+            {"id": "q1", "text": f"What is the background of {user_prompt}?", "priority": 1, "type": "background"},
+            {"id": "q2", "text": f"How does {user_prompt} work?", "priority": 2, "type": "methodology"},
+            {"id": "q3", "text": f"What are the impacts of {user_prompt}?", "priority": 3, "type": "impact"},
+            {"id": "q4", "text": f"What are the challenges with {user_prompt}?", "priority": 4, "type": "analysis"},
+            {"id": "q5", "text": f"How does {user_prompt} compare to alternatives?", "priority": 5, "type": "comparative"},
+            {"id": "q6", "text": f"What are the future trends for {user_prompt}?", "priority": 6, "type": "historical"}
+        ]
 
     def _generate_subquestions_lm(self, user_prompt: str) -> List[Dict[str, Any]]:
         """
         Use LM Studio to intelligently break down the user's question into subquestions.
         Returns all subquestions in ONE call (no retries).
         """
-        # Strong instruction with a concrete example to encourage correct JSON output
-        system_prompt = (
-            "You are a research planning expert. Your single task is to break a research question into EXACTLY 6-8 "
-            "atomic, focused subquestions. Each subquestion must be answerable and non-overlapping. "
-            "Return ONLY a JSON array (no markdown, no explanation). Each item must be an object: "
-            "{\"id\": \"q1\", \"text\": \"...\", \"priority\": 1, \"type\": \"analysis\"} . "
-            "Types allowed: background, definition, analysis, methodology, causal, impact, comparative, historical. "
-            "Prioritize by importance (1 = highest). Keep each subquestion concise (<=140 chars). "
-            "IMPORTANT: You MUST generate exactly 6-8 subquestions, not 1-2."
-        )
-
-        # Provide a generic example without specific content
-        example = (
-            "EXAMPLE:\nUser prompt: \"What are the main impacts of artificial intelligence?\"\n"
-            "Output JSON:\n"
-            "[\n  {\"id\": \"q1\", \"text\": \"What are the main types of AI technologies?\", \"priority\": 1, \"type\": \"background\"},\n"
-            "  {\"id\": \"q2\", \"text\": \"How do AI systems process information?\", \"priority\": 2, \"type\": \"methodology\"},\n"
-            "  {\"id\": \"q3\", \"text\": \"What are the economic impacts of AI adoption?\", \"priority\": 3, \"type\": \"impact\"},\n"
-            "  {\"id\": \"q4\", \"text\": \"What are the ethical challenges of AI implementation?\", \"priority\": 4, \"type\": \"analysis\"},\n"
-            "  {\"id\": \"q5\", \"text\": \"How does AI compare to traditional computing methods?\", \"priority\": 5, \"type\": \"comparative\"},\n"
-            "  {\"id\": \"q6\", \"text\": \"What are the future trends in AI development?\", \"priority\": 6, \"type\": \"historical\"}\n]"
-        )
-
-        user_message = (
-            f"Produce EXACTLY 6-8 focused subquestions for the research question below. Output ONLY the JSON array with all subquestions.\n\n"
-            f"Research question:\n{user_prompt}\n\nPlease ensure items are concise, non-overlapping, and answerable. You must generate 6-8 subquestions."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": example + "\n\n" + user_message}
-        ]
+        return self._generate_subquestions(user_prompt)[0]
+
+    def _build_messages(self, user_prompt: str) -> List[Dict[str, str]]:
+        """Chat messages asking the model for the subquestion JSON array (static prefix first, see prompts.py)."""
+        return render("planner", question=user_prompt)
 
-        response_text = self._call_lm_studio(messages)
+    def _generate_subquestions(self, user_prompt: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Same as _generate_subquestions_lm, but also reports whether the template fallback was used
+        (fallbacks are never cached, so the next plan retries LM Studio).
+        """
+        response_text, tokens = self._safe_complete(self._build_messages(user_prompt))
 
         if not response_text:
-            print("[planner] LM Studio returned empty response.")
+            log_event(logger, logging.WARNING, "LM Studio returned empty response; using template subquestions")
             # Generate multiple fallback subquestions instead of just one
-            return [
-                {"id": "q1", "text": f"What is the background of {user_prompt}?", "priority": 1, "type": "background"},
-                {"id": "q2", "text": f"How does {user_prompt} work?", "priority": 2, "type": "methodology"},
-                {"id": "q3", "text": f"What are the impacts of {user_prompt}?", "priority": 3, "type": "impact"},
-                {"id": "q4", "text": f"What are the challenges with {user_prompt}?", "priority": 4, "type": "analysis"},
-                {"id": "q5", "text": f"How does {user_prompt} compare to alternatives?", "priority": 5, "type": "comparative"},
-                {"id": "q6", "text": f"What are the future trends for {user_prompt}?", "priority": 6, "type": "historical"}
-            ]
-
-        # Try to parse JSON from response
-        parsed = None
+            self._count(fallbacks=1)
+            return self._fallback_subquestions(user_prompt), True
+
+        subquestions, outcome = self._parse_subquestions(response_text)
+        self._count(**{outcome: 1})
+        if subquestions:
+            if outcome != "parsed":
+                log_event(logger, logging.INFO, "Recovered subquestions from malformed JSON", outcome=outcome,
+                          count=len(subquestions))
+            return subquestions, False
+
+        # Fallback: return multiple subquestions if parsing fails
+        log_event(logger, logging.WARNING, "Could not parse JSON from LM Studio; using template subquestions",
+                  raw_output=response_text[:500], wasted_tokens=tokens)
+        self._count(fallbacks=1, wasted_tokens=tokens)
+        return self._fallback_subquestions(user_prompt), True
+
+    def _parse_subquestions(self, text: str) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Parse model output into normalized subquestions. Tries strict JSON, then local repair,
+        then recovery of the complete objects of a truncated array. Returns (subquestions,
+        outcome) with outcome one of "parsed", "repaired", "partial", "parse_failures".
+        """
+        def as_list(value: Any) -> Optional[List[Any]]:
+            if isinstance(value, dict):
+                value = value.get("subquestions")
+            return value if isinstance(value, list) and value else None
+
+        items, outcome = None, "parse_failures"
         try:
-            parsed = json.loads(response_text)
+            items, outcome = as_list(json.loads(text)), "parsed"
         except json.JSONDecodeError:
-            # try to extract JSON array
-            m = re.search(r"\[.*\]", response_text, re.DOTALL)
-            if m:
-                try:
-                    parsed = json.loads(m.group(0))
-                except json.JSONDecodeError:
-                    parsed = None
-
-        if isinstance(parsed, list) and len(parsed) > 0:
-            return parsed
-        
-        # Fallback: return multiple subquestions if parsing fails
-        print(f"[planner] Could not parse JSON from LM Studio. Raw output:\n{response_text[:500]}")
-        return [
-            {"id": "q1", "text": f"What is the background of {user_prompt}?", "priority": 1, "type": "background"},
-            {"id": "q2", "text": f"How does {user_prompt} work?", "priority": 2, "type": "methodology"},
-            {"id": "q3", "text": f"What are the impacts of {user_prompt}?", "priority": 3, "type": "impact"},
-            {"id": "q4", "text": f"What are the challenges with {user_prompt}?", "priority": 4, "type": "analysis"},
-            {"id": "q5", "text": f"How does {user_prompt} compare to alternatives?", "priority": 5, "type": "comparative"},
-            {"id": "q6", "text": f"What are the future trends for {user_prompt}?", "priority": 6, "type": "historical"}
-        ]
+            pass
+        if items is None:
+            items, outcome = as_list(repair_json(text)), "repaired"
+        if items is None:
+            items, outcome = recover_objects(text) or None, "partial"
+        if items is None:
+            return [], "parse_failures"
+
+        subquestions: List[Dict[str, Any]] = []
+        for item in items:
+            if isinstance(item, dict):
+                subq = self._normalize_subquestion(item, subquestions)
+                if subq is not None:
+                    subquestions.append(subq)
+        return subquestions, (outcome if subquestions else "parse_failures")
+
+    def get_subquestions(self, user_prompt: str, fresh: bool = False) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return (subquestions, from_cache) for a prompt, consulting the plan cache first.
+        `fresh=True` skips the lookup and regenerates (the new plan replaces the cached one).
+        """
+        subquestions, origin = self._resolve_subquestions(user_prompt, fresh, self.reuse_threshold)
+        return subquestions, origin["cached"]
+
+    def _resolve_subquestions(self, user_prompt: str, fresh: bool,
+                              reuse_threshold: Optional[float]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Exact plan cache, then (when reuse_threshold is set) the most similar past prompt, then
+        the model. Returns the subquestions and an origin dict for the plan metadata.
+        """
+        if self.plan_cache is not None and not fresh:
+            cached = self.plan_cache.get(user_prompt, self.model_name, PLANNER_VERSION)
+            if cached is not None:
+                return cached, {"method": "plan cache", "cached": True}
+
+        if reuse_threshold is not None and not fresh:
+            match = self.find_similar_plan(user_prompt, reuse_threshold)
+            if match is not None:
+                log_event(logger, logging.INFO, "Reusing plan of a similar prompt", similar_to=match["prompt"][:100],
+                          similarity=match["similarity"])
+                return match["subquestions"], {
+                    "method": "similar plan", "cached": True,
+                    "reused_from": {"prompt": match["prompt"], "similarity": match["similarity"],
+                                    "question_id": match.get("question_id")},
+                }
+
+        subquestions, used_fallback = self._generate_subquestions(user_prompt)
+        if not used_fallback:
+            self._remember_plan(user_prompt, subquestions)
+        method = "template fallback" if used_fallback else "LM Studio inference"
+        return subquestions, {"method": method, "cached": False}
+
+    def _remember_plan(self, user_prompt: str, subquestions: List[Dict[str, Any]]) -> None:
+        """Store model-generated subquestions in the plan cache and the similarity index."""
+        if self.plan_cache is not None:
+            self.plan_cache.put(user_prompt, self.model_name, PLANNER_VERSION, subquestions)
+        if self.similar_plans is not None:
+            self.similar_plans.add(user_prompt, subquestions)
+
+    def _similarity_index(self) -> PlanSimilarityIndex:
+        """Create the index on first use, seeded with the most recent model-generated plans."""
+        with self._similar_lock:
+            if self.similar_plans is None:
+                index = PlanSimilarityIndex(self.extract_keywords)
+                for run in reversed(self.run_store.find_runs(limit=index.max_entries)):
+                    plan = self.run_store.get_plan(run["run_id"])
+                    metadata = (plan or {}).get("metadata", {})
+                    if metadata.get("planner_version") == PLANNER_VERSION \
+                            and metadata.get("method") in ("LM Studio inference", "LM Studio streaming"):
+                        index.add(plan["original_prompt"], plan["subquestions"], question_id=plan["question_id"])
+                self.similar_plans = index
+            return self.similar_plans
+
+    def find_similar_plan(self, user_prompt: str, threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        The most similar previously planned prompt (TF-IDF cosine over extract_keywords terms)
+        as {"prompt", "similarity", "subquestions", "question_id"}, or None below `threshold`
+        (default: self.reuse_threshold, else 0.6). The subquestions are adapted to the names and
+        years of `user_prompt`; a plan that cannot be adapted is not returned.
+        """
+        if threshold is None:
+            threshold = self.reuse_threshold if self.reuse_threshold is not None else 0.6
+        match = self._similarity_index().nearest(user_prompt, threshold)
+        if match is None:
+            return None
+        subquestions = adapt_subquestions(match["prompt"], user_prompt, match["subquestions"])
+        if subquestions is None:
+            log_event(logger, logging.INFO, "Similar plan names entities the prompt lacks; not reused",
+                      similar_to=match["prompt"][:100])
+            return None
+        return dict(match, subquestions=subquestions)
+
+    def stream_subquestions(self, user_prompt: str, fresh: bool = False,
+                            origin: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield subquestions one at a time while LM Studio is still generating the array
+        (stream=True plus an incremental JSON parser). Cached plans are replayed immediately;
+        if nothing usable arrives, the template fallback subquestions are yielded instead.
+        If given, `origin` is filled with the plan metadata method and cached flag.
+        """
+        origin = origin if origin is not None else {}
+        if self.plan_cache is not None and not fresh:
+            cached = self.plan_cache.get(user_prompt, self.model_name, PLANNER_VERSION)
+            if cached is not None:
+                origin.update(method="plan cache", cached=True)
+                yield from cached
+                return
+
+        collected: List[Dict[str, Any]] = []
+        usage: Dict[str, Any] = {}
+        streamed_chars = 0
+        parser = RepairingArrayParser()
+        start = time.perf_counter()
+        completed = False  # the stream ran to its end without a transport error
+        try:
+            response = self._post_chat(self._build_messages(user_prompt), stream=True)
+            try:
+                if response.status_code != 200:
+                    log_event(logger, logging.ERROR, "LM Studio error", status=response.status_code,
+                              body=response.text[:200])
+                else:
+                    for delta in iter_sse_content(response, usage):
+                        streamed_chars += len(delta)
+                        for item in parser.feed(delta):
+                            subq = self._normalize_subquestion(item, collected)
+                            if subq is None:
+                                continue
+                            if not collected:
+                                log_event(logger, logging.INFO, "First streamed subquestion",
+                                          ttft_ms=round((time.perf_counter() - start) * 1000, 1))
+                            collected.append(subq)
+                            yield subq
+                    completed = True
+            finally:
+                response.close()
+        except requests.exceptions.RequestException as e:
+            log_event(logger, logging.ERROR, "Error streaming from LM Studio", error=str(e))
+
+        tokens = usage.get("completion_tokens") or streamed_chars // 4
+        self._count(completion_tokens=tokens)
+        if streamed_chars:
+            outcome = "parse_failures" if not collected else ("partial" if not parser.finished else "parsed")
+            self._count(**{outcome: 1})
+        if not collected:
+            log_event(logger, logging.WARNING, "No subquestions streamed; using template subquestions",
+                      wasted_tokens=tokens)
+            self._count(fallbacks=1, wasted_tokens=tokens)
+            origin.update(method="template fallback", cached=False)
+            yield from self._fallback_subquestions(user_prompt)
+            return
+        complete = completed and parser.finished
+        log_event(logger, logging.INFO, "Streamed subquestions", count=len(collected), complete=complete,
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
+        # A plan cut short by a dropped stream or a truncated array is used for this run but never cached
+        origin.update(method="LM Studio streaming" if complete else "LM Studio streaming (partial)", cached=False)
+        if complete:
+            self._remember_plan(user_prompt, collected)
+
+    def _normalize_subquestion(self, item: Dict[str, Any], collected: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Fill in id/priority/type for a streamed object; None if it has no usable text."""
+        text = str(item.get("text", "")).strip()
+        if not text:
+            return None
+        used = {sq["id"] for sq in collected}
+        subq = dict(item)
+        subq["text"] = text
+        if not subq.get("id") or subq["id"] in used:
+            number = len(collected) + 1
+            while f"q{number}" in used:
+                number += 1
+            subq["id"] = f"q{number}"
+        subq.setdefault("priority", len(collected) + 1)
+        subq.setdefault("type", self.detect_question_type(text))
+        return subq
+
+    def plan_and_search(self, user_prompt: str, searcher: Any, fresh: bool = False,
+                        max_workers: Optional[int] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Stream the plan and hand each subquestion to `searcher` (a SearcherAgent) as soon as it
+        is decoded, so searches overlap with the rest of the model's output. Yields (qid, sources)
+        in completion order; afterwards the planner JSON is available as self.last_plan.
+        """
+        question_id = str(uuid.uuid4())
+        return iter_in_run(self._plan_and_search(user_prompt, searcher, fresh, max_workers, question_id), question_id)
+
+    def _plan_and_search(self, user_prompt: str, searcher: Any, fresh: bool, max_workers: Optional[int],
+                         question_id: str) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        subquestions: List[Dict[str, Any]] = []
+        origin: Dict[str, Any] = {"method": "LM Studio streaming", "cached": False}
+
+        def tracked() -> Iterator[Dict[str, Any]]:
+            for subq in self.stream_subquestions(user_prompt, fresh=fresh, origin=origin):
+                subquestions.append(subq)
+                yield subq
+
+        self.last_plan = None
+        start = time.perf_counter()
+        log_event(logger, logging.INFO, "Processing question", question_id=question_id, prompt=user_prompt[:100])
+        yield from searcher.iter_search_streaming(tracked(), max_workers=max_workers)
+        self.last_plan = self._build_result(user_prompt, subquestions, origin, question_id=question_id)
+        log_event(logger, logging.INFO, "Planned and searched", subquestions=len(subquestions),
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
 
     @staticmethod
     def extract_keywords(text: str) -> List[str]:
@@ -156,7 +490,7 @@ class PlannerAgent:
         # Extract words (remove punctuation)
         words = re.findall(r'\b[a-z]+\b', text.lower())
         keywords = [w for w in words if w not in stop_words and len(w) > 3]
-        return list(set(keywords))[:10]  # Return unique keywords, max 10
+        return list(dict.fromkeys(keywords))[:10]  # Unique keywords in prompt order, max 10
 
     @staticmethod
     def detect_question_type(text: str) -> str:
@@ -182,9 +516,13 @@ class PlannerAgent:
     def split_into_subquestions(user_prompt: str) -> List[Dict[str, Any]]:
         """
         Delegates to LM Studio for intelligent subquestion generation.
+        Uses one shared agent (and its plan cache) instead of building a new one per call.
         """
-        agent = PlannerAgent()
-        return agent._generate_subquestions_lm(user_prompt)
+        global _default_agent
+        with _default_agent_lock:
+            if _default_agent is None:
+                _default_agent = PlannerAgent()
+        return _default_agent.get_subquestions(user_prompt)[0]
 
     @staticmethod
     def create_research_plan(subquestions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -260,63 +598,117 @@ class PlannerAgent:
 
         return constraints
 
-    def plan(self, user_prompt: str) -> Dict[str, Any]:
+    def plan(self, user_prompt: str, fresh: bool = False, reuse_threshold: Optional[float] = None) -> Dict[str, Any]:
         """
         Generate a planner JSON using LM Studio to generate intelligent subquestions.
+        Subquestions for a previously planned prompt come from the plan cache unless `fresh` is set.
+        With a reuse threshold (argument or self.reuse_threshold), the subquestions of a similar
+        past prompt are reused when its similarity reaches the threshold.
         
-        Returns the parsed planner JSON (and writes it to file).
+        Returns the parsed planner JSON (and records it in the run store).
         """
-        print(f"\n[planner] Processing question: {user_prompt[:100]}...")
-        print("[planner] Calling LM Studio to generate subquestions...")
-
-        # Generate unique subquestions using LM Studio
-        subquestions = self._generate_subquestions_lm(user_prompt)
-        print(f"\n[planner] Generated {len(subquestions)} subquestions:")
-        print("-" * 70)
-        
-        for sq in subquestions:
-            priority = sq.get("priority", "?")
-            q_type = sq.get("type", "?")
-            text = sq.get("text", "")
-            print(f"  [{sq['id']} - Priority {priority} - {q_type}] {text}")
-        
-        print("-" * 70)
+        question_id = str(uuid.uuid4())
+        # The question_id doubles as the run ID on every log record of this plan
+        with run_context(question_id):
+            log_event(logger, logging.INFO, "Processing question", question_id=question_id, prompt=user_prompt[:100])
+            start = time.perf_counter()
+
+            # Generate unique subquestions using LM Studio
+            threshold = reuse_threshold if reuse_threshold is not None else self.reuse_threshold
+            subquestions, origin = self._resolve_subquestions(user_prompt, fresh, threshold)
+            log_event(logger, logging.INFO, "Generated subquestions", count=len(subquestions), method=origin["method"],
+                      duration_ms=round((time.perf_counter() - start) * 1000, 1))
+            if logger.isEnabledFor(logging.DEBUG):
+                for sq in subquestions:
+                    log_event(logger, logging.DEBUG, "Subquestion", qid=sq.get("id"), priority=sq.get("priority", "?"),
+                              type=sq.get("type", "?"), text=sq.get("text", ""))
+
+            return self._build_result(user_prompt, subquestions, origin, start, question_id)
+
+    def plan_many(self, prompts: Iterable[str], max_in_flight: int = 4,
+                  fresh: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Plan many research questions, keeping at most `max_in_flight` LM Studio requests
+        running at once, and yield each planner JSON as soon as it finishes (not in input
+        order). `prompts` is consumed lazily, so it can be a large file or generator.
+        A prompt whose planning raises is logged and skipped.
+        """
+        max_in_flight = max(1, max_in_flight)
+        prompts = iter(prompts)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            pending = {}
+
+            def submit_next() -> bool:
+                for prompt in prompts:
+                    if prompt and prompt.strip():
+                        pending[pool.submit(self.plan, prompt.strip(), fresh)] = prompt.strip()
+                        return True
+                return False
+
+            while len(pending) < max_in_flight and submit_next():
+                pass
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    prompt = pending.pop(future)
+                    submit_next()
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        log_event(logger, logging.ERROR, "Planning failed", prompt=prompt[:100], error=str(e))
+
+    def _build_result(self, user_prompt: str, subquestions: List[Dict[str, Any]], origin: Dict[str, Any],
+                      start: Optional[float] = None, question_id: Optional[str] = None) -> Dict[str, Any]:
+        """Assemble the planner JSON for a set of subquestions and record it in the run store."""
+        start = start if start is not None else time.perf_counter()
+        question_id = question_id or str(uuid.uuid4())
+        created_at = datetime.utcnow().isoformat() + "Z"
+        self.question_id, self.created_at = question_id, created_at
 
         # Create research plan
         plan = self.create_research_plan(subquestions)
-        print(f"[planner] Created research plan with {len(plan)} steps")
 
         # Extract constraints
         constraints = self.extract_constraints(user_prompt)
-        print("[planner] Extracted constraints from prompt")
 
         # Build the final JSON output
         result = {
-            "question_id": self.question_id,
+            "question_id": question_id,
             "original_prompt": user_prompt,
             "summary": user_prompt.split('.')[0] + "." if '.' in user_prompt else user_prompt,
             "subquestions": subquestions,
             "plan": plan,
             "constraints": constraints,
             "metadata": {
-                "planner_version": "v2-lm-studio",
-                "created_at": self.created_at,
-                "method": "LM Studio inference"
+                "planner_version": PLANNER_VERSION,
+                "created_at": created_at,
+                "method": origin["method"],
+                "cached": origin["cached"]
             }
         }
+        if "reused_from" in origin:
+            result["metadata"]["reused_from"] = origin["reused_from"]
 
-        # Save to disk
-        filename = f"planner_output_{self.question_id}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        print(f"[planner] Saved planner output to: {filename}\n")
+        # Queue for the run store; the write happens on its background thread
+        self.run_store.record_plan(result)
+        log_event(logger, logging.INFO, "Recorded plan", question_id=question_id, steps=len(plan),
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
 
         return result
 
 
 if __name__ == "__main__":
+    configure_logging(default_level="INFO")
     agent = PlannerAgent()
 
+    if len(sys.argv) > 1:
+        # Batch mode: python planner_agent.py prompts.txt [max_in_flight] -- one question per line
+        in_flight = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+        with open(sys.argv[1], encoding="utf-8") as prompts_file:
+            for done, result in enumerate(agent.plan_many(prompts_file, max_in_flight=in_flight), 1):
+                print(f"{done}\t{result['question_id']}\t{len(result['subquestions'])}\t{result['original_prompt'][:80]}")
+        sys.exit(0)
+
     print("=" * 70)
     print("Planner Agent (Using LM Studio Server)")
     print("Generates intelligent subquestions using the loaded model.")
@@ -0,0 +1,226 @@
+"""
+prompts.py
+
+Registry of the chat prompts sent to LM Studio.
+Every prompt is laid out static-prefix-first: the system prompt, any few-shot example turns
+and the fixed instructions come before the variable content (the research question, the
+sources), which always comes last. LM Studio (llama.cpp) reuses the KV cache for the longest
+prompt prefix it has already processed, so with this layout consecutive calls of the same
+prompt only prefill their variable tail.
+
+Usage:
+    messages = render("planner", question="...")
+    python prompts.py            # TTFT benchmark against a stub that simulates prefix caching
+    python prompts.py --api-url http://127.0.0.1:1234/v1/chat/completions   # against LM Studio
+"""
+
+import hashlib
+import string
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+class PromptTemplate:
+    """
+    A chat prompt split into static parts (system, example turns, instructions) and a
+    variable tail. Only `variable` is formatted with the call's values (static parts are used
+    verbatim, braces included); anything that changes per call belongs there so the static
+    prefix stays byte-identical between calls.
+    """
+
+    def __init__(self, name: str, system: str, variable: str, instructions: str = "",
+                 examples: Sequence[Tuple[str, str]] = ()):
+        self.name = name
+        self.system = system
+        self.instructions = instructions
+        self.examples = list(examples)
+        self.variable = variable
+
+    @property
+    def fields(self) -> List[str]:
+        return [field for _, field, _, _ in string.Formatter().parse(self.variable) if field]
+
+    @property
+    def fingerprint(self) -> str:
+        """Short hash of the static parts; it changes whenever the cacheable prefix changes."""
+        static = "\x00".join([self.system, self.instructions] + [t for pair in self.examples for t in pair])
+        return hashlib.sha256(static.encode("utf-8")).hexdigest()[:12]
+
+    def messages(self, layout: str = "static_first", **values: Any) -> List[Dict[str, str]]:
+        """
+        Chat messages for `values`. `layout="variable_first"` puts the variable content ahead
+        of the instructions (the old layout) and exists only for benchmark comparisons.
+        """
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Prompt {self.name!r} is missing: {', '.join(missing)}")
+        variable = self.variable.format(**values)
+        parts = [self.instructions, variable] if layout == "static_first" else [variable, self.instructions]
+        messages = [{"role": "system", "content": self.system}]
+        for user, assistant in self.examples:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": "\n\n".join(part for part in parts if part)})
+        return messages
+
+
+PROMPTS: Dict[str, PromptTemplate] = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    PROMPTS[template.name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    try:
+        return PROMPTS[name]
+    except KeyError:
+        raise KeyError(f"Unknown prompt {name!r}; registered: {', '.join(sorted(PROMPTS))}") from None
+
+
+def render(name: str, **values: Any) -> List[Dict[str, str]]:
+    return get_prompt(name).messages(**values)
+
+
+# --- planner -------------------------------------------------------------------
+
+register(PromptTemplate(
+    name="planner",
+    system=(
+        "You are a research planning expert. Your single task is to break a research question into EXACTLY 6-8 "
+        "atomic, focused subquestions. Each subquestion must be answerable and non-overlapping. "
+        "Return ONLY a JSON array (no markdown, no explanation). Each item must be an object: "
+        "{\"id\": \"q1\", \"text\": \"...\", \"priority\": 1, \"type\": \"analysis\"} . "
+        "Types allowed: background, definition, analysis, methodology, causal, impact, comparative, historical. "
+        "Prioritize by importance (1 = highest). Keep each subquestion concise (<=140 chars). "
+        "IMPORTANT: You MUST generate exactly 6-8 subquestions, not 1-2."
+    ),
+    # A generic example without specific content, as a completed turn
+    examples=[(
+        "Research question:\nWhat are the main impacts of artificial intelligence?",
+        "[\n  {\"id\": \"q1\", \"text\": \"What are the main types of AI technologies?\", \"priority\": 1, \"type\": \"background\"},\n"
+        "  {\"id\": \"q2\", \"text\": \"How do AI systems process information?\", \"priority\": 2, \"type\": \"methodology\"},\n"
+        "  {\"id\": \"q3\", \"text\": \"What are the economic impacts of AI adoption?\", \"priority\": 3, \"type\": \"impact\"},\n"
+        "  {\"id\": \"q4\", \"text\": \"What are the ethical challenges of AI implementation?\", \"priority\": 4, \"type\": \"analysis\"},\n"
+        "  {\"id\": \"q5\", \"text\": \"How does AI compare to traditional computing methods?\", \"priority\": 5, \"type\": \"comparative\"},\n"
+        "  {\"id\": \"q6\", \"text\": \"What are the future trends in AI development?\", \"priority\": 6, \"type\": \"historical\"}\n]",
+    )],
+    instructions=(
+        "Produce EXACTLY 6-8 focused subquestions for the research question below. Output ONLY the JSON array with "
+        "all subquestions. Please ensure items are concise, non-overlapping, and answerable. You must generate 6-8 "
+        "subquestions."
+    ),
+    variable="Research question:\n{question}",
+))
+
+# --- writer --------------------------------------------------------------------
+
+register(PromptTemplate(
+    name="report",
+    # Enhanced system prompt for detailed, professional paragraphs with citations
+    system=(
+        "You are an expert research writer. Write a comprehensive 8-paragraph academic report. "
+        "Each paragraph: 5-7 sentences, 120-180 words for balanced content. "
+        "Structure: 1) Introduction, 2) Background, 3) Literature Review, 4) Methodology/Approach, "
+        "5) Analysis with citations, 6) Implications, 7) Challenges/Limitations, 8) Conclusion. "
+        "Use formal academic tone, complex sentences, and in-text citations [CITATION]. "
+        "No headings or Q&A format - create flowing narrative. Provide detailed analysis and examples."
+    ),
+    instructions="""Write a comprehensive 8-paragraph academic report on the research question and materials below:
+1. Introduction (topic significance, context, importance)
+2. Background (current state, historical development, key concepts)
+3. Literature Review (existing research, scholarly perspectives)
+4. Methodology/Approach (analytical framework, research methods)
+5. Analysis (findings with citations, evidence, detailed examination)
+6. Implications (practical impact, applications, consequences)
+7. Challenges/Limitations (constraints, future research needs)
+8. Conclusion (summary, recommendations, future directions)
+
+Each paragraph: 5-7 sentences, 120-180 words, include citations [CITATION], no instructions in response.""",
+    variable="Research Question: {question}\n\nResearch Materials with Citations:\n{materials}",
+))
+
+register(PromptTemplate(
+    name="evidence_summary",
+    system=(
+        "You are a research assistant. Summarize the evidence the sources provide for the subquestion. "
+        "Keep every claim attributed with its citation key, for example [S1]. "
+        "Report facts only; do not add an introduction or conclusion."
+    ),
+    variable="Length: at most {max_words} words.\n\nResearch Question: {question}\nSubquestion: {subquestion}\n\nSources:\n{sources}",
+))
+
+
+# --- benchmark -----------------------------------------------------------------
+
+def _first_token_ms(http: Any, api_url: str, messages: List[Dict[str, str]], max_tokens: int = 8) -> float:
+    import time
+
+    from streaming import iter_sse_content
+
+    payload = {"model": "local-model", "messages": messages, "temperature": 0.3, "max_tokens": max_tokens,
+               "stream": True}
+    start = time.perf_counter()
+    response = http.post(api_url, json=payload, timeout=300, stream=True)
+    try:
+        for _ in iter_sse_content(response):
+            return (time.perf_counter() - start) * 1000
+    finally:
+        response.close()
+    return (time.perf_counter() - start) * 1000
+
+
+def _benchmark(api_url: Optional[str] = None, calls: int = 6, prefill_tps: float = 800.0) -> None:
+    """
+    Time-to-first-token for consecutive planner and report prompts (different questions,
+    similar-sized materials) in both layouts. Without --api-url, a stub that charges prefill
+    time only for the uncached part of each prompt stands in for LM Studio.
+    """
+    import statistics
+
+    from http_transport import HTTPTransport
+
+    server = stub = None
+    if api_url is None:
+        from stub_servers import StubConfig, start_stub_servers
+
+        stub = StubConfig(prefill_tokens_per_second=prefill_tps, prefix_cache_slots=1)
+        server, search = start_stub_servers(stub)
+        search.shutdown()
+        api_url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    http = HTTPTransport()
+    topics = ["AI in healthcare diagnostics", "Remote work and productivity", "Coral reef bleaching",
+              "Battery recycling economics", "Urban heat islands", "Microplastics in drinking water"]
+    source = "Topic: {t}\nSource: Example source {i}\nContent: Findings about {t} from study {i}.\nCitation: [S{i}]"
+
+    def values(name: str, topic: str) -> Dict[str, Any]:
+        if name == "report":
+            return {"question": topic, "materials": "\n\n".join(source.format(t=topic, i=i) for i in range(1, 9))}
+        return {"question": topic}
+
+    for name in ("planner", "report"):
+        template = get_prompt(name)
+        static = len(template.system) + len(template.instructions) + sum(len(a) + len(b) for a, b in template.examples)
+        print(f"{name} ({template.fingerprint}): {static} static chars, {calls} calls per layout")
+        for layout in ("variable_first", "static_first"):
+            if stub is not None:
+                stub.reset_prefix_cache()  # every layout starts cold
+            timings = [
+                _first_token_ms(http, api_url, template.messages(layout, **values(name, topics[n % len(topics)])))
+                for n in range(calls)
+            ]
+            warm = timings[1:] or timings
+            print(f"  {layout:<15} first call {timings[0]:7.1f} ms   later calls median {statistics.median(warm):7.1f} ms")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prefix-cache TTFT benchmark for the registered prompts")
+    parser.add_argument("--api-url", help="LM Studio chat completions URL (default: local stub)")
+    parser.add_argument("--calls", type=int, default=6)
+    parser.add_argument("--prefill-tps", type=float, default=800.0, help="Stub prompt processing speed")
+    args = parser.parse_args()
+    _benchmark(args.api_url, args.calls, args.prefill_tps)
@@ -0,0 +1,137 @@
+"""
+query_dedup.py
+
+Near-duplicate subquestion detection.
+The planner often produces paraphrases of the same subquestion; grouping them with a fast
+lexical similarity pass lets SearcherAgent search each group once and share the results.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'with', 'by', 'from', 'is', 'are', 'was', 'were', 'be', 'been',
+    'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'can', 'what', 'which',
+    'who', 'when', 'where', 'why', 'how', 'this', 'that', 'these', 'those',
+    'its', 'their', 'there', 'main', 'key'
+}
+
+
+def _content_words(text: str) -> List[str]:
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS]
+
+
+def _shingles(word: str, n: int = 3) -> List[str]:
+    """
+    Character n-gram shingles of one word.
+    Character shingles make morphological variants (economy/economic, trend/trends) overlap.
+    """
+    padded = f" {word} "
+    if len(padded) <= n:
+        return [padded]
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+
+def similarity_matrix(texts: List[str]) -> np.ndarray:
+    """
+    Pairwise TF-IDF cosine similarity of the texts' character shingles.
+    Each shingle is also weighted by the plan-level IDF of the word it comes from, so words
+    that every subquestion repeats (the research topic) barely count and subquestions are
+    compared on what sets them apart. Identical texts still score 1.
+    """
+    docs = [_content_words(t) for t in texts]
+    n_docs = len(texts)
+    word_df: Dict[str, int] = {}
+    for words in docs:
+        for word in set(words):
+            word_df[word] = word_df.get(word, 0) + 1
+    # 1 for a word in a single text, falling towards 0 as it appears in all of them
+    word_weight = {w: math.log((1 + n_docs) / df) / math.log(1 + n_docs) for w, df in word_df.items()}
+
+    vocab: Dict[str, int] = {}
+    rows: List[Dict[int, float]] = []
+    for words in docs:
+        row: Dict[int, float] = {}
+        for word in words:
+            for shingle in _shingles(word):
+                col = vocab.setdefault(shingle, len(vocab))
+                row[col] = row.get(col, 0.0) + word_weight[word]
+        rows.append(row)
+    if not vocab:
+        return np.eye(n_docs)
+
+    tf = np.zeros((n_docs, len(vocab)), dtype=np.float32)
+    for r, row in enumerate(rows):
+        for col, weight in row.items():
+            tf[r, col] = weight
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+    weights = tf * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = weights / norms
+    return unit @ unit.T
+
+
+class DedupResult:
+    """
+    Outcome of a dedup pass: `groups` maps each representative qid to all qids it stands for
+    (itself included); `representative` maps every qid to the qid that is actually searched.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]]):
+        self.groups = groups
+        self.representative = {qid: rep for rep, members in groups.items() for qid in members}
+
+    @property
+    def calls_saved(self) -> int:
+        return sum(len(members) - 1 for members in self.groups.values())
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """Only the groups that actually merged something."""
+        return {rep: members for rep, members in self.groups.items() if len(members) > 1}
+
+
+def group_near_duplicates(items: List[Tuple[str, str]], threshold: float = 0.7,
+                          priorities: Optional[Dict[str, Any]] = None) -> DedupResult:
+    """
+    Group (qid, text) pairs whose similarity is at least `threshold` (single-link clustering).
+    The representative of each group is the member with the best (lowest) priority,
+    falling back to the first one in plan order.
+    """
+    if len(items) < 2:
+        return DedupResult({qid: [qid] for qid, _ in items})
+
+    sims = similarity_matrix([text for _, text in items])
+    parent = list(range(len(items)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows, cols = np.nonzero(np.triu(sims >= threshold, k=1))
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        parent[find(j)] = find(i)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(items)):
+        clusters.setdefault(find(i), []).append(i)
+
+    priorities = priorities or {}
+
+    def rank(i: int) -> Tuple[float, int]:
+        priority = priorities.get(items[i][0])
+        return (priority if isinstance(priority, (int, float)) else float("inf"), i)
+
+    groups: Dict[str, List[str]] = {}
+    for members in sorted(clusters.values(), key=min):
+        rep = min(members, key=rank)
+        groups[items[rep][0]] = [items[i][0] for i in members]
+    return DedupResult(groups)
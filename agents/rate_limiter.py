@@ -0,0 +1,146 @@
+"""
+rate_limiter.py
+
+Rate-limit-aware request scheduling for external APIs (Tavily).
+A token bucket keeps us inside the plan's request quota, and failed calls are retried
+with jittered exponential backoff, honouring Retry-After when the server sends it.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate!r}")
+        capacity = capacity if capacity is not None else max(1.0, rate)
+        if capacity < 1:
+            # A request takes one token, so a smaller bucket could never fill up enough
+            raise ValueError(f"Token bucket capacity must be at least 1, got {capacity!r}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until `tokens` are available and take them.
+        Returns the number of seconds spent waiting (0.0 if not throttled).
+        Raises ValueError if `tokens` exceeds the capacity, since the wait would never end.
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens!r} tokens from a bucket of capacity {self.capacity!r}")
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestScheduler:
+    """
+    Sends HTTP requests through a token bucket with retries and jittered exponential backoff.
+    Retries on 429, 5xx, timeouts and connection errors; other 4xx responses are returned as-is.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, requests_per_second: float = 2.0, burst: Optional[float] = None,
+                 max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.counters = {"calls": 0, "bucket_waits": 0, "rate_limited": 0, "retried": 0, "failed": 0, "succeeded": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": a random delay between 0 and the capped exponential bound
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        """Parse a Retry-After header given either as seconds or as an HTTP date."""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+    def execute(self, send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Call `send` (which performs one HTTP request) under the rate limit, retrying transient failures.
+        Returns the final response; raises the last requests exception if every attempt failed.
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            if self.bucket.acquire() > 0:
+                self._count("bucket_waits")  # waited on our own quota
+            delay = None
+            try:
+                response = send()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUS:
+                    self._count("succeeded" if response.ok else "failed")
+                    return response
+                if response.status_code == 429:
+                    self._count("rate_limited")  # the server pushed back
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    return response
+                delay = self._retry_after(response)
+                if delay is not None:
+                    delay = min(delay, self.max_delay)
+            if delay is None:
+                delay = self._backoff(attempt)
+            self._count("retried")
+            attempt += 1
+            time.sleep(delay)
+
+    def post(self, http: Any, url: str, **kwargs: Any) -> requests.Response:
+        """Convenience wrapper: POST through `http` (an HTTPTransport or requests module) under this scheduler."""
+        return self.execute(lambda: http.post(url, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
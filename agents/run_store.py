@@ -0,0 +1,390 @@
+"""
+run_store.py
+
+Indexed store for research runs (plans, search results and reports).
+Replaces the one-JSON-file-per-plan output with a single SQLite database in WAL mode,
+indexed by question, timestamp and status. Writes go through a background thread so the
+agents never block on disk; artifacts are stored as compressed JSON and can be exported
+to a compact gzip JSON Lines file.
+
+CLI:
+    python run_store.py list [--question TEXT] [--status STATUS] [--limit N]
+    python run_store.py show RUN_ID
+    python run_store.py export OUT.jsonl.gz [--since ISO_DATE] [--status STATUS]
+    python run_store.py import-files [DIR]     # ingest old planner_output_*.json files
+"""
+
+import argparse
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from plan_cache import normalize_prompt
+from structured_logging import get_logger, log_event
+
+logger = get_logger("run_store")
+
+# Run lifecycle in order, plus "failed" for runs that were abandoned
+STATUSES = ("planned", "searched", "reported", "failed")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS runs ("
+    " run_id TEXT PRIMARY KEY,"
+    " question TEXT NOT NULL,"
+    " question_norm TEXT NOT NULL,"
+    " status TEXT NOT NULL,"
+    " created_at REAL NOT NULL,"
+    " updated_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_question ON runs(question_norm)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status, created_at)",
+    "CREATE TABLE IF NOT EXISTS artifacts ("
+    " run_id TEXT NOT NULL,"
+    " kind TEXT NOT NULL,"
+    " created_at REAL NOT NULL,"
+    " payload BLOB NOT NULL,"
+    " PRIMARY KEY (run_id, kind))",
+)
+
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _parse_time(value: Any) -> float:
+    """Accept epoch seconds or an ISO-8601 string (with or without a trailing Z)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and value:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return time.time()
+
+
+class RunStore:
+    """
+    SQLite run store with a single background writer thread.
+    record_* calls only enqueue; flush() waits until everything queued so far is on disk.
+    Reads use their own connection and see committed data (call flush() first to read
+    your own recent writes).
+    """
+
+    def __init__(self, path: str = "runs.sqlite3", batch_size: int = 64):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self.writes = 0
+        self.write_errors = 0
+        self._writer = threading.Thread(target=self._write_loop, name="run-store-writer", daemon=True)
+        self._writer.start()
+
+    # --- background writer -------------------------------------------------
+
+    def _write_loop(self) -> None:
+        conn = sqlite3.connect(self.path, isolation_level=None)  # transactions are managed explicitly
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            op = self._queue.get()
+            batch = [op]
+            # Group whatever else is already queued into the same transaction
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            try:
+                conn.execute("BEGIN")
+                for item in batch:
+                    if item is None:
+                        stop = True
+                        continue
+                    # Each write gets its own savepoint, so a failing one does not undo the rest of the batch
+                    conn.execute("SAVEPOINT item")
+                    try:
+                        self._apply(conn, *item)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO item")
+                        self.write_errors += 1
+                        log_event(logger, logging.ERROR, "Run store write failed", action=item[0], run_id=item[1],
+                                  error=repr(e))
+                    else:
+                        self.writes += 1
+                    conn.execute("RELEASE item")
+                conn.execute("COMMIT")
+            except Exception as e:
+                # The transaction itself failed (disk full, locked database): the whole batch is lost
+                self.write_errors += 1
+                log_event(logger, logging.ERROR, "Run store batch failed", writes=len(batch), error=repr(e))
+                if conn.in_transaction:
+                    try:
+                        conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                conn.close()
+                return
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, action: str, run_id: str, data: Dict[str, Any]) -> None:
+        now = data.get("at", time.time())
+        if action == "run":
+            conn.execute(
+                "INSERT INTO runs (run_id, question, question_norm, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                (run_id, data["question"], normalize_prompt(data["question"]), data["status"], data["created_at"], now),
+            )
+        elif action == "artifact":
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (run_id, kind, created_at, payload) VALUES (?, ?, ?, ?)",
+                (run_id, data["kind"], now, data["payload"]),
+            )
+            if data.get("status"):
+                conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                             (data["status"], now, run_id))
+        elif action == "status":
+            conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (data["status"], now, run_id))
+
+    def _enqueue(self, action: str, run_id: str, **data: Any) -> None:
+        if self._closed:
+            raise RuntimeError("RunStore is closed")
+        data.setdefault("at", time.time())
+        self._queue.put((action, run_id, data))
+
+    # --- writes (non-blocking) ---------------------------------------------
+
+    def record_plan(self, plan: Dict[str, Any]) -> str:
+        """Create the run for a planner JSON (its question_id is the run ID) and store the plan."""
+        run_id = plan["question_id"]
+        created_at = _parse_time(plan.get("metadata", {}).get("created_at"))
+        self._enqueue("run", run_id, question=plan.get("original_prompt", ""), status="planned", created_at=created_at)
+        self._enqueue("artifact", run_id, kind="plan", payload=_pack(plan))
+        return run_id
+
+    def record_search(self, run_id: str, search_results: Dict[str, List[Dict[str, Any]]]) -> None:
+        self._enqueue("artifact", run_id, kind="search", payload=_pack(search_results), status="searched")
+
+    def record_report(self, run_id: str, report: str) -> None:
+        self._enqueue("artifact", run_id, kind="report", payload=_pack(report), status="reported")
+
+    def set_status(self, run_id: str, status: str) -> None:
+        if status not in STATUSES:
+            raise ValueError(f"Unknown run status {status!r}; expected one of {', '.join(STATUSES)}")
+        self._enqueue("status", run_id, status=status)
+
+    def flush(self) -> None:
+        """Block until every write queued so far has been committed."""
+        self._queue.join()
+
+    # --- reads ---------------------------------------------------------------
+
+    def find_runs(self, question: Optional[str] = None, status: Optional[str] = None,
+                  since: Any = None, until: Any = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Newest runs first, filtered by normalized question, status and creation time."""
+        clauses, args = [], []
+        if question:
+            clauses.append("question_norm = ?")
+            args.append(normalize_prompt(question))
+        if status:
+            clauses.append("status = ?")
+            args.append(status)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            args.append(_parse_time(since))
+        if until is not None:
+            clauses.append("created_at < ?")
+            args.append(_parse_time(until))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT run_id, question, status, created_at, updated_at FROM runs"
+                f"{where} ORDER BY created_at DESC LIMIT ?", (*args, limit),
+            ).fetchall()
+        return [
+            {"run_id": r[0], "question": r[1], "status": r[2], "created_at": r[3], "updated_at": r[4]}
+            for r in rows
+        ]
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """The run row plus its decoded artifacts (plan, search, report) where present."""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT run_id, question, status, created_at, updated_at FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            artifacts = self._read_conn.execute(
+                "SELECT kind, payload FROM artifacts WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        run = {"run_id": row[0], "question": row[1], "status": row[2], "created_at": row[3], "updated_at": row[4]}
+        for kind, payload in artifacts:
+            run[kind] = _unpack(payload)
+        return run
+
+    def get_plan(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT payload FROM artifacts WHERE run_id = ? AND kind = 'plan'", (run_id,)
+            ).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def iter_runs(self, status: Optional[str] = None, since: Any = None) -> Iterator[Dict[str, Any]]:
+        """Every matching run with its artifacts, oldest first, read in pages."""
+        last_created, last_id = -1.0, ""
+        floor = _parse_time(since) if since is not None else None
+        while True:
+            clauses = ["(created_at > ? OR (created_at = ? AND run_id > ?))"]
+            args: List[Any] = [last_created, last_created, last_id]
+            if status:
+                clauses.append("status = ?")
+                args.append(status)
+            if floor is not None:
+                clauses.append("created_at >= ?")
+                args.append(floor)
+            with self._read_lock:
+                rows = self._read_conn.execute(
+                    f"SELECT run_id, created_at FROM runs WHERE {' AND '.join(clauses)}"
+                    " ORDER BY created_at, run_id LIMIT 500", args,
+                ).fetchall()
+            if not rows:
+                return
+            for run_id, created_at in rows:
+                run = self.get_run(run_id)
+                if run is not None:
+                    yield run
+            last_id, last_created = rows[-1][0], rows[-1][1]
+
+    def export(self, out_path: str, status: Optional[str] = None, since: Any = None) -> int:
+        """Write runs as gzip-compressed JSON Lines (one compact object per run); returns the count."""
+        self.flush()
+        count = 0
+        with gzip.open(out_path, "wt", encoding="utf-8") as out:
+            for run in self.iter_runs(status=status, since=since):
+                out.write(json.dumps(run, ensure_ascii=False, separators=(",", ":")) + "\n")
+                count += 1
+        return count
+
+    def import_plan_files(self, directory: str = ".", remove: bool = False) -> int:
+        """Ingest legacy planner_output_*.json files; optionally delete them once stored."""
+        paths = sorted(glob.glob(os.path.join(directory, "planner_output_*.json")))
+        imported = []
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    plan = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if not isinstance(plan, dict) or "question_id" not in plan:
+                continue
+            self.record_plan(plan)
+            imported.append(path)
+        self.flush()
+        if remove and not self.write_errors:
+            for path in imported:
+                os.remove(path)
+        return len(imported)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._read_lock:
+            by_status = dict(self._read_conn.execute("SELECT status, COUNT(*) FROM runs GROUP BY status").fetchall())
+        return {"runs": sum(by_status.values()), "by_status": by_status, "pending_writes": self._queue.qsize(),
+                "writes": self.writes, "write_errors": self.write_errors}
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._read_conn.close()
+
+
+_shared_store: Optional[RunStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_run_store() -> RunStore:
+    """
+    Return the process-wide run store (path from ODR_RUN_STORE, default runs.sqlite3).
+    """
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = RunStore(os.environ.get("ODR_RUN_STORE", "runs.sqlite3"))
+            # Drain queued writes before the interpreter exits (the writer is a daemon thread)
+            atexit.register(_shared_store.close)
+        return _shared_store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query and export the research run store.")
+    parser.add_argument("--db", default=os.environ.get("ODR_RUN_STORE", "runs.sqlite3"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="list recent runs")
+    list_cmd.add_argument("--question")
+    list_cmd.add_argument("--status", choices=STATUSES)
+    list_cmd.add_argument("--limit", type=int, default=20)
+    show_cmd = sub.add_parser("show", help="print one run with its artifacts as JSON")
+    show_cmd.add_argument("run_id")
+    export_cmd = sub.add_parser("export", help="export runs to gzip JSON Lines")
+    export_cmd.add_argument("out")
+    export_cmd.add_argument("--since")
+    export_cmd.add_argument("--status", choices=STATUSES)
+    import_cmd = sub.add_parser("import-files", help="ingest legacy planner_output_*.json files")
+    import_cmd.add_argument("directory", nargs="?", default=".")
+    import_cmd.add_argument("--remove", action="store_true", help="delete the files after importing")
+    args = parser.parse_args()
+
+    store = RunStore(args.db)
+    try:
+        if args.command == "list":
+            for run in store.find_runs(question=args.question, status=args.status, limit=args.limit):
+                created = datetime.fromtimestamp(run["created_at"], timezone.utc).isoformat(timespec="seconds")
+                print(f"{run['run_id']}  {created}  {run['status']:<9} {run['question'][:70]}")
+        elif args.command == "show":
+            run = store.get_run(args.run_id)
+            print(json.dumps(run, indent=2, ensure_ascii=False) if run else f"No run {args.run_id}")
+        elif args.command == "export":
+            print(f"Exported {store.export(args.out, status=args.status, since=args.since)} runs to {args.out}")
+        elif args.command == "import-files":
+            print(f"Imported {store.import_plan_files(args.directory, remove=args.remove)} plan files")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+salvage.py
+
+Recovery of the generated text from truncated or malformed LM Studio responses.
+When a chat completion body is cut off (read timeout, dropped connection) or is not valid
+JSON, PartialResponseDecoder pulls out the assistant text anyway: it decodes every
+`"content"` string of a chat-completion body (including SSE `delta` chunks and a string
+that never closes, with escapes handled) and keeps only the assistant turn of raw ChatML
+(`<|im_start|>assistant ... <|im_end|>`). Text is fed in arbitrary chunks and every
+character is examined a bounded number of times, so the cost is linear in the body length
+whatever it contains; no backtracking regexes run over the body.
+"""
+
+import json
+import re
+from multiprocessing import Queue
+from typing import Dict, List, Optional, Tuple
+
+IM_START = "<|im_start|>"
+IM_END = "<|im_end|>"
+_ASSISTANT = "assistant"
+# Longest marker fragment that can be split across two chunks
+_MARKER_TAIL = len(IM_START) + len(_ASSISTANT)
+
+# Characters that end a run of plain string content
+_STRING_STOP = re.compile(r'["\\]')
+_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+_SIMPLE_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# Scanner states
+_OUTSIDE, _SKIP_STRING, _AFTER_KEY, _AFTER_COLON, _CONTENT = range(5)
+_KEY_MAX_RAW = 16  # strings longer than this cannot be the "content" key
+
+
+def _unescape(raw: str) -> str:
+    """Decode the body of a JSON string; invalid escapes are kept as the escaped character."""
+    try:
+        return json.loads(f'"{raw}"', strict=False)
+    except json.JSONDecodeError:
+        def replace(match: "re.Match[str]") -> str:
+            code = match.group(1)
+            return chr(int(code[1:], 16)) if len(code) == 5 else _SIMPLE_ESCAPES.get(code, code)
+        # Rejoin surrogate pairs decoded one escape at a time
+        return _ESCAPE.sub(replace, raw).encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+
+
+def _is_high_surrogate_escape(text: str, i: int) -> bool:
+    return text[i + 1:i + 2] == "u" and text[i + 2:i + 4].lower() in ("d8", "d9", "da", "db")
+
+
+class PartialResponseDecoder:
+    """
+    Incremental decoder for (possibly truncated) LM Studio response bodies.
+    A body starting with "{" or "data:" is scanned as chat-completion JSON, anything else as
+    raw model output. `feed` returns the content decoded from each chunk; `text` is the
+    assistant text recovered so far, cut to the assistant turn when ChatML markers appear.
+    """
+
+    def __init__(self):
+        self.mode: Optional[str] = None  # "json" or "chatml", decided by the first non-blank text
+        self.found = False  # a "content" value (json) or an assistant turn (chatml) was seen
+        self.complete = False  # the last content string was closed
+        self._state = _OUTSIDE
+        self._pending = ""  # unconsumed tail (partial escape, key or marker) carried to the next chunk
+        self._decoded: List[str] = []
+        self._decoded_len = 0
+        self._marker_tail = ""
+        self._turn_start: Optional[int] = None
+        self._turn_end: Optional[int] = None
+
+    # --- public -----------------------------------------------------------------
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk of the body and return the content it added."""
+        if self.mode is None:
+            head = (self._pending + chunk).lstrip()
+            if not head or (head[0] == "d" and len(head) < 5):
+                self._pending += chunk
+                return ""
+            self.mode = "json" if head[0] == "{" or head.startswith("data:") else "chatml"
+            chunk, self._pending = self._pending + chunk, ""
+        if self.mode == "chatml":
+            return self._emit(chunk)
+        return self._scan_json(chunk)
+
+    @property
+    def text(self) -> str:
+        """The recovered assistant text ("" if none was found)."""
+        if not self._decoded:
+            return ""
+        decoded = "".join(self._decoded)
+        start = self._turn_start
+        if start is None:
+            if self.mode == "chatml":
+                return ""  # raw output without an assistant turn is not a reply
+            start = 0
+        elif decoded.startswith("\n", start):
+            start += 1  # the newline that ends the assistant header
+        return decoded[start:self._turn_end]
+
+    # --- chat-completion JSON -------------------------------------------------------
+
+    def _scan_json(self, chunk: str) -> str:
+        text = self._pending + chunk
+        self._pending = ""
+        out: List[str] = []
+        i, n = 0, len(text)
+        while i < n:
+            state = self._state
+            if state == _OUTSIDE:
+                i = text.find('"', i)
+                if i == -1:
+                    break
+                i += 1
+                key_start = i
+                # Keys are short, so they are carried whole until their closing quote arrives
+                end = self._string_end(text, i, _KEY_MAX_RAW)
+                if end is None:
+                    self._pending = text[key_start - 1:]
+                    break
+                if end < 0:
+                    self._state = _SKIP_STRING
+                    i = -end
+                    continue
+                is_content = end - key_start == len("content") and text[key_start:end] == "content"
+                self._state = _AFTER_KEY if is_content else _OUTSIDE
+                i = end + 1
+            elif state == _SKIP_STRING:
+                i, closed = self._skip_string(text, i)
+                if not closed:
+                    self._pending = text[i:]
+                    break
+                self._state = _OUTSIDE
+            elif state in (_AFTER_KEY, _AFTER_COLON):
+                while i < n and text[i] in " \t\r\n":
+                    i += 1
+                if i == n:
+                    break
+                if state == _AFTER_KEY:
+                    # "content" followed by ":" is a key; otherwise it was a value
+                    if text[i] == ":":
+                        self._state = _AFTER_COLON
+                        i += 1
+                    else:
+                        self._state = _OUTSIDE
+                elif text[i] == '"':
+                    self._state = _CONTENT
+                    self.found = True
+                    self.complete = False
+                    i += 1
+                else:
+                    self._state = _OUTSIDE  # null or another non-string value
+            else:  # _CONTENT
+                i, piece, closed = self._content_run(text, i)
+                if piece:
+                    out.append(self._emit(piece))
+                if closed:
+                    self._state = _OUTSIDE
+                    self.complete = True
+                elif i < n:
+                    self._pending = text[i:]  # escape cut off by the chunk boundary
+                    break
+        return "".join(out)
+
+    @staticmethod
+    def _string_end(text: str, i: int, limit: int) -> Optional[int]:
+        """
+        Index of the closing quote of the string starting at `i`, None if the text ends first,
+        or minus the scan position once more than `limit` raw characters were seen.
+        """
+        n = len(text)
+        start = i
+        while i < n:
+            if i - start > limit:
+                return -i
+            ch = text[i]
+            if ch == '"':
+                return i
+            if ch == "\\" and i + 1 == n:
+                break
+            i += 2 if ch == "\\" else 1
+        return -i if i - start > limit else None
+
+    @staticmethod
+    def _skip_string(text: str, i: int) -> Tuple[int, bool]:
+        """
+        Skip string content from `i`. Returns (index, closed): just after the closing quote,
+        or where the text ends (before a trailing backslash, which must be carried over).
+        """
+        n = len(text)
+        while True:
+            match = _STRING_STOP.search(text, i)
+            if match is None:
+                return n, False
+            i = match.start()
+            if text[i] == '"':
+                return i + 1, True
+            if i + 1 == n:
+                return i, False
+            i += 2
+
+    @staticmethod
+    def _content_run(text: str, i: int) -> Tuple[int, str, bool]:
+        """
+        Decode content from `i` up to the closing quote, the end of the text, or an escape
+        the text cuts short. Returns (next index, decoded text, closed).
+        """
+        n = len(text)
+        start = i
+        while True:
+            match = _STRING_STOP.search(text, i)
+            if match is None:
+                i = n
+                break
+            i = match.start()
+            if text[i] == '"':
+                return i + 1, _unescape(text[start:i]), True
+            # Backslash: wait until the whole escape, and a surrogate pair's second half, is here
+            size = 2
+            if text[i + 1:i + 2] == "u":
+                size = 12 if _is_high_surrogate_escape(text, i) else 6
+                if size == 12 and i + 8 <= n and text[i + 6:i + 8] != "\\u":
+                    size = 6  # lone high surrogate
+            if i + size > n:
+                break
+            i += size
+        return i, _unescape(text[start:i]), False
+
+    # --- ChatML turns -------------------------------------------------------------
+
+    def _emit(self, piece: str) -> str:
+        """Append decoded text and track the ChatML markers in it."""
+        offset = self._decoded_len - len(self._marker_tail)
+        window = self._marker_tail + piece
+        self._decoded.append(piece)
+        self._decoded_len += len(piece)
+        pos = window.find("<|im_")
+        while pos != -1:
+            absolute = offset + pos
+            if window.startswith(IM_END, pos):
+                if pos + len(IM_END) > len(self._marker_tail) and self._turn_end is None:
+                    self._turn_end = absolute
+            elif window.startswith(IM_START, pos):
+                after = pos + len(IM_START)
+                role = window[after:after + len(_ASSISTANT)]
+                if role == _ASSISTANT and after + len(_ASSISTANT) > len(self._marker_tail):
+                    self._turn_start, self._turn_end = offset + after + len(_ASSISTANT), None
+                    self.found = True
+                elif after > len(self._marker_tail) and self._turn_start is not None and self._turn_end is None:
+                    self._turn_end = absolute  # a new turn begins; the assistant turn ends here
+            pos = window.find("<|im_", pos + 1)
+        self._marker_tail = window[-_MARKER_TAIL:]
+        return piece
+
+
+def salvage_content(body: str) -> str:
+    """Assistant text recovered from a whole (possibly truncated) response body, stripped."""
+    decoder = PartialResponseDecoder()
+    decoder.feed(body)
+    return decoder.text.strip()
+
+
+# --- benchmark -----------------------------------------------------------------
+
+# The regex chain WriterAgent._call_lm_studio used to run over a failed body, in order
+_LEGACY_PATTERNS = [
+    r'"content":\s*"((?:[^"\\]|\\.)*)"',
+    r'"content":\s*"([^"]*(?:\\.[^"]*)*)"',
+    r'"content":\s*"(.+?)"(?=\s*,|\s*})',
+    r'<\|im_start\|>assistant\n(.*?)<\|im_end\|>',
+    r'([A-Z][^.!?]*[.!?](?:\s+[A-Z][^.!?]*[.!?]){2,})',
+    r'([A-Z][^.!?]*[.!?]\s+[A-Z][^.!?]*[.!?])',
+]
+
+
+def _legacy_salvage(body: str) -> str:
+    for pattern in _LEGACY_PATTERNS:
+        match = re.search(pattern, body, re.DOTALL)
+        if match and len(match.group(1)) > 100:
+            return match.group(1)
+    return ""
+
+
+def _legacy_worker(body: str, result: "Queue[float]") -> None:
+    import time
+
+    start = time.perf_counter()
+    _legacy_salvage(body)
+    result.put(time.perf_counter() - start)
+
+
+def _adversarial_bodies(size: int = 100_000) -> Dict[str, str]:
+    """Bodies of about `size` characters that are slow for backtracking regexes."""
+    opening = '{"id":"chatcmpl-1","object":"chat.completion","choices":[{"index":0,"message":{"role":"assistant","content":"'
+    paragraph = ("Artificial intelligence systems now assist clinicians in reading scans, and the "
+                 "evidence suggests \\\"measurable gains\\\" in sensitivity.\\n\\n")
+    return {
+        "truncated report": (opening + paragraph * (size // len(paragraph)))[:size],
+        "escape run": (opening + "\\\\x" * size)[:size],
+        "repeated content keys": ('{"content": "x' * size)[:size],
+        "open ChatML turns": ("<|im_start|>assistant\n" * size)[:size],
+        "unpunctuated text": ("Word " * size)[:size],
+    }
+
+
+def _benchmark(size: int = 100_000, legacy_timeout: float = 10.0, chunk_size: int = 8192) -> None:
+    """
+    Time PartialResponseDecoder (fed in `chunk_size` pieces, as a streamed body is read)
+    against the old regex chain on adversarial bodies. The regexes run in a child process
+    that is stopped after `legacy_timeout` seconds.
+    """
+    import multiprocessing
+    import time
+
+    for name, body in _adversarial_bodies(size).items():
+        start = time.perf_counter()
+        decoder = PartialResponseDecoder()
+        for i in range(0, len(body), chunk_size):
+            decoder.feed(body[i:i + chunk_size])
+        recovered = decoder.text
+        decoder_ms = (time.perf_counter() - start) * 1000
+
+        result: "Queue[float]" = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=_legacy_worker, args=(body, result), daemon=True)
+        worker.start()
+        worker.join(legacy_timeout)
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+            legacy = f"> {legacy_timeout:.0f} s (stopped)"
+        else:
+            legacy = f"{result.get() * 1000:9.1f} ms"
+        print(f"{name:<22} {len(body) / 1000:5.0f} KB   decoder {decoder_ms:6.1f} ms "
+              f"({len(recovered):6d} chars recovered)   regexes {legacy}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Salvage decoder vs the old regexes on adversarial bodies")
+    parser.add_argument("--size", type=int, default=100_000, help="Body size in characters")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Time limit for the regex chain per body")
+    args = parser.parse_args()
+    _benchmark(args.size, args.timeout)
@@ -0,0 +1,107 @@
+"""
+search_backends.py
+
+Pluggable search backends for SearcherAgent.
+Every backend returns the same source dicts: title, url, content (snippet) and score.
+"""
+
+import abc
+import os
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from http_transport import HTTPTransport, get_transport, tavily_search_url
+from rate_limiter import RequestScheduler
+
+
+class SearchBackendError(Exception):
+    """Raised by a backend when a search cannot be completed."""
+
+
+class SearchBackend(abc.ABC):
+    """
+    Base class for search backends. Subclasses implement search().
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5,
+               include_domains: Optional[List[str]] = None,
+               exclude_domains: Optional[List[str]] = None,
+               include_raw_content: bool = False) -> List[Dict[str, Any]]:
+        """Return up to `max_results` source dicts for `query`."""
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend-specific counters (empty by default)."""
+        return {}
+
+
+class TavilyBackend(SearchBackend):
+    """
+    Tavily web search, sent through the shared HTTP transport and the rate-limit-aware scheduler.
+    """
+
+    name = "tavily"
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 http: Optional[HTTPTransport] = None,
+                 scheduler: Optional[RequestScheduler] = None, timeout: float = 30):
+        self.api_key = api_key
+        self.base_url = base_url or tavily_search_url()
+        self.http = http if http is not None else get_transport()
+        # Token-bucket rate limiting plus retries with backoff for transient 429/5xx errors
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.timeout = timeout
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5,
+               include_domains: Optional[List[str]] = None,
+               exclude_domains: Optional[List[str]] = None,
+               include_raw_content: bool = False) -> List[Dict[str, Any]]:
+        payload = {
+            "api_key": self.api_key,
+            "query": query,
+            "search_depth": search_depth,
+            "include_images": False,
+            "include_answer": False,
+            "include_raw_content": include_raw_content,
+            "max_results": max_results,
+            "include_domains": include_domains or [],
+            "exclude_domains": exclude_domains or []
+        }
+        try:
+            response = self.scheduler.post(self.http, self.base_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise SearchBackendError(str(e)) from e
+
+        sources = []
+        for result in data.get("results", []):
+            source = {
+                "title": result.get("title", ""),
+                "url": result.get("url", ""),
+                "content": result.get("content", ""),
+                "score": result.get("score", 0.0)
+            }
+            if include_raw_content and result.get("raw_content"):
+                source["raw_content"] = result["raw_content"]
+            sources.append(source)
+        return sources
+
+    def stats(self) -> Dict[str, Any]:
+        return self.scheduler.stats()
+
+
+def backend_from_env(api_key: str, http: Optional[HTTPTransport] = None,
+                     scheduler: Optional[RequestScheduler] = None) -> SearchBackend:
+    """
+    Pick the backend from the environment:
+    ODR_SEARCH_BACKEND=local with ODR_LOCAL_INDEX=<index path> selects the offline BM25 engine,
+    anything else uses Tavily.
+    """
+    if os.environ.get("ODR_SEARCH_BACKEND", "tavily").lower() == "local":
+        from local_search import LocalBM25Backend
+        return LocalBM25Backend(os.environ.get("ODR_LOCAL_INDEX", "local_index.sqlite3"))
+    return TavilyBackend(api_key, http=http, scheduler=scheduler)
@@ -0,0 +1,147 @@
+"""
+search_cache.py
+
+Persistent SQLite-backed cache for search results.
+Entries are keyed by the normalized query plus the search parameters, expire after a TTL,
+and are evicted least-recently-used once the cache grows past its size bound.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class SearchCache:
+    """
+    On-disk cache of search results with TTL expiry, LRU eviction and hit/miss counters.
+    Safe to share between threads (e.g. the concurrent searches in SearcherAgent.search_all).
+    """
+
+    def __init__(self, path: str = "search_cache.sqlite3", ttl_seconds: float = 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY,"
+            " query TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_access ON search_cache(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Lowercase and collapse whitespace so trivially different queries share an entry."""
+        return re.sub(r"\s+", " ", query.strip().lower())
+
+    @classmethod
+    def make_key(cls, query: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Build the cache key from the normalized query and the search parameters.
+        List parameters (e.g. include/exclude domains) are sorted so ordering does not matter.
+        """
+        normalized_params = {}
+        for name, value in (params or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                value = sorted(str(v).lower() for v in value)
+            normalized_params[name] = value
+        raw = json.dumps([cls.normalize_query(query), normalized_params], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return cached results for the query, or None on a miss or an expired entry.
+        """
+        key = self.make_key(query, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, query: str, results: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Store results for the query and evict the least recently used entries past max_entries.
+        """
+        key = self.make_key(query, params)
+        now = time.time()
+        payload = json.dumps(results, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, payload, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, self.normalize_query(query), payload, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            if self.max_entries and count > self.max_entries:
+                excess = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM search_cache WHERE key IN "
+                    "(SELECT key FROM search_cache ORDER BY last_access ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete all expired entries and return how many were removed."""
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM search_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
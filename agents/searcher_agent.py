@@ -1,87 +1,374 @@
 import requests
+import asyncio
+import contextvars
 import json
-from typing import List, Dict, Any
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, AsyncIterator, Iterable, Iterator, Optional, Tuple
+from adaptive_search import AdaptiveSearchPolicy
+from content_fetcher import ContentFetcher
+from http_transport import HTTPTransport, get_transport
 from planner_agent import PlannerAgent
+from query_dedup import DedupResult, group_near_duplicates, similarity_matrix
+from rate_limiter import RequestScheduler
+from search_backends import SearchBackend, SearchBackendError, backend_from_env
+from search_cache import SearchCache
+from structured_logging import configure_logging, get_logger, log_event, sources_enabled
+
+logger = get_logger("searcher")
 
 class SearcherAgent:
     """
-    Searcher Agent: Uses Tavily API to retrieve relevant, up-to-date content for each subquestion.
+    Searcher Agent: Uses a search backend (Tavily API by default, or the offline local BM25 index)
+    to retrieve relevant, up-to-date content for each subquestion.
     """
 
-    def __init__(self, api_key: str = "ENTER_YOUR_TAVILY_API_KEY_HERE"): # Replace with your Tavily API key
+    def __init__(self, api_key: str = "ENTER_YOUR_TAVILY_API_KEY_HERE", max_workers: int = 4,
+                 cache: Optional[SearchCache] = None, use_cache: bool = True,
+                 http: Optional[HTTPTransport] = None,
+                 scheduler: Optional[RequestScheduler] = None,
+                 backend: Optional[SearchBackend] = None,
+                 fetch_content: bool = False,
+                 fetcher: Optional[ContentFetcher] = None,
+                 dedupe_threshold: Optional[float] = 0.7,
+                 adaptive: Optional[AdaptiveSearchPolicy] = None): # Replace with your Tavily API key
         self.api_key = api_key
-        self.base_url = "https://api.tavily.com/search"
+        self.http = http if http is not None else get_transport()
+        # Where searches go; defaults to Tavily unless ODR_SEARCH_BACKEND selects the local index
+        self.backend = backend if backend is not None else backend_from_env(api_key, http=self.http, scheduler=scheduler)
+        # Persistent result cache; pass use_cache=False to always hit the backend
+        self.cache = cache if cache is not None else (SearchCache() if use_cache else None)
+        # Optional stage that downloads each result page and attaches its main text as raw_content
+        self.fetcher = fetcher if fetcher is not None else (ContentFetcher(http=self.http) if fetch_content else None)
+        self._owns_fetcher = fetcher is None and self.fetcher is not None
+        # Number of subquestions searched at once by search_all (1 = sequential)
+        self.max_workers = max(1, max_workers)
+        # Per-subquestion latency (seconds) from the most recent search_all run
+        self.last_latencies: Dict[str, float] = {}
+        # Subquestions at least this similar are searched once and share results (None disables)
+        self.dedupe_threshold = dedupe_threshold
+        self.last_dedup: Optional[DedupResult] = None
+        # When set, search basic depth first and escalate only for weakly scored results
+        self.adaptive = adaptive
 
-    def search_subquestion(self, subquestion: str) -> List[Dict[str, Any]]:
+    def _search_backend(self, subquestion: str, search_depth: str, max_results: int) -> Tuple[List[Dict[str, Any]], bool]:
         """
-        Search for relevant sources using Tavily API for a single subquestion.
-        Returns a list of source dictionaries with title, url, content (snippet), and score.
+        Run one backend search through the cache. Returns (sources, served_from_cache).
         """
-        payload = {
-            "api_key": self.api_key,
-            "query": subquestion,
-            "search_depth": "advanced",
-            "include_images": False,
-            "include_answer": False,
-            "include_raw_content": False,
-            "max_results": 5,
+        params = {
+            "search_depth": search_depth,
+            "max_results": max_results,
             "include_domains": [],
-            "exclude_domains": []
+            "exclude_domains": [],
+            "include_raw_content": False
         }
 
+        # Backend name is part of the key so Tavily and local results never mix
+        cache_params = dict(params, backend=self.backend.name)
+        if self.cache is not None:
+            cached = self.cache.get(subquestion, cache_params)
+            if cached is not None:
+                return cached, True
+
         try:
-            response = requests.post(self.base_url, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            results = data.get("results", [])
-            sources = []
-            for result in results:
-                sources.append({
-                    "title": result.get("title", ""),
-                    "url": result.get("url", ""),
-                    "content": result.get("content", ""),
-                    "score": result.get("score", 0.0)
-                })
+            sources = self.backend.search(subquestion, **params)
+        except (SearchBackendError, requests.RequestException) as e:
+            log_event(logger, logging.WARNING, "Search failed", query=subquestion, error=str(e))
+            return [], False
+        if self.cache is not None:
+            self.cache.put(subquestion, sources, cache_params)
+        return sources, False
+
+    def _adaptive_search(self, subquestion: str) -> List[Dict[str, Any]]:
+        """
+        Basic-depth search first; escalate to advanced depth with more results only when
+        the basic scores fall below the policy thresholds.
+        """
+        policy = self.adaptive
+        start = time.perf_counter()
+        sources, basic_cached = self._search_backend(subquestion, "basic", policy.basic_max_results)
+        basic_latency = time.perf_counter() - start
+        if not policy.should_escalate(sources):
+            if not basic_cached:
+                policy.record(basic_latency)
             return sources
-        except requests.RequestException as e:
-            print(f"Error searching for '{subquestion}': {e}")
-            return []
 
-    def search_all(self, subquestions: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        start = time.perf_counter()
+        advanced, advanced_cached = self._search_backend(subquestion, "advanced", policy.escalated_max_results)
+        if not (basic_cached or advanced_cached):
+            policy.record(basic_latency, time.perf_counter() - start)
+        return advanced or sources
+
+    def search_subquestion(self, subquestion: str, search_depth: Optional[str] = None,
+                           max_results: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Search for relevant sources using the configured backend for a single subquestion.
+        Returns a list of source dictionaries with title, url, content (snippet), and score.
+        Uses the adaptive policy when one is configured and no explicit depth/count is given.
+        """
+        if self.adaptive is not None and search_depth is None and max_results is None:
+            return self._adaptive_search(subquestion)
+        sources, _ = self._search_backend(subquestion, search_depth or "advanced", max_results or 5)
+        return sources
+
+    def _timed_search(self, qid: str, text: str) -> Tuple[str, List[Dict[str, Any]], float]:
+        """
+        Run a single subquestion search and measure its wall-clock latency.
+        """
+        start = time.perf_counter()
+        sources = self.search_subquestion(text)
+        return qid, sources, time.perf_counter() - start
+
+    def _log_sources(self, qid: str, sources: List[Dict[str, Any]]) -> None:
+        """
+        Log the result count for one subquestion, plus every source when ODR_LOG_SOURCES is set.
+        """
+        log_event(logger, logging.INFO, "Subquestion results", qid=qid, sources=len(sources),
+                  latency_ms=round(self.last_latencies.get(qid, 0.0) * 1000, 1))
+        if not sources_enabled(logger):
+            return
+        for i, source in enumerate(sources, 1):
+            log_event(logger, logging.DEBUG, "Source", qid=qid, rank=i, title=source['title'],
+                      url=source['url'], score=source['score'], content=source['content'][:300])
+
+    @staticmethod
+    def _subquestion_items(subquestions: List[Any]) -> List[Tuple[str, str]]:
+        """
+        Normalize a subquestion list (dicts or plain strings) into (qid, text) pairs.
+        """
+        items = []
+        for i, subq in enumerate(subquestions):
+            if isinstance(subq, dict):
+                items.append((subq.get("id", f"q{i+1}"), subq.get("text", "")))
+            else:
+                items.append((f"q{i+1}", str(subq)))
+        return items
+
+    def _dedupe(self, subquestions: List[Any]) -> Tuple[List[Tuple[str, str]], DedupResult]:
+        """
+        Group near-duplicate subquestions and return the (qid, text) items that actually need
+        searching (one representative per group) together with the grouping.
+        """
+        items = self._subquestion_items(subquestions)
+        if self.dedupe_threshold is None:
+            dedup = DedupResult({qid: [qid] for qid, _ in items})
+        else:
+            priorities = {sq.get("id"): sq.get("priority") for sq in subquestions if isinstance(sq, dict)}
+            dedup = group_near_duplicates(items, self.dedupe_threshold, priorities)
+            for rep, members in dedup.duplicates().items():
+                log_event(logger, logging.INFO, "Near-duplicate subquestions share one search",
+                          representative=rep, members=members)
+        self.last_dedup = dedup
+        texts = dict(items)
+        return [(rep, texts[rep]) for rep in dedup.groups], dedup
+
+    def _fan_out(self, dedup: DedupResult, rep: str, sources: List[Dict[str, Any]],
+                 latency: float) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yield one representative's results for every subquestion in its group."""
+        for qid in dedup.groups[rep]:
+            self.last_latencies[qid] = latency
+            yield qid, list(sources)
+
+    def iter_search(self, subquestions: List[Any], max_workers: Optional[int] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Search all subquestions concurrently and yield (qid, sources) in completion order,
+        so callers can show or process partial evidence while slower queries are in flight.
+        Per-query latencies are recorded in self.last_latencies as results arrive.
+        Near-duplicate subquestions are searched once and all receive the shared results.
+        """
+        workers = max(1, max_workers if max_workers is not None else self.max_workers)
+        items, dedup = self._dedupe(subquestions)
+        self.last_latencies = {}
+        if workers == 1 or len(items) <= 1:
+            for qid, text in items:
+                rep, sources, latency = self._timed_search(qid, text)
+                yield from self._fan_out(dedup, rep, sources, latency)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            # Each task runs in a copy of the caller's context so log records keep the run ID
+            futures = [pool.submit(contextvars.copy_context().run, self._timed_search, qid, text)
+                       for qid, text in items]
+            for future in as_completed(futures):
+                rep, sources, latency = future.result()
+                yield from self._fan_out(dedup, rep, sources, latency)
+
+    def iter_search_streaming(self, subquestions: Iterable[Any],
+                              max_workers: Optional[int] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Like iter_search, but `subquestions` may be a lazy iterable (e.g. the planner's streamed
+        output): each subquestion is dispatched as soon as the iterable produces it, while
+        results are yielded in completion order. A subquestion that nearly duplicates one
+        already dispatched waits for that search instead of issuing its own.
+        """
+        workers = max(1, max_workers if max_workers is not None else self.max_workers)
+        self.last_latencies = {}
+        results: "queue.Queue" = queue.Queue()
+        end_of_input = object()
+        lock = threading.Lock()
+        groups: Dict[str, List[str]] = {}
+        finished: Dict[str, Tuple[List[Dict[str, Any]], float]] = {}
+        dispatched: List[Tuple[str, str]] = []
+        seen = [0]
+        context = contextvars.copy_context()
+
+        def on_done(future) -> None:
+            try:
+                rep, sources, latency = future.result()
+            except Exception as e:
+                results.put(e)
+                return
+            with lock:
+                finished[rep] = (sources, latency)
+                for qid in groups[rep]:
+                    results.put((qid, list(sources), latency))
+
+        def match(text: str) -> Optional[str]:
+            if self.dedupe_threshold is None or not dispatched:
+                return None
+            sims = similarity_matrix([text] + [t for _, t in dispatched])[0, 1:]
+            best = int(sims.argmax())
+            return dispatched[best][0] if sims[best] >= self.dedupe_threshold else None
+
+        def produce(pool: ThreadPoolExecutor) -> None:
+            try:
+                for i, subq in enumerate(subquestions):
+                    qid, text = self._subquestion_items([subq])[0]
+                    if qid in groups or any(qid in members for members in groups.values()):
+                        qid = f"q{i+1}"
+                    rep = match(text)
+                    with lock:
+                        seen[0] += 1
+                        if rep is None:
+                            groups[qid] = [qid]
+                            dispatched.append((qid, text))
+                            future = pool.submit(context.copy().run, self._timed_search, qid, text)
+                            future.add_done_callback(on_done)
+                        else:
+                            log_event(logger, logging.INFO, "Near-duplicate subquestions share one search",
+                                      representative=rep, members=[rep, qid])
+                            groups[rep].append(qid)
+                            if rep in finished:
+                                sources, latency = finished[rep]
+                                results.put((qid, list(sources), latency))
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(end_of_input)
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        producer = threading.Thread(target=context.copy().run, args=(produce, pool), daemon=True)
+        producer.start()
+        try:
+            yielded = 0
+            input_done = False
+            while not input_done or yielded < seen[0]:
+                item = results.get()
+                if item is end_of_input:
+                    input_done = True
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                qid, sources, latency = item
+                self.last_latencies[qid] = latency
+                yielded += 1
+                yield qid, sources
+        finally:
+            producer.join()
+            pool.shutdown(wait=True)
+            self.last_dedup = DedupResult({rep: list(members) for rep, members in groups.items()})
+
+    async def aiter_search(self, subquestions: List[Any], max_workers: Optional[int] = None) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Async variant of iter_search: yields (qid, sources) in completion order.
+        Blocking HTTP calls run in worker threads, at most `max_workers` at a time.
+        """
+        workers = max(1, max_workers if max_workers is not None else self.max_workers)
+        semaphore = asyncio.Semaphore(workers)
+        items, dedup = self._dedupe(subquestions)
+        self.last_latencies = {}
+
+        async def run(qid: str, text: str) -> Tuple[str, List[Dict[str, Any]], float]:
+            async with semaphore:
+                return await asyncio.to_thread(self._timed_search, qid, text)
+
+        tasks = [asyncio.create_task(run(qid, text)) for qid, text in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                rep, sources, latency = await next_done
+                for pair in self._fan_out(dedup, rep, sources, latency):
+                    yield pair
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def search_all(self, subquestions: List[Dict[str, Any]], max_workers: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
         """
         Search for sources for all subquestions.
         Handles both dict and string types in subquestions list.
         Returns a dict where keys are subquestion IDs and values are lists of sources.
-        Enhanced to display detailed source information in terminal.
-        """
-        results = {}
-        print("\n" + "="*80)
-        print("SEARCH AGENT RESULTS - DETAILED SOURCE INFORMATION")
-        print("="*80)
-        
-        for subq in subquestions:
-            qid = subq["id"]
-            text = subq["text"]
-            print(f"\n🔍 Searching for subquestion {qid}: {text}")
-            sources = self.search_subquestion(text)
-            results[qid] = sources
-            
-            print(f"\n📚 Found {len(sources)} sources for {qid}:")
-            print("-" * 60)
-            
-            for i, source in enumerate(sources, 1):
-                print(f"\n📄 Source {i}:")
-                print(f"   Title: {source['title']}")
-                print(f"   URL: {source['url']}")
-                print(f"   Content: {source['content'][:300]}{'...' if len(source['content']) > 300 else ''}")
-                print(f"   Score: {source['score']}")
-                print(f"   {'─' * 50}")
-            
-        print(f"\n✅ Search completed for {len(subquestions)} subquestions")
-        print("="*80)
+        Per-subquestion counts and a run summary are logged at INFO; full source dumps
+        are logged at DEBUG only when ODR_LOG_SOURCES is set.
+
+        Up to `max_workers` searches (defaults to self.max_workers) run concurrently,
+        so total search time is bounded by the slowest query rather than the sum of all.
+        Results are always returned in subquestion order; per-query latencies are
+        stored in self.last_latencies.
+        """
+        workers = max(1, max_workers if max_workers is not None else self.max_workers)
+        items = self._subquestion_items(subquestions)
+
+        log_event(logger, logging.INFO, "Searching subquestions", count=len(items), workers=workers)
+
+        start = time.perf_counter()
+        found = dict(self.iter_search(subquestions, max_workers=workers))
+        elapsed = time.perf_counter() - start
+
+        # Re-order completion-order results into deterministic subquestion order
+        results = {qid: found[qid] for qid, _ in items}
+        if self.fetcher is not None:
+            self.fetcher.enrich(results)
+
+        if logger.isEnabledFor(logging.INFO):
+            for qid in results:
+                self._log_sources(qid, results[qid])
+            self._log_summary(len(items), elapsed, workers)
         return results
 
+    def _log_summary(self, count: int, elapsed: float, workers: int) -> None:
+        """Log timing, dedup, adaptive-depth, cache, backend and connection statistics for a search_all run."""
+        fields: Dict[str, Any] = {
+            "subquestions": count,
+            "duration_ms": round(elapsed * 1000, 1),
+            "serial_ms": round(sum(self.last_latencies[rep] for rep in self.last_dedup.groups) * 1000, 1),
+            "workers": workers,
+            "dedup_saved": self.last_dedup.calls_saved,
+        }
+        if self.adaptive is not None:
+            adaptive = self.adaptive.stats()
+            fields["adaptive_escalated"] = adaptive["escalated"]
+            fields["adaptive_searches"] = adaptive["searches"]
+            fields["adaptive_saved_s"] = adaptive["estimated_latency_saved"]
+        if self.cache is not None:
+            stats = self.cache.stats()
+            fields["cache_hits"] = stats["hits"]
+            fields["cache_misses"] = stats["misses"]
+        fields["backend"] = self.backend.name
+        fields.update({f"backend_{k}": v for k, v in self.backend.stats().items()})
+        for host, conn_stats in self.http.stats().items():
+            fields[f"http {host}"] = f"{conn_stats['requests']} requests/{conn_stats['connections_opened']} connections"
+        log_event(logger, logging.INFO, "Search completed", **fields)
+
+    def close(self) -> None:
+        """Release the content fetcher's extraction pool if this agent created the fetcher."""
+        if self._owns_fetcher:
+            self.fetcher.close()
+
 if __name__ == "__main__":
+    configure_logging(default_level="INFO")
     # First, run the planner agent to get subquestions
     print("Enter your research question:")
     research_question = input("> ").strip()
@@ -0,0 +1,135 @@
+"""
+source_index.py
+
+Cross-subquestion source index.
+Canonicalizes result URLs so the same article returned for several subquestions (with tracking
+parameters, a www. prefix or a trailing slash) is merged into one source with one citation key.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only identify the referrer/campaign and never change the page content.
+# Plain "ref" is not one of them: sites such as GitHub use it to select a branch or tag.
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref_src", "ref_url", "referrer", "spm", "_hsenc", "_hsmi", "mkt_tok", "cmpid",
+}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Return a canonical form of `url` for duplicate detection.
+    Lowercases scheme and host, treats http/https alike, drops "www.", default ports,
+    fragments, tracking parameters and trailing slashes, and sorts the remaining query.
+    A URL that cannot be parsed (bad port, broken IPv6 host) is returned stripped.
+    """
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    if scheme in ("http", "https"):
+        scheme = "https"
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        netloc = f"{host}:{port}"
+
+    path = parts.path or "/"
+    while "//" in path:
+        path = path.replace("//", "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    ]
+    query.sort()
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+class SourceIndex:
+    """
+    Deduplicated view over SearcherAgent.search_all results.
+    Each entry keeps the best-scored copy of a source, every qid that returned it,
+    and a single citation key shared across those subquestions.
+    """
+
+    def __init__(self):
+        self.entries: List[Dict[str, Any]] = []
+        self._by_canonical: Dict[str, Dict[str, Any]] = {}
+        self.total_sources = 0
+
+    @classmethod
+    def build(cls, search_results: Dict[str, List[Dict[str, Any]]]) -> "SourceIndex":
+        index = cls()
+        for qid, sources in search_results.items():
+            for source in sources or []:
+                index.add(qid, source)
+        return index
+
+    @staticmethod
+    def _untitled_key(source: Dict[str, Any]) -> str:
+        """Key for a source without a URL: its title plus a hash of its text, so only identical copies merge."""
+        text = source.get("content") or source.get("raw_content") or ""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        return f"untitled:{source.get('title', '')}:{digest}"
+
+    def add(self, qid: str, source: Dict[str, Any]) -> Dict[str, Any]:
+        """Add one source returned for `qid`, merging it with an existing entry if it is a duplicate."""
+        self.total_sources += 1
+        canonical = canonicalize_url(source.get("url", "")) or self._untitled_key(source)
+        score = source.get("score") or 0.0
+        entry = self._by_canonical.get(canonical)
+        if entry is None:
+            entry = {
+                "citation": f"[S{len(self.entries) + 1}]",
+                "canonical_url": canonical,
+                "url": source.get("url", ""),
+                "title": source.get("title", ""),
+                "content": source.get("content", ""),
+                "score": score,
+                "qids": [qid],
+            }
+            if source.get("raw_content"):
+                entry["raw_content"] = source["raw_content"]
+            self._by_canonical[canonical] = entry
+            self.entries.append(entry)
+            return entry
+
+        if qid not in entry["qids"]:
+            entry["qids"].append(qid)
+        if score > entry["score"]:
+            # Keep the best-scored copy's metadata, but never replace content with something emptier
+            entry["score"] = score
+            entry["url"] = source.get("url", "") or entry["url"]
+            entry["title"] = source.get("title", "") or entry["title"]
+            if len(source.get("content", "")) >= len(entry["content"]):
+                entry["content"] = source.get("content", "")
+        if source.get("raw_content") and len(source["raw_content"]) > len(entry.get("raw_content", "")):
+            entry["raw_content"] = source["raw_content"]
+        return entry
+
+    def for_qid(self, qid: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the entries owned by `qid`, best score first."""
+        owned = sorted((e for e in self.entries if qid in e["qids"]), key=lambda e: e["score"], reverse=True)
+        return owned[:limit] if limit is not None else owned
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        return self._by_canonical.get(canonicalize_url(url))
+
+    @property
+    def duplicates_merged(self) -> int:
+        return self.total_sources - len(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
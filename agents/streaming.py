@@ -0,0 +1,109 @@
+"""
+streaming.py
+
+Helpers for consuming LM Studio's streamed chat completions.
+`iter_sse_content` turns an OpenAI-style server-sent-events response into content deltas, and
+`IncrementalArrayParser` pulls complete objects out of a JSON array while it is still being
+generated, so callers can act on each item before the model has finished the whole array.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+
+def iter_sse_content(response: requests.Response, usage: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    Yield the `delta.content` strings of a streamed /v1/chat/completions response.
+    If the server sends a usage block (final chunk), it is copied into `usage` when given.
+    """
+    for raw_line in response.iter_lines(decode_unicode=False):
+        if not raw_line:
+            continue
+        line = raw_line.decode("utf-8", errors="replace").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        if usage is not None and isinstance(chunk.get("usage"), dict):
+            usage.update(chunk["usage"])
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+class IncrementalArrayParser:
+    """
+    Extracts the top-level elements of a JSON array from text fed in arbitrary chunks.
+    Text before the opening "[" (markdown fences, chatter) is ignored. Only object elements
+    are returned; each one is parsed as soon as its closing brace arrives. Every character
+    is scanned once, so the total cost is linear in the response length.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current: List[str] = []
+        self.skipped = 0  # complete elements that were not valid JSON objects
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume a chunk and return the objects it completed (possibly none)."""
+        completed: List[Dict[str, Any]] = []
+        if self.finished:
+            return completed
+        for ch in text:
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                continue
+
+            if self._depth == 0:
+                # Between elements: only an opening brace or the closing bracket matter
+                if ch == "{":
+                    self._depth = 1
+                    self._current = [ch]
+                elif ch == "]":
+                    self.finished = True
+                    break
+                continue
+
+            self._current.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._parse("".join(self._current))
+                    self._current = []
+                    if item is None:
+                        self.skipped += 1
+                    else:
+                        completed.append(item)
+        return completed
+
+    @staticmethod
+    def _parse(text: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,164 @@
+"""
+structured_logging.py
+
+Structured, level-controlled logging shared by all agents.
+Records carry the run ID, the stage name and arbitrary fields (durations, counts), and can be
+rendered as text or as one JSON object per line. Logging is quiet (WARNING) by default so the
+hot path does no formatting or I/O; verbose per-source dumps need ODR_LOG_SOURCES=1.
+
+Environment:
+    ODR_LOG_LEVEL    DEBUG / INFO / WARNING (default) / ERROR
+    ODR_LOG_FORMAT   text (default) or json
+    ODR_LOG_SOURCES  1 to log every retrieved source at DEBUG level
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, TypeVar
+
+ROOT_LOGGER = "odr"
+
+T = TypeVar("T")
+
+_run_id: contextvars.ContextVar = contextvars.ContextVar("odr_run_id", default=None)
+_configured = False
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps every record with the current run ID and its stage (the logger's last name part)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id.get()
+        record.stage = record.name.rsplit(".", 1)[-1]
+        if not hasattr(record, "fields"):
+            record.fields = {}
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, stage, run_id, msg and any structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "stage": getattr(record, "stage", record.name),
+            "run_id": getattr(record, "run_id", None),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines in the agents' "[stage] message" style, with fields appended."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"[{getattr(record, 'stage', record.name)}] {record.getMessage()}"
+        fields = getattr(record, "fields", {}) or {}
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      default_level: str = "WARNING", stream: Any = None) -> logging.Logger:
+    """
+    Attach a handler to the "odr" logger. Explicit arguments win over the environment;
+    `default_level` applies when neither is set (CLI entry points pass "INFO").
+    """
+    global _configured
+    root = logging.getLogger(ROOT_LOGGER)
+    level_name = (level or os.environ.get("ODR_LOG_LEVEL") or default_level).upper()
+    fmt_name = (fmt or os.environ.get("ODR_LOG_FORMAT") or "text").lower()
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter() if fmt_name == "json" else TextFormatter())
+    handler.addFilter(_ContextFilter())
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level_name, logging.WARNING))
+    root.propagate = False
+    _configured = True
+    return root
+
+
+def get_logger(stage: str) -> logging.Logger:
+    """Return the logger for a pipeline stage (planner, searcher, writer, ...)."""
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{stage}")
+
+
+def log_event(logger: logging.Logger, level: int, msg: str, **fields: Any) -> None:
+    """Log `msg` with structured fields; does nothing (no formatting) if the level is disabled."""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"fields": fields})
+
+
+def sources_enabled(logger: logging.Logger) -> bool:
+    """True when verbose per-source dumps were explicitly requested and DEBUG is on."""
+    return os.environ.get("ODR_LOG_SOURCES", "") not in ("", "0", "false") and logger.isEnabledFor(logging.DEBUG)
+
+
+def current_run_id() -> Optional[str]:
+    return _run_id.get()
+
+
+@contextmanager
+def run_context(run_id: Optional[str] = None) -> Iterator[str]:
+    """Tag every log record emitted inside the block (in this context) with a run ID."""
+    run_id = run_id or uuid.uuid4().hex[:12]
+    token = _run_id.set(run_id)
+    try:
+        yield run_id
+    finally:
+        _run_id.reset(token)
+
+
+def iter_in_run(items: Iterator[T], run_id: Optional[str] = None) -> Iterator[T]:
+    """
+    Drive a generator with `run_id` (default: the current run ID, else a new one) set while
+    it runs, without leaking the ID into the consumer's context between items the way a
+    run_context block inside the generator would.
+    """
+    context = contextvars.copy_context()
+    context.run(_run_id.set, run_id or _run_id.get() or uuid.uuid4().hex[:12])
+    try:
+        while True:
+            try:
+                item = context.run(next, items)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        close = getattr(items, "close", None)
+        if close is not None:
+            context.run(close)
+
+
+@contextmanager
+def timed(logger: logging.Logger, msg: str, level: int = logging.INFO, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Log `msg` with a duration_ms field when the block finishes. The yielded dict can be
+    filled with extra fields from inside the block.
+    """
+    extra: Dict[str, Any] = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        extra["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        log_event(logger, level, msg, **extra)
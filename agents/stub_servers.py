@@ -0,0 +1,416 @@
+"""
+stub_servers.py
+
+Local stand-ins for LM Studio (/v1/chat/completions, including stream=True) and the Tavily
+/search endpoint, so the full Planner -> Searcher -> Writer pipeline can run repeatably on a
+laptop or in CI without a GPU or a Tavily key.
+
+Latency, generation speed (tokens per second) and error rates are configurable, and responses
+are either templated from the request or loaded from canned files.
+
+Usage:
+    python stub_servers.py --lm-port 1234 --search-port 8765 --latency lognormal:0.3:0.5 --tps 40
+    export ODR_LM_STUDIO_URL=http://127.0.0.1:1234
+    export ODR_TAVILY_URL=http://127.0.0.1:8765/search
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class LatencyModel:
+    """
+    Samples a delay in seconds from a simple distribution.
+    Spec strings: "0.2" (fixed), "uniform:LOW:HIGH", "normal:MEAN:STDDEV", "lognormal:MEDIAN:SIGMA".
+    """
+
+    def __init__(self, kind: str = "fixed", a: float = 0.0, b: float = 0.0, rng: Optional[random.Random] = None):
+        self.kind = kind
+        self.a = a
+        self.b = b
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def parse(cls, spec: str, rng: Optional[random.Random] = None) -> "LatencyModel":
+        parts = spec.split(":")
+        if len(parts) == 1:
+            return cls("fixed", float(parts[0]), rng=rng)
+        kind = parts[0]
+        if kind not in ("fixed", "uniform", "normal", "lognormal") or len(parts) != 3:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        return cls(kind, float(parts[1]), float(parts[2]), rng=rng)
+
+    def sample(self) -> float:
+        if self.kind == "uniform":
+            return self.rng.uniform(self.a, self.b)
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(self.a, self.b))
+        if self.kind == "lognormal":
+            return self.a * math.exp(self.rng.gauss(0.0, self.b)) if self.a > 0 else 0.0
+        return self.a
+
+
+class StubConfig:
+    """
+    Behaviour shared by both stub servers.
+    `chat_response` / `search_response` override the templated payloads when given
+    (plain text for chat, a Tavily-shaped JSON object for search). With
+    `structured_output=False` the chat stub rejects response_format with a 400, like
+    servers that do not support schema-constrained decoding. `prefill_tokens_per_second`
+    adds prompt-processing time before the first token; with `prefix_cache_slots`, only the
+    part of the prompt not shared with one of the last N prompts is charged, like llama.cpp's
+    KV prefix cache.
+    """
+
+    def __init__(self, latency: str = "0", tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, seed: Optional[int] = None,
+                 chat_response: Optional[str] = None, search_response: Optional[Dict[str, Any]] = None,
+                 structured_output: bool = True, prefill_tokens_per_second: float = 0.0,
+                 prefix_cache_slots: int = 0):
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel.parse(latency, rng=self.rng)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.chat_response = chat_response
+        self.search_response = search_response
+        self.structured_output = structured_output
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.prefix_cache_slots = prefix_cache_slots
+        self.requests_served = 0
+        self.cached_prompt_tokens = 0
+        self._prompt_cache: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests_served += 1
+            return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            return self.latency.sample()
+
+    def reset_prefix_cache(self) -> None:
+        with self._lock:
+            self._prompt_cache = []
+
+    def prefill_seconds(self, prompt: List[str]) -> float:
+        """Prompt-processing time for `prompt` tokens, minus the longest prefix still cached."""
+        if self.prefill_tokens_per_second <= 0:
+            return 0.0
+        with self._lock:
+            cached = 0
+            for previous in self._prompt_cache:
+                shared = 0
+                for a, b in zip(previous, prompt):
+                    if a != b:
+                        break
+                    shared += 1
+                cached = max(cached, shared)
+            if self.prefix_cache_slots > 0:
+                self._prompt_cache = (self._prompt_cache + [prompt])[-self.prefix_cache_slots:]
+            self.cached_prompt_tokens += cached
+        return (len(prompt) - cached) / self.prefill_tokens_per_second
+
+
+def _split_tokens(text: str) -> List[str]:
+    """Roughly tokenize text the way a streaming server would emit it (word plus trailing space)."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def _chatml_tokens(messages: List[Dict[str, str]]) -> List[str]:
+    """The prompt as a ChatML-templated token list, the way Qwen models see it."""
+    text = "".join(f"<|im_start|>{m.get('role', 'user')}\n{m.get('content', '')}<|im_end|>\n" for m in messages)
+    return _split_tokens(text + "<|im_start|>assistant\n")
+
+
+def _research_question(messages: List[Dict[str, str]]) -> str:
+    """Pull the research question out of planner or writer prompts (the last user turn; earlier ones are examples)."""
+    users = [m.get("content", "") for m in messages if m.get("role") == "user"]
+    for text in reversed(users):
+        match = re.search(r"Research [Qq]uestion:\s*\n?(.+)", text)
+        if match:
+            return match.group(1).strip()
+    text = users[-1] if users else ""
+    return text.strip().splitlines()[-1] if text.strip() else "the research topic"
+
+
+def template_chat_content(messages: List[Dict[str, str]], structured: bool = False) -> str:
+    """
+    Produce a plausible completion: a JSON subquestion array for planner prompts (wrapped as
+    {"subquestions": [...]} when a response_format schema was requested), otherwise a
+    multi-paragraph report citing the citation keys found in the prompt.
+    """
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    topic = _research_question(messages)
+    if "JSON array" in prompt or ("subquestions" in prompt.lower() and "json" in prompt.lower()):
+        kinds = ["background", "definition", "methodology", "analysis", "impact", "comparative", "historical"]
+        questions = [
+            f"What is the background of {topic}?",
+            f"How is {topic} defined in current literature?",
+            f"What methods are used to study {topic}?",
+            f"What are the key findings about {topic}?",
+            f"What are the impacts of {topic}?",
+            f"How does {topic} compare with alternatives?",
+            f"How has {topic} evolved over time?",
+        ]
+        items = [
+            {"id": f"q{i + 1}", "text": q[:140], "priority": i + 1, "type": kinds[i]}
+            for i, q in enumerate(questions)
+        ]
+        return json.dumps({"subquestions": items} if structured else items, indent=2)
+
+    citations = list(dict.fromkeys(re.findall(r"\[[A-Z]+\d+\]", prompt))) or ["[S1]"]
+    paragraphs = []
+    for i in range(8):
+        cite = citations[i % len(citations)]
+        paragraphs.append(
+            f"This paragraph examines {topic} from perspective {i + 1}, drawing on the collected evidence {cite}. "
+            f"The available sources indicate several relevant developments and open questions. "
+            f"Taken together, these findings clarify the current state of {topic} and its implications."
+        )
+    return "\n\n".join(paragraphs)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig = StubConfig()
+
+    def log_message(self, format, *args):  # keep benchmark output quiet
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        body = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(body.decode("utf-8") or "{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self) -> bool:
+        if not self.config.should_fail():
+            return False
+        status = self.config.error_status
+        headers = {"Retry-After": "1"} if status == 429 else None
+        self._send_json(status, {"error": f"stub injected error {status}"}, headers)
+        return True
+
+
+class LMStudioStubHandler(_StubHandler):
+    """Mimics LM Studio's OpenAI-compatible /v1/chat/completions endpoint."""
+
+    def do_POST(self):
+        request = self._read_json()
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        time.sleep(self.config.sample_latency())
+        if self._maybe_fail():
+            return
+
+        messages = request.get("messages", [])
+        structured = bool(request.get("response_format"))
+        if structured and not self.config.structured_output:
+            self._send_json(400, {"error": "'response_format' is not supported by this server"})
+            return
+        content = self.config.chat_response or template_chat_content(messages, structured)
+        tokens = _split_tokens(content)
+        max_tokens = request.get("max_tokens")
+        if isinstance(max_tokens, int) and max_tokens > 0:
+            tokens = tokens[:max_tokens]
+        prompt_tokens = sum(len(_split_tokens(m.get("content", ""))) for m in messages)
+        time.sleep(self.config.prefill_seconds(_chatml_tokens(messages)))
+        delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if request.get("stream"):
+            self._stream(completion_id, request, tokens, delay, prompt_tokens)
+            return
+
+        time.sleep(delay * len(tokens))
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "local-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        })
+
+    def _stream(self, completion_id: str, request: Dict[str, Any], tokens: List[str], delay: float,
+                prompt_tokens: int) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def emit(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "local-model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            emit({"role": "assistant"})
+            for token in tokens:
+                if delay:
+                    time.sleep(delay)
+                emit({"content": token})
+            emit({}, "stop")
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                         "total_tokens": prompt_tokens + len(tokens)}
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": request.get("model", "local-model"), "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class TavilyStubHandler(_StubHandler):
+    """Mimics the Tavily /search endpoint's response shape."""
+
+    def do_POST(self):
+        request = self._read_json()
+        if not self.path.rstrip("/").endswith("/search"):
+            self._send_json(404, {"error": "not found"})
+            return
+        time.sleep(self.config.sample_latency())
+        if self._maybe_fail():
+            return
+        if self.config.search_response is not None:
+            self._send_json(200, self.config.search_response)
+            return
+
+        query = request.get("query", "")
+        max_results = int(request.get("max_results", 5) or 5)
+        # Seed per query so the same query always returns the same results
+        rng = random.Random(hashlib.sha256(query.encode("utf-8")).hexdigest())
+        slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-")[:60] or "result"
+        depth_bonus = 0.1 if request.get("search_depth") == "advanced" else 0.0
+        results = []
+        for i in range(max_results):
+            score = round(min(0.99, rng.uniform(0.35, 0.85) + depth_bonus), 4)
+            result = {
+                "title": f"{query[:80]} - source {i + 1}",
+                "url": f"https://example{i % 3}.org/{slug}/{i + 1}",
+                "content": f"Reference material {i + 1} discussing {query}. " * 3,
+                "score": score,
+            }
+            if request.get("include_raw_content"):
+                result["raw_content"] = f"Full text of reference {i + 1} about {query}. " * 20
+            results.append(result)
+        results.sort(key=lambda r: r["score"], reverse=True)
+        self._send_json(200, {"query": query, "results": results, "response_time": 0.0})
+
+
+def _make_server(handler: type, config: StubConfig, host: str, port: int) -> ThreadingHTTPServer:
+    handler_cls = type(handler.__name__, (handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler_cls)
+    server.daemon_threads = True
+    return server
+
+
+def start_stub_servers(lm_config: Optional[StubConfig] = None, search_config: Optional[StubConfig] = None,
+                       host: str = "127.0.0.1", lm_port: int = 0,
+                       search_port: int = 0) -> Tuple[ThreadingHTTPServer, ThreadingHTTPServer]:
+    """
+    Start both stubs in background threads (port 0 picks a free port) and return the servers.
+    Use server.server_address to build the URLs and server.shutdown() to stop them.
+    """
+    servers = (
+        _make_server(LMStudioStubHandler, lm_config or StubConfig(), host, lm_port),
+        _make_server(TavilyStubHandler, search_config or StubConfig(), host, search_port),
+    )
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return servers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local LM Studio and Tavily stub servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--lm-port", type=int, default=1234)
+    parser.add_argument("--search-port", type=int, default=8765)
+    parser.add_argument("--latency", default="0", help="LM latency before first token, e.g. lognormal:0.3:0.5")
+    parser.add_argument("--search-latency", default="uniform:0.2:0.8", help="Search latency distribution")
+    parser.add_argument("--tps", type=float, default=50.0, help="LM generation speed in tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of LM requests that fail")
+    parser.add_argument("--search-error-rate", type=float, default=0.0, help="Fraction of search requests that fail")
+    parser.add_argument("--search-error-status", type=int, default=429)
+    parser.add_argument("--chat-response-file", help="Canned assistant content to return for every chat request")
+    parser.add_argument("--search-response-file", help="Canned Tavily JSON response to return for every search")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--prefill-tps", type=float, default=0.0,
+                        help="Prompt processing speed in tokens per second (0 = free)")
+    parser.add_argument("--prefix-cache-slots", type=int, default=0,
+                        help="Remember the last N prompts and charge prefill only for the uncached suffix")
+    parser.add_argument("--no-structured-output", action="store_true",
+                        help="Reject response_format with HTTP 400, like servers without schema support")
+    args = parser.parse_args()
+
+    chat_response = None
+    if args.chat_response_file:
+        with open(args.chat_response_file, encoding="utf-8") as f:
+            chat_response = f.read()
+    search_response = None
+    if args.search_response_file:
+        with open(args.search_response_file, encoding="utf-8") as f:
+            search_response = json.load(f)
+
+    lm_config = StubConfig(args.latency, args.tps, args.error_rate, 500, args.seed, chat_response=chat_response,
+                           structured_output=not args.no_structured_output,
+                           prefill_tokens_per_second=args.prefill_tps, prefix_cache_slots=args.prefix_cache_slots)
+    search_config = StubConfig(args.search_latency, 0.0, args.search_error_rate, args.search_error_status,
+                               args.seed, search_response=search_response)
+    lm_server, search_server = start_stub_servers(lm_config, search_config, args.host, args.lm_port, args.search_port)
+    print(f"[stub] LM Studio stub on http://{args.host}:{lm_server.server_address[1]}/v1/chat/completions")
+    print(f"[stub] Tavily stub on http://{args.host}:{search_server.server_address[1]}/search")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\n[stub] Shutting down.")
+        lm_server.shutdown()
+        search_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
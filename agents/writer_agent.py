@@ -1,180 +1,207 @@
+import codecs
+import contextvars
 import requests
 import json
-from typing import List, Dict, Any
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from context_packer import CHARS_PER_TOKEN, ContextPacker, estimate_tokens
+from extractive import rank_many, take
+from prompts import render
+from salvage import PartialResponseDecoder
+from http_transport import HTTPTransport, get_transport, lm_studio_chat_url
 from planner_agent import PlannerAgent
 from searcher_agent import SearcherAgent
+from source_index import SourceIndex
+from streaming import iter_sse_content
+from structured_logging import configure_logging, get_logger, log_event
+
+logger = get_logger("writer")
+
+# Streaming read timeout: the longest gap allowed between two streamed chunks, not a cap on the whole report
+STREAM_IDLE_TIMEOUT = 120
+
+SYNTHESIS_MODES = ("single", "map_reduce")
+# Prompt budgets; tokens are estimated as characters / 4 (context_packer.estimate_tokens)
+CONTEXT_WINDOW_TOKENS = 8192
+REPORT_MAX_TOKENS = 3072
+MAP_MAX_TOKENS = 350
+MAP_MIN_SUMMARY_TOKENS = 64  # smallest summary worth a section in the reduce prompt
+MAP_SOURCE_TOKENS = 600  # per-source cap so several sources share a map prompt
 
 class WriterAgent:
     """
     Writer Agent: Synthesizes retrieved data from searcher into structured, coherent summaries using LM Studio.
     """
 
-    def __init__(self):
-        self.api_url = "http://127.0.0.1:1234/v1/chat/completions"
+    def __init__(self, http: Optional[HTTPTransport] = None, api_url: Optional[str] = None, stream: bool = True,
+                 synthesis_mode: str = "single", map_workers: int = 4,
+                 prompt_budget_tokens: int = 4096, max_source_tokens: int = 300, extractive: bool = True):
+        if synthesis_mode not in SYNTHESIS_MODES:
+            raise ValueError(f"Unknown synthesis mode {synthesis_mode!r}; expected one of {', '.join(SYNTHESIS_MODES)}")
+        self.api_url = api_url or lm_studio_chat_url()
         self.model_name = "local-model"
-
-    def _call_lm_studio(self, messages: List[Dict[str, str]]) -> str:
-        """
-        Call LM Studio to generate synthesis report - LM Studio output only.
-        """
+        self.http = http if http is not None else get_transport()
+        # Stream reports token by token (synthesize_report joins the stream); False uses the blocking call
+        self.stream = stream
+        # "single": one completion over trimmed sources; "map_reduce": per-subquestion summaries, then the report
+        self.synthesis_mode = synthesis_mode
+        self.map_workers = max(1, map_workers)
+        # Single-pass prompt size (system prompt, template and sources); kept within the context window
+        self.prompt_budget_tokens = min(prompt_budget_tokens, CONTEXT_WINDOW_TOKENS - REPORT_MAX_TOKENS)
+        self.max_source_tokens = max_source_tokens
+        # Keep each source's most relevant sentences (BM25 against its subquestions) instead of its first characters
+        self.extractive = extractive
+        self.last_context: Dict[str, Any] = {}
+        self.last_stream: Dict[str, Any] = {}
+
+    def _report_payload(self, messages: List[Dict[str, str]], stream: bool = False,
+                        max_tokens: int = REPORT_MAX_TOKENS) -> Dict[str, Any]:
         payload = {
             "model": self.model_name,
             "messages": messages,
             "temperature": 0.3,
-            "max_tokens": 3072,  # Increased for full-page content
-            "stream": False
+            "max_tokens": max_tokens,  # Increased for full-page content
+            "stream": stream
         }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        return payload
 
-        # LM Studio only - no fallbacks
-        timeout = 600  # Back to 10 minutes with optimized settings
-        print(f"[writer] Generating report with LM Studio (timeout: {timeout}s)...")
-        
-        # Use raw connection for better control
-        response_text = ""
+    def _stream_lm_studio(self, messages: List[Dict[str, str]], max_tokens: int = REPORT_MAX_TOKENS,
+                          stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Stream a completion from LM Studio, yielding content deltas as they arrive.
+        Timing and outcome are left in `stats` (default: self.last_stream): ttft_ms, duration_ms,
+        chunks, chars, completion_tokens, completed and (on failure) error.
+        """
+        if stats is None:
+            stats = self.last_stream = {}
+        stats.update({"ttft_ms": None, "chunks": 0, "chars": 0, "completed": False})
+        usage: Dict[str, Any] = {}
+        start = time.perf_counter()
+        log_event(logger, logging.INFO, "Streaming report from LM Studio", idle_timeout_s=STREAM_IDLE_TIMEOUT,
+                  max_tokens=max_tokens)
         try:
-            response = requests.post(
-                self.api_url, 
-                json=payload, 
-                timeout=timeout,
-                headers={'Connection': 'close'}  # Force connection close
-            )
-            
-            # Get raw response text
-            response_text = response.text
-            print(f"[writer] LM Studio response received! Length: {len(response_text)} chars")
-            
-            # Parse JSON manually
+            response = self.http.post(self.api_url, json=self._report_payload(messages, stream=True, max_tokens=max_tokens),
+                                      timeout=(10, STREAM_IDLE_TIMEOUT), stream=True)
             try:
-                data = json.loads(response_text)
-                if "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0]:
-                    content = data["choices"][0]["message"]["content"]
-                    print(f"[writer] Report generation completed successfully!")
-                    return content
+                if response.status_code != 200:
+                    stats["error"] = f"HTTP {response.status_code}: {response.text[:200]}"
                 else:
-                    print(f"[writer] Invalid response structure: missing 'choices' or 'message' field")
-                    print(f"[writer] Response data: {str(data)[:500]}...")
-                    return f"LM Studio returned invalid response structure. Missing 'choices' or 'message' field."
-            except (KeyError, IndexError, TypeError) as struct_error:
-                print(f"[writer] Response structure error: {struct_error}")
-                print(f"[writer] Response data: {response_text[:500]}...")
-                return f"LM Studio response structure error: {str(struct_error)}"
-            
-        except json.JSONDecodeError as e:
-            print(f"[writer] JSON decode error: {e}")
-            print(f"[writer] Raw response: {response_text[:500]}...")
-            # Try to extract content from partial JSON
-            if response_text and '"content"' in response_text:
-                try:
-                    import re
-                    content_match = re.search(r'"content":\s*"([^"]*(?:\\.[^"]*)*)"', response_text)
-                    if content_match:
-                        content = content_match.group(1).replace('\\"', '"').replace('\\n', '\n')
-                        print(f"[writer] Extracted content from partial JSON")
-                        return content
-                except Exception as extract_error:
-                    print(f"[writer] Content extraction failed: {extract_error}")
-            return f"LM Studio response error: {str(e)}"
+                    for delta in iter_sse_content(response, usage):
+                        if stats["ttft_ms"] is None:
+                            stats["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                            log_event(logger, logging.INFO, "First report token", ttft_ms=stats["ttft_ms"])
+                        stats["chunks"] += 1
+                        stats["chars"] += len(delta)
+                        yield delta
+                    stats["completed"] = True
+            finally:
+                response.close()
+        except requests.exceptions.RequestException as e:
+            stats["error"] = str(e)
+        stats["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        stats["completion_tokens"] = usage.get("completion_tokens") or stats["chars"] // 4
+        if stats["completed"]:
+            log_event(logger, logging.INFO, "Report streamed", ttft_ms=stats["ttft_ms"], chars=stats["chars"],
+                      tokens=stats["completion_tokens"], duration_ms=stats["duration_ms"])
+        else:
+            log_event(logger, logging.WARNING, "Report stream interrupted", error=stats.get("error"),
+                      chars=stats["chars"], duration_ms=stats["duration_ms"])
+
+    @staticmethod
+    def _iter_body(response: requests.Response, chunk_size: int = 8192) -> Iterator[bytes]:
+        """Yield the body as bytes arrive; a fixed-size iter_content read would block on a stalled body."""
+        read1 = getattr(response.raw, "read1", None)  # urllib3 >= 2
+        if read1 is None:
+            yield from response.iter_content(chunk_size=1024)
+            return
+        while True:
+            data = read1(chunk_size, decode_content=True)
+            if not data:
+                return
+            yield data
+
+    def _call_lm_studio(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Call LM Studio to generate synthesis report - LM Studio output only.
+        The body is read in chunks through a PartialResponseDecoder, so a read timeout or a
+        malformed body still yields the report text received so far.
+        """
+        payload = self._report_payload(messages)
+
+        # LM Studio only - no fallbacks
+        timeout = 600  # Back to 10 minutes with optimized settings
+        log_event(logger, logging.INFO, "Generating report with LM Studio", timeout_s=timeout)
+
+        decoder = PartialResponseDecoder()
+        body: List[str] = []
+        start = time.perf_counter()
+        try:
+            # Pooled keep-alive connection shared with the other agents
+            response = self.http.post(self.api_url, json=payload, timeout=timeout, stream=True)
         except requests.exceptions.ReadTimeout as e:
-            print(f"[writer] Read timeout occurred but content may be available: {e}")
-            # Try to extract partial content if available
-            if response_text:
-                print(f"[writer] Attempting to extract content from {len(response_text)} characters of response...")
-                print(f"[writer] Response preview: {response_text[:200]}...")
-                
-                try:
-                    # Try to parse as JSON first
-                    data = json.loads(response_text)
-                    if "choices" in data and len(data["choices"]) > 0:
-                        content = data["choices"][0]["message"]["content"]
-                        print(f"[writer] Successfully extracted content from timeout response! Length: {len(content)} characters")
-                        return content
-                except json.JSONDecodeError as je:
-                    print(f"[writer] JSON parsing failed: {je}")
-                    # If JSON parsing fails, try multiple extraction methods
-                    content_extracted = None
-                    
-                    # Method 1: Try to find content field with regex
-                    try:
-                        import re
-                        # More robust regex that handles escaped quotes and newlines
-                        content_patterns = [
-                            r'"content":\s*"((?:[^"\\]|\\.)*)"',  # Basic pattern
-                            r'"content":\s*"([^"]*(?:\\.[^"]*)*)"',  # Extended pattern
-                            r'"content":\s*"(.+?)"(?=\s*,|\s*})',  # Until next comma or brace
-                        ]
-                        
-                        for pattern in content_patterns:
-                            content_match = re.search(pattern, response_text, re.DOTALL)
-                            if content_match:
-                                content = content_match.group(1)
-                                content = content.replace('\\"', '"').replace('\\n', '\n').replace('\\t', '\t')
-                                if len(content) > 100:  # Only accept if substantial
-                                    content_extracted = content
-                                    print(f"[writer] Extracted content using regex pattern! Length: {len(content)} characters")
-                                    break
-                    except Exception as regex_error:
-                        print(f"[writer] Regex extraction failed: {regex_error}")
-                    
-                    # Method 2: Try to extract from the actual response structure
-                    if not content_extracted:
-                        try:
-                            # Look for the actual content between assistant tags
-                            assistant_match = re.search(r'<\|im_start\|>assistant\n(.*?)<\|im_end\|>', response_text, re.DOTALL)
-                            if assistant_match:
-                                content = assistant_match.group(1).strip()
-                                if len(content) > 100:
-                                    content_extracted = content
-                                    print(f"[writer] Extracted content from assistant tags! Length: {len(content)} characters")
-                        except Exception as tag_error:
-                            print(f"[writer] Tag extraction failed: {tag_error}")
-                    
-                    # Method 3: Last resort - extract everything after the last assistant tag
-                    if not content_extracted:
-                        try:
-                            last_assistant_pos = response_text.rfind('assistant\n')
-                            if last_assistant_pos != -1:
-                                content = response_text[last_assistant_pos + 21:].strip()
-                                # Remove any trailing </|im_end|> tags
-                                content = re.sub(r'<\|im_end\|>.*$', '', content, flags=re.DOTALL)
-                                if len(content) > 100:
-                                    content_extracted = content
-                                    print(f"[writer] Extracted content using fallback method! Length: {len(content)} characters")
-                        except Exception as fallback_error:
-                            print(f"[writer] Fallback extraction failed: {fallback_error}")
-                    
-                    # Method 4: Try to extract any text that looks like a report
-                    if not content_extracted:
-                        try:
-                            # Look for text that starts with a capital letter and contains multiple sentences
-                            text_patterns = [
-                                r'([A-Z][^.!?]*[.!?](?:\s+[A-Z][^.!?]*[.!?]){2,})',  # Multiple sentences
-                                r'([A-Z][^.!?]*[.!?]\s+[A-Z][^.!?]*[.!?])',  # At least 2 sentences
-                            ]
-                            
-                            for pattern in text_patterns:
-                                text_match = re.search(pattern, response_text, re.DOTALL)
-                                if text_match:
-                                    content = text_match.group(1).strip()
-                                    if len(content) > 200:  # Substantial content
-                                        content_extracted = content
-                                        print(f"[writer] Extracted content using text pattern! Length: {len(content)} characters")
-                                        break
-                        except Exception as text_error:
-                            print(f"[writer] Text pattern extraction failed: {text_error}")
-                    
-                    if content_extracted:
-                        print(f"[writer] Successfully extracted LM Studio generated content despite timeout!")
-                        return content_extracted
-                    else:
-                        print(f"[writer] Could not extract substantial content from timeout response")
-                        print(f"[writer] Full response preview: {response_text[:1000]}...")
-                        
-            # If we can't extract content, provide a helpful message
-            return f"LM Studio timeout after {timeout}s, but content was generated. Please try again or check LM Studio logs for the complete response."
+            log_event(logger, logging.WARNING, "LM Studio did not start responding", error=str(e))
+            return f"LM Studio timeout after {timeout}s. Please try again or check LM Studio logs."
         except Exception as e:
-            print(f"[writer] LM Studio connection error: {e}")
+            log_event(logger, logging.WARNING, "LM Studio connection error", error=str(e))
             return f"LM Studio connection error: {str(e)}"
 
+        try:
+            utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            try:
+                for raw in self._iter_body(response):
+                    chunk = utf8.decode(raw)
+                    body.append(chunk)
+                    decoder.feed(chunk)
+            finally:
+                response.close()
+        except (requests.exceptions.RequestException, ReadTimeoutError, ProtocolError) as e:
+            received = sum(len(chunk) for chunk in body)
+            log_event(logger, logging.WARNING, "Response interrupted; salvaging the content received so far",
+                      error=str(e), chars=received, duration_ms=round((time.perf_counter() - start) * 1000, 1))
+            content = decoder.text.strip()
+            if len(content) > 100:  # Only accept if substantial
+                log_event(logger, logging.INFO, "Salvaged report from interrupted response", chars=len(content),
+                          closed=decoder.complete)
+                return content
+            log_event(logger, logging.WARNING, "Could not extract substantial content from interrupted response")
+            log_event(logger, logging.DEBUG, "Response preview", body="".join(body)[:1000])
+            return f"LM Studio timeout after {timeout}s, but content was generated. Please try again or check LM Studio logs for the complete response."
+
+        response_text = "".join(body)
+        log_event(logger, logging.INFO, "LM Studio response received", chars=len(response_text),
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+        # Parse JSON manually
+        try:
+            data = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            log_event(logger, logging.WARNING, "JSON decode error", error=str(e))
+            log_event(logger, logging.DEBUG, "Raw response", body=response_text[:500])
+            content = decoder.text.strip()
+            if content:
+                log_event(logger, logging.INFO, "Extracted content from partial JSON", chars=len(content),
+                          source=decoder.mode, closed=decoder.complete)
+                return content
+            return f"LM Studio response error: {str(e)}"
+        try:
+            if "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0]:
+                content = data["choices"][0]["message"]["content"]
+                log_event(logger, logging.INFO, "Report generation completed successfully!")
+                return content
+            else:
+                log_event(logger, logging.WARNING, "Invalid response structure: missing 'choices' or 'message' field")
+                log_event(logger, logging.DEBUG, "Response data", data=str(data)[:500])
+                return f"LM Studio returned invalid response structure. Missing 'choices' or 'message' field."
+        except (KeyError, IndexError, TypeError) as struct_error:
+            log_event(logger, logging.WARNING, "Response structure error", error=str(struct_error))
+            log_event(logger, logging.DEBUG, "Response data", body=response_text[:500])
+            return f"LM Studio response structure error: {str(struct_error)}"
+
     def _generate_fallback_report(self, messages: List[Dict[str, str]]) -> str:
         """
         Generate a basic structured report as fallback.
@@ -205,7 +232,7 @@ Future research directions in {research_question.lower()} should focus on addres
 Note: This is a fallback report generated due to technical difficulties with the AI service. Please try again for a comprehensive analysis with current research data and citations."""
             return report
         except Exception as e:
-            print(f"[writer] Fallback generation error: {e}")
+            log_event(logger, logging.WARNING, "Fallback generation error", error=str(e))
             return f"Error generating report. Please try again. Technical details: {str(e)}"
 
     def _generate_immediate_fallback(self, research_question: str, subquestions: List[Dict[str, Any]]) -> str:
@@ -227,106 +254,232 @@ Future research directions in {research_question.lower()} should prioritize addr
 Note: This is an immediate fallback report generated due to empty search results. Please try again with different subquestions or search parameters for a comprehensive analysis with current research data and citations."""
             return report
         except Exception as e:
-            print(f"[writer] Immediate fallback generation error: {e}")
+            log_event(logger, logging.WARNING, "Immediate fallback generation error", error=str(e))
             return f"Error generating report. Please try again. Technical details: {str(e)}"
 
+    def _build_report_messages(self, research_question: str, subquestions: List[Dict[str, Any]],
+                               search_results: Dict[str, List[Dict[str, Any]]]
+                               ) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, str]]]:
+        """
+        Build the chat messages for the report and the citation map used for its bibliography.
+        """
+        # Merge duplicate URLs across subquestions so each source appears once with one citation key
+        index = SourceIndex.build(search_results)
+        if index.duplicates_merged:
+            log_event(logger, logging.INFO, "Merged duplicate sources", merged=index.duplicates_merged, unique=len(index))
+
+        # Fill the prompt budget with the best sources, taking turns across subquestions
+        subq_texts = {sq.get("id"): sq.get("text", sq.get("id")) for sq in subquestions if isinstance(sq, dict)}
+        packer = ContextPacker(self.prompt_budget_tokens, max_source_tokens=self.max_source_tokens)
+        sources = self._source_texts(
+            index.entries, lambda entry: " ".join([research_question] + [subq_texts.get(q, q) for q in entry['qids']])
+        )
+        packed = packer.pack(
+            {qid: index.for_qid(qid) for qid in search_results},
+            overhead="".join(m["content"] for m in self._report_messages(research_question, "")),
+            render=lambda entry, content: (
+                f"Topic: {'; '.join(subq_texts.get(owner, owner) for owner in entry['qids'])}\n"
+                f"Source: {entry['title']}\nContent: {content}\nCitation: {entry['citation']}"
+            ),
+            key_of=lambda entry: entry['citation'],
+            **sources,
+        )
+        self.last_context = packed.report()
+        log_event(logger, logging.INFO, "Packed report context", **{k: v for k, v in self.last_context.items()
+                                                                     if k != "per_subquestion"})
+        citations = {item["entry"]["citation"]: {'title': item["entry"]['title'], 'url': item["entry"]['url']}
+                     for item in packed.items}
+        context_str = packed.text()
+
+        return self._report_messages(research_question, context_str), citations
+
+    @staticmethod
+    def _report_messages(research_question: str, context_str: str) -> List[Dict[str, str]]:
+        """The 8-paragraph report prompt around a block of research materials."""
+        return render("report", question=research_question, materials=context_str)
+
+    def _map_reduce_messages(self, research_question: str, subquestions: List[Dict[str, Any]],
+                             search_results: Dict[str, List[Dict[str, Any]]]
+                             ) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, str]]]:
+        """
+        Map-reduce report inputs: each subquestion's evidence is summarized in its own LM Studio
+        call (in parallel), and the report prompt is built from those summaries. Every map prompt
+        has a context window of its own, so the total evidence budget grows with the number of
+        subquestions while no single prompt exceeds CONTEXT_WINDOW_TOKENS.
+        """
+        index = SourceIndex.build(search_results)
+        subq_texts = {sq.get("id"): sq.get("text", sq.get("id")) for sq in subquestions if isinstance(sq, dict)}
+        qids = [qid for qid in search_results if index.for_qid(qid)]
+
+        # The reduce prompt has to hold every section (framing plus summary) and room for the report
+        # itself. If even MAP_MIN_SUMMARY_TOKENS per section would not fit, the subquestions with
+        # the weakest evidence are left out rather than letting the prompt overflow.
+        reduce_room = (CONTEXT_WINDOW_TOKENS - REPORT_MAX_TOKENS
+                       - sum(estimate_tokens(m["content"]) for m in self._report_messages(research_question, "")))
+        framing = {qid: estimate_tokens(self._section(subq_texts.get(qid, qid), "") + "\n\n") for qid in qids}
+        kept, needed = set(), 0
+        for qid in sorted(qids, key=lambda qid: index.for_qid(qid)[0]["score"], reverse=True):
+            if needed + framing[qid] + MAP_MIN_SUMMARY_TOKENS <= reduce_room:
+                kept.add(qid)
+                needed += framing[qid] + MAP_MIN_SUMMARY_TOKENS
+        if len(kept) < len(qids):
+            log_event(logger, logging.WARNING, "Reduce prompt cannot hold every subquestion; dropping the weakest",
+                      kept=len(kept), dropped=len(qids) - len(kept))
+        qids = [qid for qid in qids if qid in kept]
+        summary_tokens = min(MAP_MAX_TOKENS,
+                             (reduce_room - sum(framing[qid] for qid in qids)) // max(1, len(qids)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.map_workers, max(1, len(qids)))) as pool:
+            # Map calls run in copies of the caller's context so their log records keep the run ID
+            context = contextvars.copy_context()
+            mapped = list(pool.map(
+                lambda qid: context.copy().run(self._map_evidence, research_question, subq_texts.get(qid, qid),
+                                               index.for_qid(qid), summary_tokens),
+                qids,
+            ))
+
+        citations: Dict[str, Dict[str, str]] = {}
+        sections = []
+        for qid, (summary, used) in zip(qids, mapped):
+            for entry in used:
+                citations[entry["citation"]] = {"title": entry["title"], "url": entry["url"]}
+            # Summaries are cut to their share, so a model that overshoots cannot overflow the prompt
+            sections.append(self._section(subq_texts.get(qid, qid), summary[:int(summary_tokens * CHARS_PER_TOKEN)]))
+        log_event(logger, logging.INFO, "Mapped evidence", subquestions=len(qids), sources=len(citations),
+                  summary_tokens=summary_tokens, duration_ms=round((time.perf_counter() - start) * 1000, 1))
+        return self._report_messages(research_question, "\n\n".join(sections)), citations
+
+    @staticmethod
+    def _section(subquestion: str, summary: str) -> str:
+        return f"Topic: {subquestion}\nEvidence summary: {summary}"
+
+    def _map_evidence(self, research_question: str, subquestion: str, entries: List[Dict[str, Any]],
+                      max_tokens: int) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Summarize one subquestion's sources (best score first, as many as fit the map prompt).
+        Returns the summary and the entries it drew on. If the call fails, the leading source
+        snippets stand in for the summary so the evidence still reaches the report.
+        """
+        values = {"max_words": int(max_tokens * 0.7), "question": research_question, "subquestion": subquestion}
+        packer = ContextPacker(CONTEXT_WINDOW_TOKENS - max_tokens, max_source_tokens=MAP_SOURCE_TOKENS)
+        packed = packer.pack(
+            {"evidence": entries},
+            overhead="".join(m["content"] for m in render("evidence_summary", sources="", **values)),
+            render=lambda entry, content: f"Source: {entry['title']}\nContent: {content}\nCitation: {entry['citation']}",
+            **self._source_texts(entries, lambda entry: subquestion),
+        )
+        used = [item["entry"] for item in packed.items]
+
+        messages = render("evidence_summary", sources=packed.text(), **values)
+        stats: Dict[str, Any] = {}
+        summary = "".join(self._stream_lm_studio(messages, max_tokens=max_tokens, stats=stats)).strip()
+        if not stats.get("completed") or not summary:
+            log_event(logger, logging.WARNING, "Evidence summary failed; using source snippets",
+                      subquestion=subquestion[:80], error=stats.get("error"))
+            summary = " ".join(f"{entry['content'][:200]} {entry['citation']}" for entry in used[:2])
+        return summary, used
+
+    def _source_texts(self, entries: List[Dict[str, Any]], query_of: Callable[[Dict[str, Any]], str]
+                      ) -> Dict[str, Any]:
+        """
+        text_of/shorten callables for ContextPacker.pack. Fetched page text (raw_content) is
+        preferred over the search snippet. With extractive compression, a source is reduced to
+        its sentences relevant to query_of(entry), ranked by BM25, and shortened a sentence at a
+        time instead of being cut after its first characters.
+        """
+        texts = {entry['citation']: entry.get('raw_content') or entry['content'] for entry in entries}
+        if not self.extractive:
+            return {"text_of": lambda entry: texts[entry['citation']]}
+        start = time.perf_counter()
+        ranked = dict(zip(texts, rank_many(list(texts.values()), [query_of(entry) for entry in entries])))
+        log_event(logger, logging.DEBUG, "Ranked source sentences", sources=len(entries),
+                  duration_ms=round((time.perf_counter() - start) * 1000, 1))
+        return {
+            "text_of": lambda entry: " ".join(ranked[entry['citation']]) or texts[entry['citation']],
+            "shorten": lambda entry, text, max_chars: take(ranked[entry['citation']], max_chars) or text[:max_chars],
+        }
+
+    def _report_inputs(self, research_question: str, subquestions: List[Dict[str, Any]],
+                       search_results: Dict[str, List[Dict[str, Any]]]
+                       ) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, str]]]:
+        if self.synthesis_mode == "map_reduce":
+            return self._map_reduce_messages(research_question, subquestions, search_results)
+        return self._build_report_messages(research_question, subquestions, search_results)
+
+    @staticmethod
+    def _bibliography(report: str, citations: Dict[str, Dict[str, str]]) -> str:
+        """Reference list to append to the report, or "" if the report already has one."""
+        # Check if report already contains references
+        if "References" in report or "Bibliography" in report:
+            return ""
+        bibliography = "\n\nReferences:\n\n"
+        for citation_key, source_info in citations.items():
+            bibliography += f"{citation_key} {source_info['title']}\n"
+            bibliography += f"   Available at: {source_info['url']}\n\n"
+        return bibliography
+
+    def stream_report(self, research_question: str, subquestions: List[Dict[str, Any]],
+                      search_results: Dict[str, List[Dict[str, Any]]]) -> Iterator[str]:
+        """
+        Yield the report as it is generated: the model's text in streamed chunks, then the
+        bibliography. If the stream breaks off, the text received so far is kept and a closing
+        note marks it as partial. Time-to-first-token is logged and kept in self.last_stream.
+        """
+        # Immediate fallback if no search results or LM Studio issues
+        if not search_results or not any(search_results.values()):
+            yield self._generate_immediate_fallback(research_question, subquestions)
+            return
+
+        messages, citations = self._report_inputs(research_question, subquestions, search_results)
+        log_event(logger, logging.INFO, "Generating comprehensive report with citations...")
+        received: List[str] = []
+        for delta in self._stream_lm_studio(messages):
+            received.append(delta)
+            yield delta
+
+        report = "".join(received)
+        if not self.last_stream.get("completed"):
+            error = self.last_stream.get("error") or "stream ended early"
+            if not report.strip():
+                yield f"LM Studio connection error: {error}"
+                return
+            yield (f"\n\nNote: Report generation was interrupted ({error}); "
+                   "the text above is the partial report received before the interruption.")
+        bibliography = self._bibliography(report, citations) if report.strip() else ""
+        if bibliography:
+            yield bibliography
+
     def synthesize_report(self, research_question: str, subquestions: List[Dict[str, Any]], search_results: Dict[str, List[Dict[str, Any]]]) -> str:
         """
         Synthesize a comprehensive, well-written passage-style report from subquestions and search results.
         Creates a cohesive narrative instead of question-answer format.
         Enhanced with citations and substantial paragraph generation.
         """
+        if self.stream:
+            return "".join(self.stream_report(research_question, subquestions, search_results))
+
         # Immediate fallback if no search results or LM Studio issues
         if not search_results or not any(search_results.values()):
             return self._generate_immediate_fallback(research_question, subquestions)
-        
-        # Build enhanced context with limited sources to avoid context overflow
-        context = []
-        citations = {}
-        
-        for qid, sources in search_results.items():
-            subq_text = next((sq["text"] for sq in subquestions if sq.get("id") == qid), qid)
-            if sources:
-                # Take only top 2 sources per subquestion to reduce context size
-                for i, source in enumerate(sources[:2], 1):
-                    # Create citation key
-                    citation_key = f"[{qid.upper()}{i}]"
-                    citations[citation_key] = {
-                        'title': source['title'],
-                        'url': source['url']
-                    }
-                    
-                    # Limit content to 200 characters to further reduce context
-                    content = source['content'][:200] + "..." if len(source['content']) > 200 else source['content']
-                    
-                    context.append({
-                        'topic': subq_text,
-                        'title': source['title'],
-                        'content': content,
-                        'citation': citation_key
-                    })
-        
-        # Create comprehensive context string with citations
-        context_str = "\n\n".join([
-            f"Topic: {item['topic']}\nSource: {item['title']}\nContent: {item['content']}\nCitation: {item['citation']}"
-            for item in context
-        ])
-
-        # Enhanced system prompt for detailed, professional paragraphs with citations
-        system_prompt = (
-            "You are an expert research writer. Write a comprehensive 8-paragraph academic report. "
-            "Each paragraph: 5-7 sentences, 120-180 words for balanced content. "
-            "Structure: 1) Introduction, 2) Background, 3) Literature Review, 4) Methodology/Approach, "
-            "5) Analysis with citations, 6) Implications, 7) Challenges/Limitations, 8) Conclusion. "
-            "Use formal academic tone, complex sentences, and in-text citations [CITATION]. "
-            "No headings or Q&A format - create flowing narrative. Provide detailed analysis and examples."
-        )
-
-        user_prompt = f"""
-Research Question: {research_question}
-
-Research Materials with Citations:
-{context_str}
-
-Write a comprehensive 8-paragraph academic report:
-1. Introduction (topic significance, context, importance)
-2. Background (current state, historical development, key concepts)
-3. Literature Review (existing research, scholarly perspectives)
-4. Methodology/Approach (analytical framework, research methods)
-5. Analysis (findings with citations, evidence, detailed examination)
-6. Implications (practical impact, applications, consequences)
-7. Challenges/Limitations (constraints, future research needs)
-8. Conclusion (summary, recommendations, future directions)
 
-Each paragraph: 5-7 sentences, 120-180 words, include citations [CITATION], no instructions in response."""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-
-        print("[writer] Generating comprehensive report with citations...")
+        messages, citations = self._report_inputs(research_question, subquestions, search_results)
+        log_event(logger, logging.INFO, "Generating comprehensive report with citations...")
         report = self._call_lm_studio(messages)
         
         # Ensure report is a string before processing
         if not isinstance(report, str):
-            print(f"[writer] Warning: Report is not a string, got {type(report)}: {report}")
+            log_event(logger, logging.WARNING, "Report is not a string", type=type(report).__name__, report=str(report)[:200])
             report = str(report) if report else "Error: No content generated"
         
         # Add bibliography at the end if not already included
-        if report and isinstance(report, str):
-            # Check if report already contains references
-            has_references = "References" in report or "Bibliography" in report
-            if not has_references:
-                bibliography = "\n\nReferences:\n\n"
-                for citation_key, source_info in citations.items():
-                    bibliography += f"{citation_key} {source_info['title']}\n"
-                    bibliography += f"   Available at: {source_info['url']}\n\n"
-                report += bibliography
+        if report:
+            report += self._bibliography(report, citations)
         
         return report
 
 if __name__ == "__main__":
+    configure_logging(default_level="INFO")
     print("Enter your research question:")
     research_question = input("> ").strip()
     if not research_question:
@@ -366,13 +519,17 @@ if __name__ == "__main__":
     # Run Writer Agent
     print("[system] Running writer agent...")
     writer = WriterAgent()
-    report = writer.synthesize_report(research_question, subquestions, search_results)
 
     print("\n" + "="*80)
     print("SYNTHESIS REPORT")
     print("="*80)
-    print(report)
-    print("="*80)
+    # Print the report as it streams in
+    chunks = []
+    for chunk in writer.stream_report(research_question, subquestions, search_results):
+        chunks.append(chunk)
+        print(chunk, end="", flush=True)
+    report = "".join(chunks)
+    print("\n" + "="*80)
 
     # Save report to file
     import uuid
@@ -1,10 +1,15 @@
 import io
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import streamlit as st
+from plan_executor import PlanExecutor
 from planner_agent import PlannerAgent
 from searcher_agent import SearcherAgent
+from structured_logging import run_context
 from writer_agent import WriterAgent
+
+# Minimum TF-IDF similarity for "Reuse similar plans"; lower values risk reusing an unrelated plan
+REUSE_THRESHOLD = 0.6
 def _render_css() -> None:
     st.markdown(
 """<style>
@@ -642,6 +647,11 @@ def _init_session() -> None:
         st.session_state.report = None
     if "last_topic" not in st.session_state:
         st.session_state.last_topic = ""
+    if "search_results" not in st.session_state:
+        st.session_state.search_results = None
+    if "planner" not in st.session_state:
+        # One planner per session so its in-memory plan cache survives reruns
+        st.session_state.planner = PlannerAgent()
 def _render_header() -> None:
     st.markdown(
         """<div class="odr-hero">
@@ -773,6 +783,65 @@ def _render_subquestions(subquestions: List[Dict[str, Any]]) -> None:
 </style>""",
         unsafe_allow_html=True,
     )
+def _execute_plan(planner_result: Dict[str, Any],
+                  search_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                  synthesis_mode: str = "single") -> Dict[str, Any]:
+    """
+    Run the planner's plan as a dependency graph (searches in parallel, then synthesis and
+    validation) and show each subquestion's evidence as soon as its search step completes.
+    The report is rendered live while the writer streams it.
+    Search results gathered while planning are reused instead of searched again.
+    """
+    writer = WriterAgent(synthesis_mode=synthesis_mode)
+    executor = PlanExecutor(SearcherAgent(), writer)
+    subquestions = planner_result.get("subquestions", [])
+    texts = {sq.get("id"): sq.get("text", "") for sq in subquestions if isinstance(sq, dict)}
+    total = max(1, len(planner_result.get("plan", [])))
+    progress = st.progress(0.0, text="🌿 Researching sources...")
+    evidence = st.container()
+    live_report = st.empty()
+    report_text = ""
+    finished = 0
+    for record in executor.iter_run(planner_result, search_results, stream_report=True):
+        if record["status"] == "streaming":
+            if not report_text:
+                ttft_ms = writer.last_stream.get("ttft_ms")
+                if ttft_ms is not None:
+                    progress.progress(finished / total, text=f"🌿 Writing your report... first words after {ttft_ms / 1000:.1f}s")
+            report_text += record["chunk"]
+            live_report.markdown(report_text)
+            continue
+        finished += 1
+        state = executor.last_state
+        if record["action"] == "search":
+            sources = state.outputs.get(record["provides"]) or []
+            with evidence.expander(f"{record['provides']}: {texts.get(record['provides'], '')} ({len(sources)} sources)"):
+                for source in sources:
+                    st.markdown(f"- [{source['title'] or source['url']}]({source['url']})")
+        searches_left = any(key not in state.outputs and key not in state.failed for key in texts)
+        label = "🌿 Researching sources..." if searches_left else "🌿 Crafting insights from your sources..."
+        progress.progress(finished / total, text=f"{label} {finished}/{total} steps done")
+    progress.empty()
+    return executor.last_state.result()
+def _plan_and_search(planner: PlannerAgent, topic: str, fresh: bool) -> Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]:
+    """
+    Stream the plan and search each subquestion as soon as the model emits it,
+    showing evidence as it arrives. Returns the planner JSON and the ordered search results.
+    """
+    status = st.empty()
+    status.info("🌿 Planning and researching in parallel...")
+    evidence = st.container()
+    found: Dict[str, List[Dict[str, Any]]] = {}
+    for qid, sources in planner.plan_and_search(topic, SearcherAgent(), fresh=fresh):
+        found[qid] = sources
+        status.info(f"🌿 Planning and researching in parallel... {len(found)} subquestions searched")
+        with evidence.expander(f"{qid} ({len(sources)} sources)"):
+            for source in sources:
+                st.markdown(f"- [{source['title'] or source['url']}]({source['url']})")
+    status.empty()
+    result = planner.last_plan
+    order = [qid for qid, _ in SearcherAgent._subquestion_items(result.get("subquestions", []))]
+    return result, {qid: found.get(qid, []) for qid in order}
 def main() -> None:
     st.set_page_config(
         page_title="OpenDeepResearcher",
@@ -804,6 +873,27 @@ def main() -> None:
 </div>""",
             unsafe_allow_html=True,
         )
+        fresh_plan = st.checkbox(
+            "Fresh plan",
+            value=False,
+            help="Ignore cached subquestions for this topic and ask the model for a new plan.",
+        )
+        reuse_similar = st.checkbox(
+            "Reuse similar plans",
+            value=False,
+            help="Reuse the subquestions of a closely related past topic instead of asking the model again.",
+        )
+        search_while_planning = st.checkbox(
+            "Search while planning",
+            value=False,
+            help="Stream the plan and start each subquestion's search as soon as it is generated.",
+        )
+        map_reduce = st.checkbox(
+            "Map-reduce synthesis",
+            value=False,
+            help="Summarize each subquestion's evidence separately (in parallel) before writing the report, "
+                 "so more sources fit into the report.",
+        )
     # --- Main Content Sections with enhanced drama ---
     st.markdown("<div class='odr-section' style='background: linear-gradient(135deg, rgba(255, 255, 255, 0.95) 0%, rgba(255, 248, 240, 0.98) 100%); border: 2px solid var(--border-soft); box-shadow: 0 20px 60px rgba(139, 90, 60, 0.12), inset 0 1px 0 rgba(255, 255, 255, 0.8);'>", unsafe_allow_html=True)
     # Enhanced section header with more drama
@@ -909,6 +999,7 @@ def main() -> None:
         st.session_state.planner_result = None
         st.session_state.subquestions = None
         st.session_state.report = None
+        st.session_state.search_results = None
         st.session_state.last_topic = ""
         st.rerun()
     if plan_clicked:
@@ -917,10 +1008,24 @@ def main() -> None:
         else:
             st.session_state.last_topic = topic
             st.session_state.report = None
-            with st.spinner("Analyzing topic and creating research plan..."):
-                planner = PlannerAgent()
-                st.session_state.planner_result = planner.plan(topic.strip())
-                st.session_state.subquestions = st.session_state.planner_result.get("subquestions", [])
+            st.session_state.search_results = None
+            planner = st.session_state.planner
+            if search_while_planning:
+                st.session_state.planner_result, st.session_state.search_results = _plan_and_search(
+                    planner, topic.strip(), fresh_plan
+                )
+            else:
+                with st.spinner("Analyzing topic and creating research plan..."):
+                    st.session_state.planner_result = planner.plan(
+                        topic.strip(), fresh=fresh_plan, reuse_threshold=REUSE_THRESHOLD if reuse_similar else None
+                    )
+                reused = st.session_state.planner_result["metadata"].get("reused_from")
+                if reused:
+                    st.info(
+                        f"Reused the plan of a similar topic (\"{reused['prompt']}\", similarity {reused['similarity']:.2f}). "
+                        "Tick \"Fresh plan\" to generate a new one."
+                    )
+            st.session_state.subquestions = st.session_state.planner_result.get("subquestions", [])
     if st.session_state.subquestions:
         _render_subquestions(st.session_state.subquestions)
     # --- Generate Report Section ---
@@ -946,17 +1051,23 @@ def main() -> None:
             unsafe_allow_html=True,
         )
         if generate_clicked:
-            with st.spinner("🌿 Researching sources and crafting insights..."):
-                searcher = SearcherAgent()
-                search_results = searcher.search_all(st.session_state.subquestions)
-                writer = WriterAgent()
-                raw_report = writer.synthesize_report(
-                    research_question=topic.strip(),
-                    subquestions=st.session_state.subquestions,
-                    search_results=search_results,
+            # Reuse the evidence gathered while planning, if any
+            run_store = st.session_state.planner.run_store
+            run_id = st.session_state.planner_result.get("question_id")
+            # Log records of this report run carry the plan's question_id
+            with run_context(run_id):
+                execution = _execute_plan(
+                    st.session_state.planner_result, st.session_state.search_results,
+                    synthesis_mode="map_reduce" if map_reduce else "single",
                 )
                 # Clean the report to remove headings and prompt text
-                st.session_state.report = _clean_report(raw_report)
+                st.session_state.report = _clean_report(execution["report"] or "")
+                if run_id:
+                    run_store.record_search(run_id, execution["search_results"])
+                    if st.session_state.report:
+                        run_store.record_report(run_id, st.session_state.report)
+                    else:
+                        run_store.set_status(run_id, "failed")
         if st.session_state.report:
             # Dramatic success indicator
             st.markdown(